@@ -1,291 +1,643 @@
 import os
 import sqlite3
 import json
+from typing import Iterator, NamedTuple
+import atexit
 import threading
-from datetime import datetime
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from datetime import datetime, timedelta
 from dotenv import load_dotenv
-import sqlite_vec
-from sentence_transformers import SentenceTransformer
 import numpy as np
 
 # Load environment variables BEFORE importing llm_service
 load_dotenv()
 
-from flask import Flask, jsonify, request
+from flask import Flask, Response, jsonify, request, stream_with_context
 from flask_cors import CORS
-from llm_service import generate_combination
+from change_watch import ChangeWatcher
+from db import get_pool, all_pool_stats
+from embedder import EmbeddingService
+from embedding_index import EmbeddingMatrix
+from event_archive import EventArchive
+from fewshot import FewShotSelector
+from graph_cache import GraphIndex
+from lineage import LineageIndex
+from migrations import run_migrations, lineage_sql
+from precompute import PrecomputeScheduler
+from semantic_cache import SemanticCache
+from llm_service import generate_combination, consistent_order, LLMOverloaded
+import llm_service
+from logger import get_logger
+import metrics
+from metrics import REGISTRY, time_stage
 from models import Material
+from recipe_cache import RecipeCache
+import responses
+from singleflight import SingleFlight, SingleFlightTimeout
+from warmup import Warmup
+from work_queue import WriteBehindQueue
+
+log = get_logger('app')
+
+CRAFTS = REGISTRY.counter('infinitecats_crafts_total', 'Crafts served, by source', ('source',))
 
 app = Flask(__name__)
-CORS(app, origins=["https://infinitecat.vercel.app", "https://cats.snailbunny.site", "http://localhost:5173"])
+CORS(app, origins=["https://infinitecat.vercel.app", "https://cats.snailbunny.site", "http://localhost:5173"],
+     expose_headers=['ETag'])
+responses.install_json_provider(app)
+app.after_request(responses.compress_response)
 
 # Database setup
 DB_PATH = os.path.join(os.path.dirname(__file__), 'global.db')
-embedding_model = None  # Will be loaded lazily
+# Embedding requests from the log writer and init_db are encoded together in micro-batches
+embedder = EmbeddingService(
+    batch_size=int(os.environ.get('EMBEDDING_BATCH_SIZE', 32)),
+    max_wait=float(os.environ.get('EMBEDDING_MAX_WAIT', 0.01)),
+    processes=int(os.environ.get('EMBEDDING_PROCESSES', 0)),
+)
+atexit.register(embedder.shutdown)
+
+# Pre-normalized embeddings of every material, loaded on first use and extended as materials are added
+embedding_matrix = EmbeddingMatrix()
+_embedding_matrix_lock = threading.Lock()
+
+# Hot recipes (Fire + Water, ...) are served from memory without touching SQLite
+recipe_cache = RecipeCache(
+    maxsize=int(os.environ.get('RECIPE_CACHE_SIZE', 10000)),
+    ttl=float(os.environ.get('RECIPE_CACHE_TTL', 0)),
+)
+
+# Concurrent crafts of the same uncached pair share one LLM call
+generation_flight = SingleFlight(timeout=float(os.environ.get('LLM_COALESCE_TIMEOUT', 60)))
 
 def get_db():
-    """Get database connection with sqlite-vec support"""
-    conn = sqlite3.connect(DB_PATH)
-    conn.row_factory = sqlite3.Row
-    conn.enable_load_extension(True)
-    sqlite_vec.load(conn)
-    conn.enable_load_extension(False)
-    return conn
+    """
+    Check out a pooled database connection with sqlite-vec support.
+    Use as `with get_db() as conn:`; the connection is committed and returned
+    to the pool when the outermost block on this thread exits.
+    """
+    return get_pool(DB_PATH).connection()
 
 def init_db():
     """Initialize database with materials and combinations tables"""
-    conn = get_db()
-    cursor = conn.cursor()
-    
-    # Create materials table
-    cursor.execute('''
-        CREATE TABLE IF NOT EXISTS materials (
-            name TEXT PRIMARY KEY,
-            emoji TEXT NOT NULL,
-            firstDiscoveredAt TIMESTAMP NOT NULL,
-            discoverer TEXT NOT NULL,
-            embedding BLOB
-        )
-    ''')
-    
-    # Create combinations table
-    cursor.execute('''
-        CREATE TABLE IF NOT EXISTS combinations (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            firstWord TEXT NOT NULL,
-            secondWord TEXT NOT NULL,
-            resultName TEXT NOT NULL,
-            resultEmoji TEXT NOT NULL,
-            username TEXT NOT NULL,
-            timestamp TIMESTAMP NOT NULL,
-            perUserRank INTEGER,
-            isDiscovery BOOLEAN NOT NULL,
-            FOREIGN KEY(resultName) REFERENCES materials(name)
-        )
-    ''')
-    
-    # Create a virtual table for vector search (sqlite-vec requirement)
-    try:
-        cursor.execute('CREATE VIRTUAL TABLE IF NOT EXISTS material_embeddings USING vec0(name TEXT PRIMARY KEY, embedding float[384])')
-    except sqlite3.OperationalError:
-        # Table might already exist
-        pass
-    
-    # Insert base elements if they don't exist
-    base_elements = [
-        ('Fire', '🔥'),
-        ('Water', '💧'),
-        ('Earth', '🌍'),
-        ('Air', '💨')
-    ]
-    
-    for name, emoji in base_elements:
-        cursor.execute('SELECT name FROM materials WHERE name = ?', (name,))
-        if not cursor.fetchone():
-            # Generate embedding for base element
-            embedding = generate_embedding(name)
-            from sqlite_vec import serialize_float32
-            embedding_blob = serialize_float32(embedding)
-            
+    with get_db() as conn:
+        cursor = conn.cursor()
+        
+        # Create materials table
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS materials (
+                name TEXT PRIMARY KEY,
+                emoji TEXT NOT NULL,
+                firstDiscoveredAt TIMESTAMP NOT NULL,
+                discoverer TEXT NOT NULL,
+                embedding BLOB
+            )
+        ''')
+        
+        # Create combinations table
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS combinations (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                firstWord TEXT NOT NULL,
+                secondWord TEXT NOT NULL,
+                resultName TEXT NOT NULL,
+                resultEmoji TEXT NOT NULL,
+                username TEXT NOT NULL,
+                timestamp TIMESTAMP NOT NULL,
+                perUserRank INTEGER,
+                isDiscovery BOOLEAN NOT NULL,
+                FOREIGN KEY(resultName) REFERENCES materials(name)
+            )
+        ''')
+        
+        # Everything added since (recipes, indexes, ...) is a versioned migration
+        run_migrations(conn)
+        
+        # Create a virtual table for vector search (sqlite-vec requirement)
+        try:
+            cursor.execute('CREATE VIRTUAL TABLE IF NOT EXISTS material_embeddings USING vec0(name TEXT PRIMARY KEY, embedding float[384])')
+        except sqlite3.OperationalError:
+            # Table might already exist
+            pass
+        
+        # Insert base elements if they don't exist
+        base_elements = [
+            ('Fire', '🔥'),
+            ('Water', '💧'),
+            ('Earth', '🌍'),
+            ('Air', '💨')
+        ]
+        
+        missing = []
+        for name, emoji in base_elements:
+            cursor.execute('SELECT name FROM materials WHERE name = ?', (name,))
+            if not cursor.fetchone():
+                missing.append((name, emoji))
+        
+        # Generate embeddings for missing base elements in one batch
+        embeddings = embedder.embed_many([name for name, _ in missing])
+        from sqlite_vec import serialize_float32
+        for (name, emoji), embedding in zip(missing, embeddings):
             cursor.execute(
                 'INSERT INTO materials (name, emoji, firstDiscoveredAt, discoverer, embedding) VALUES (?, ?, ?, ?, ?)',
-                (name, emoji, datetime.now().isoformat(), 'system', embedding_blob)
+                (name, emoji, datetime.now().isoformat(), 'system', serialize_float32(embedding))
             )
+            index_material_embedding(conn, name, embedding)
+        
+        # The vector index used to be created but never written; fill it on first startup
+        if conn.execute('SELECT 1 FROM material_embeddings LIMIT 1').fetchone() is None:
+            backfill_material_embeddings(conn)
+        
+        conn.commit()
+
+def index_material_embedding(conn, name: str, embedding):
+    """
+    Write a material's embedding into the material_embeddings vec0 index.
+    Vectors are stored unit-normalized so the index's L2 distance ranks by cosine similarity.
+    """
+    from sqlite_vec import serialize_float32
+    vector = np.asarray(embedding, dtype=np.float32)
+    norm = np.linalg.norm(vector)
+    if norm > 0:
+        vector = vector / norm
+    # vec0 has no upsert
+    conn.execute('DELETE FROM material_embeddings WHERE name = ?', (name,))
+    conn.execute('INSERT INTO material_embeddings (name, embedding) VALUES (?, ?)', (name, serialize_float32(vector)))
+
+def backfill_material_embeddings(conn=None, batch_size: int = 1000) -> int:
+    """Add every material with a stored embedding that is missing from the material_embeddings index"""
+    if conn is None:
+        with get_db() as conn:
+            return backfill_material_embeddings(conn, batch_size)
     
-    conn.commit()
-    conn.close()
+    indexed = {row['name'] for row in conn.execute('SELECT name FROM material_embeddings')}
+    total = 0
+    last_rowid = 0
+    while True:
+        rows = conn.execute(
+            'SELECT rowid, name, embedding FROM materials WHERE rowid > ? AND embedding IS NOT NULL ORDER BY rowid LIMIT ?',
+            (last_rowid, batch_size)
+        ).fetchall()
+        if not rows:
+            break
+        for row in rows:
+            if row['name'] not in indexed:
+                index_material_embedding(conn, row['name'], np.frombuffer(row['embedding'], dtype=np.float32))
+                total += 1
+        last_rowid = rows[-1]['rowid']
+    print(f"Indexed {total} material embeddings.")
+    return total
+
+def find_similar_materials(embedding, k: int = 10, exclude: str | None = None) -> list[dict]:
+    """Top-k nearest materials to an embedding, using a sqlite-vec KNN query on material_embeddings"""
+    from sqlite_vec import serialize_float32
+    vector = np.asarray(embedding, dtype=np.float32)
+    norm = np.linalg.norm(vector)
+    if norm > 0:
+        vector = vector / norm
+    # Ask for one extra neighbour in case the query material itself comes back
+    limit = k + 1 if exclude else k
+    with get_db() as conn:
+        rows = conn.execute('''
+            WITH knn AS (
+                SELECT name, distance FROM material_embeddings
+                WHERE embedding MATCH ? AND k = ?
+            )
+            SELECT knn.name, materials.emoji, knn.distance
+            FROM knn JOIN materials ON materials.name = knn.name
+            ORDER BY knn.distance
+        ''', (serialize_float32(vector), limit)).fetchall()
+    
+    # For unit vectors, squared L2 distance = 2 - 2 * cosine similarity
+    results = [
+        {'name': row['name'], 'emoji': row['emoji'], 'similarity': 1 - (row['distance'] ** 2) / 2}
+        for row in rows if row['name'] != exclude
+    ]
+    return results[:k]
 
 def get_embedding_model():
     """Lazy load the embedding model"""
-    global embedding_model
-    if embedding_model is None:
-        embedding_model = SentenceTransformer('sentence-transformers/all-MiniLM-L6-v2')
-    return embedding_model
+    return embedder.get_model()
 
 def generate_embedding(text: str):
-    """Generate embedding for a material name"""
-    model = get_embedding_model()
-    embedding = model.encode(text, convert_to_tensor=False)
-    return embedding
+    """Generate embedding for a material name (batched with concurrent requests)"""
+    return embedder.embed(text)
+
+def reembed_materials(batch_size: int = 512) -> int:
+    """Recompute embeddings for every material, encoding `batch_size` names per model call"""
+    from sqlite_vec import serialize_float32
+    total = 0
+    last_rowid = 0
+    while True:
+        with get_db() as conn:
+            rows = conn.execute(
+                'SELECT rowid, name FROM materials WHERE rowid > ? ORDER BY rowid LIMIT ?',
+                (last_rowid, batch_size)
+            ).fetchall()
+        if not rows:
+            break
+        embeddings = embedder.encode_batch([row['name'] for row in rows])
+        with get_db() as conn:
+            conn.executemany(
+                'UPDATE materials SET embedding = ? WHERE rowid = ?',
+                [(serialize_float32(embedding), row['rowid']) for row, embedding in zip(rows, embeddings)]
+            )
+            for row, embedding in zip(rows, embeddings):
+                index_material_embedding(conn, row['name'], embedding)
+        if embedding_matrix.loaded:
+            embedding_matrix.add_many([row['name'] for row in rows], embeddings)
+        last_rowid = rows[-1]['rowid']
+        total += len(rows)
+        print(f"Re-embedded {total} materials...")
+    return total
 
 def get_emoji_by_word(word: str) -> str:
     """Retrieve emoji for a word from the database"""
-    conn = get_db()
-    cursor = conn.cursor()
-    cursor.execute('SELECT emoji FROM materials WHERE name = ?', (word,))
-    result = cursor.fetchone()
-    conn.close()
+    with get_db() as conn:
+        cursor = conn.cursor()
+        cursor.execute('SELECT emoji FROM materials WHERE name = ?', (word,))
+        result = cursor.fetchone()
     return result['emoji'] if result else None
 
 def get_cached_combination(first_word: str, second_word: str) -> dict:
     """
-    Retrieve a cached combination from the database.
-    Checks both orderings since combination order doesn't matter.
+    Retrieve a cached combination, from memory first and then from the recipes table.
+    Combination order doesn't matter, so the pair is looked up in consistent order.
+    Returns {'result', 'emoji', 'source'}, where source is 'live' or 'precompute'.
     """
-    conn = get_db()
-    cursor = conn.cursor()
-    
-    # Try first ordering
-    cursor.execute(
-        'SELECT resultName, resultEmoji FROM combinations WHERE firstWord = ? AND secondWord = ? LIMIT 1',
-        (first_word, second_word)
-    )
-    result = cursor.fetchone()
-    
-    if result:
-        conn.close()
-        return {'result': result['resultName'], 'emoji': result['resultEmoji']}
-    
-    # Try reverse ordering
-    cursor.execute(
-        'SELECT resultName, resultEmoji FROM combinations WHERE firstWord = ? AND secondWord = ? LIMIT 1',
-        (second_word, first_word)
-    )
-    result = cursor.fetchone()
+    cached = recipe_cache.get(first_word, second_word)
+    if cached:
+        return cached
     
-    conn.close()
+    ordered_first, ordered_second = consistent_order(first_word, second_word)
+    with get_db() as conn:
+        cursor = conn.cursor()
+        cursor.execute(
+            'SELECT resultName, resultEmoji, source FROM recipes WHERE firstWord = ? AND secondWord = ?',
+            (ordered_first, ordered_second)
+        )
+        result = cursor.fetchone()
     
     if result:
-        return {'result': result['resultName'], 'emoji': result['resultEmoji']}
+        cached = {'result': result['resultName'], 'emoji': result['resultEmoji'], 'source': result['source']}
+        recipe_cache.put(first_word, second_word, cached)
+        return cached
     
     return None
 
-def cache_combination(first_word: str, second_word: str, result: str, emoji: str):
-    """Cache a new combination in the database"""
-    conn = get_db()
-    cursor = conn.cursor()
-    cursor.execute(
-        'INSERT INTO word_cache (first_word, second_word, result, emoji) VALUES (?, ?, ?, ?)',
-        (first_word, second_word, result, emoji)
-    )
-    conn.commit()
-    conn.close()
+def _join_pairs(conn, columns: str, pairs: list[tuple[str, str]]) -> list:
+    """
+    `columns` of the recipes (alias r) stored for ordered pairs, in one query.
+    The pairs are joined as a VALUES list so each one is a probe of
+    idx_recipes_pair; a row-value IN (VALUES ...) scans recipes on SQLite before 3.41.
+    """
+    values = ','.join(['(?, ?)'] * len(pairs))
+    return conn.execute(
+        f'WITH p (f, s) AS (VALUES {values}) '
+        f'SELECT {columns} FROM p CROSS JOIN recipes r ON r.firstWord = p.f AND r.secondWord = p.s',
+        [word for pair in pairs for word in pair]
+    ).fetchall()
+
+def _lookup_recipes(conn, pairs: list[tuple[str, str]], chunk_size: int = 400) -> dict[tuple[str, str], dict]:
+    """Stored recipes for ordered pairs, with one query per chunk"""
+    found = {}
+    for i in range(0, len(pairs), chunk_size):
+        rows = _join_pairs(conn, 'r.firstWord, r.secondWord, r.resultName, r.resultEmoji, r.source',
+                           pairs[i:i + chunk_size])
+        for row in rows:
+            found[(row['firstWord'], row['secondWord'])] = {
+                'result': row['resultName'], 'emoji': row['resultEmoji'], 'source': row['source']
+            }
+    return found
+
+def get_cached_combinations(pairs: list[tuple[str, str]]) -> dict[tuple[str, str], dict]:
+    """
+    Batch version of get_cached_combination: {ordered pair: {'result', 'emoji', 'source'}} for every cached pair.
+    Pairs missing from memory are read from the recipes table in bulk.
+    """
+    found = {}
+    missing = []
+    for pair in dict.fromkeys(consistent_order(first, second) for first, second in pairs):
+        cached = recipe_cache.get(*pair)
+        if cached:
+            found[pair] = cached
+        else:
+            missing.append(pair)
+    
+    if missing:
+        with get_db() as conn:
+            stored = _lookup_recipes(conn, missing)
+        for pair, cached in stored.items():
+            recipe_cache.put(*pair, cached)
+        found.update(stored)
+    return found
+
+def cache_combination(first_word: str, second_word: str, result: str, emoji: str, source: str = 'live') -> dict:
+    """
+    Cache a combination in the recipes table (the first result for a pair wins)
+    and mirror the stored recipe into the in-memory cache. A live craft of a
+    precomputed recipe promotes it to 'live', so later hits are plain cache hits.
+    """
+    ordered_first, ordered_second = consistent_order(first_word, second_word)
+    with get_db() as conn:
+        cursor = conn.cursor()
+        cursor.execute(
+            'INSERT OR IGNORE INTO recipes (firstWord, secondWord, resultName, resultEmoji, createdAt, source) VALUES (?, ?, ?, ?, ?, ?)',
+            (ordered_first, ordered_second, result, emoji, datetime.now().isoformat(), source)
+        )
+        if cursor.rowcount:
+            stored = {'result': result, 'emoji': emoji, 'source': source}
+            get_pool(DB_PATH).after_commit(lambda: lineage_index.note_recipe(result))
+        else:
+            # Another request cached this pair first; keep memory in line with the table
+            cursor.execute(
+                'SELECT resultName, resultEmoji, source FROM recipes WHERE firstWord = ? AND secondWord = ?',
+                (ordered_first, ordered_second)
+            )
+            row = cursor.fetchone()
+            stored = {'result': row['resultName'], 'emoji': row['resultEmoji'], 'source': row['source']}
+            if source == 'live' and row['source'] == 'precompute':
+                cursor.execute(
+                    "UPDATE recipes SET source = 'live' WHERE firstWord = ? AND secondWord = ? AND source = 'precompute'",
+                    (ordered_first, ordered_second)
+                )
+                stored['source'] = 'live'
+    recipe_cache.put(first_word, second_word, stored)
+    return stored
 
 def log_combination(first_word: str, second_word: str, result_name: str, result_emoji: str, username: str, per_user_rank: int, is_discovery: bool):
-    """Log a combination event to the database"""
-    conn = get_db()
-    cursor = conn.cursor()
-    cursor.execute(
-        'INSERT INTO combinations (firstWord, secondWord, resultName, resultEmoji, username, timestamp, perUserRank, isDiscovery) VALUES (?, ?, ?, ?, ?, ?, ?, ?)',
-        (first_word, second_word, result_name, result_emoji, username, datetime.now().isoformat(), per_user_rank, is_discovery)
-    )
-    conn.commit()
-    conn.close()
+    """
+    Log a combination event to the database and, in the same transaction, update
+    the user's depth for the result and the /api/stats aggregates
+    """
+    timestamp = datetime.now().isoformat()
+    discoveries = 1 if is_discovery else 0
+    with get_db() as conn:
+        cursor = conn.cursor()
+        # Primary-key reads decide whether this is the user's first craft and first time making the result
+        new_player = cursor.execute('SELECT 1 FROM user_stats WHERE username = ?', (username,)).fetchone() is None
+        new_material = cursor.execute(
+            'SELECT 1 FROM user_depths WHERE username = ? AND material = ?', (username, result_name)
+        ).fetchone() is None
+        cursor.execute(
+            'INSERT INTO combinations (firstWord, secondWord, resultName, resultEmoji, username, timestamp, perUserRank, isDiscovery) VALUES (?, ?, ?, ?, ?, ?, ?, ?)',
+            (first_word, second_word, result_name, result_emoji, username, timestamp, per_user_rank, is_discovery)
+        )
+        cursor.execute(
+            '''INSERT INTO user_depths (username, material, emoji, minRank, firstSeen) VALUES (?, ?, ?, ?, ?)
+               ON CONFLICT (username, material) DO UPDATE SET minRank = MIN(minRank, excluded.minRank)''',
+            (username, result_name, result_emoji, per_user_rank, timestamp)
+        )
+        cursor.execute(
+            '''INSERT INTO user_stats (username, crafts, discoveries, materials, maxRank, firstCraftAt, lastCraftAt)
+               VALUES (?, 1, ?, 1, ?, ?, ?)
+               ON CONFLICT (username) DO UPDATE SET
+                   crafts = crafts + 1,
+                   discoveries = discoveries + excluded.discoveries,
+                   materials = materials + ?,
+                   maxRank = MAX(maxRank, excluded.maxRank),
+                   lastCraftAt = excluded.lastCraftAt''',
+            (username, discoveries, per_user_rank or 0, timestamp, timestamp, int(new_material))
+        )
+        cursor.execute(
+            '''INSERT INTO result_stats (resultName, resultEmoji, crafts, players) VALUES (?, ?, 1, 1)
+               ON CONFLICT (resultName) DO UPDATE SET crafts = crafts + 1, players = players + ?''',
+            (result_name, result_emoji, int(new_material))
+        )
+        cursor.execute(
+            '''INSERT INTO hourly_stats (hour, crafts, discoveries, newPlayers) VALUES (?, 1, ?, ?)
+               ON CONFLICT (hour) DO UPDATE SET
+                   crafts = crafts + 1,
+                   discoveries = discoveries + excluded.discoveries,
+                   newPlayers = newPlayers + excluded.newPlayers''',
+            (timestamp[:13], discoveries, int(new_player))
+        )
+    get_pool(DB_PATH).after_commit(lambda: lineage_index.note_recipe(result_name, username))
 
-def add_material(name: str, emoji: str, discoverer: str):
-    """Add a new material to the database with embedding"""
-    embedding = generate_embedding(name)
+def add_material(name: str, emoji: str, discoverer: str, embedding=None):
+    """Add a new material to the database with embedding (generated here unless passed in)"""
+    if embedding is None:
+        embedding = generate_embedding(name)
     from sqlite_vec import serialize_float32
     embedding_blob = serialize_float32(embedding)
     
-    conn = get_db()
-    cursor = conn.cursor()
-    
-    # Check if material already exists
-    cursor.execute('SELECT name FROM materials WHERE name = ?', (name,))
-    if cursor.fetchone():
-        conn.close()
-        return False  # Already exists
-    
-    # Insert into materials table
-    cursor.execute(
-        'INSERT INTO materials (name, emoji, firstDiscoveredAt, discoverer, embedding) VALUES (?, ?, ?, ?, ?)',
-        (name, emoji, datetime.now().isoformat(), discoverer, embedding_blob)
-    )
-    
-    conn.commit()
-    conn.close()
+    with get_db() as conn:
+        cursor = conn.cursor()
+        
+        # Check if material already exists
+        cursor.execute('SELECT name FROM materials WHERE name = ?', (name,))
+        if cursor.fetchone():
+            return False  # Already exists
+        
+        # Insert into materials table and keep the vector index in sync
+        cursor.execute(
+            'INSERT INTO materials (name, emoji, firstDiscoveredAt, discoverer, embedding) VALUES (?, ?, ?, ?, ?)',
+            (name, emoji, datetime.now().isoformat(), discoverer, embedding_blob)
+        )
+        index_material_embedding(conn, name, embedding)
     return True
 
 def get_per_user_rank(first_word: str, second_word: str, username: str) -> int:
     """Calculate per-user rank based on parent materials for a specific user"""
-    conn = get_db()
-    cursor = conn.cursor()
-    
-    # Get min rank of the two parent words for this user (default to 0 for base elements)
-    cursor.execute('SELECT MIN(perUserRank) as min_rank FROM combinations WHERE resultName = ? AND username = ?', (first_word, username))
-    first_rank_result = cursor.fetchone()
-    first_rank = first_rank_result['min_rank'] if first_rank_result['min_rank'] is not None else 0
-    
-    cursor.execute('SELECT MIN(perUserRank) as min_rank FROM combinations WHERE resultName = ? AND username = ?', (second_word, username))
-    second_rank_result = cursor.fetchone()
-    second_rank = second_rank_result['min_rank'] if second_rank_result['min_rank'] is not None else 0
-    
-    conn.close()
+    with get_db() as conn:
+        cursor = conn.cursor()
+        
+        # Get min rank of the two parent words for this user (default to 0 for base elements)
+        cursor.execute(
+            'SELECT material, minRank FROM user_depths WHERE username = ? AND material IN (?, ?)',
+            (username, first_word, second_word)
+        )
+        ranks = {row['material']: row['minRank'] for row in cursor.fetchall()}
+    first_rank = ranks.get(first_word, 0)
+    second_rank = ranks.get(second_word, 0)
     
     # Per-user rank is max of parents + 1 (i.e. the depth in the user's discovery tree)
     return max(first_rank, second_rank) + 1
 
+def sync_embedding_matrix(batch_size: int = 5000) -> EmbeddingMatrix:
+    """Load materials added since the matrix was last synced (everything on first call)"""
+    with _embedding_matrix_lock:
+        while True:
+            with get_db() as conn:
+                rows = conn.execute(
+                    'SELECT rowid, name, embedding FROM materials WHERE rowid > ? ORDER BY rowid LIMIT ?',
+                    (embedding_matrix.last_rowid, batch_size)
+                ).fetchall()
+            if not rows:
+                break
+            embedding_matrix.load_rows(rows)
+            # Rows without an embedding still advance the cursor
+            embedding_matrix.last_rowid = max(embedding_matrix.last_rowid, rows[-1]['rowid'])
+        embedding_matrix.loaded = True
+    return embedding_matrix
+
+def get_embedding_matrix(names: tuple[str, ...] = ()) -> EmbeddingMatrix:
+    """
+    The in-memory embedding matrix, loaded on first use.
+    If any of `names` is unknown, catch up with materials written elsewhere before answering.
+    """
+    if not embedding_matrix.loaded or any(name not in embedding_matrix for name in names):
+        sync_embedding_matrix()
+    return embedding_matrix
+
 def get_material_distance(material1: str, material2: str) -> dict:
     """
     Calculate cosine similarity distance between two materials' embeddings.
     Returns a dict with similarity score (0-1, where 1 = identical).
+    Served from the in-memory embedding matrix.
     """
-    conn = get_db()
-    cursor = conn.cursor()
+    similarity = get_embedding_matrix((material1, material2)).similarity(material1, material2)
     
-    # Retrieve embeddings for both materials
-    cursor.execute('SELECT embedding FROM materials WHERE name = ?', (material1,))
-    result1 = cursor.fetchone()
-    
-    cursor.execute('SELECT embedding FROM materials WHERE name = ?', (material2,))
-    result2 = cursor.fetchone()
-    
-    conn.close()
-    
-    if not result1 or not result2:
+    if similarity is None:
         return {'error': 'One or both materials not found', 'similarity': None}
     
-    # Deserialize embeddings from BLOB (float32 array)
-    embedding1 = np.frombuffer(result1['embedding'], dtype=np.float32)
-    embedding2 = np.frombuffer(result2['embedding'], dtype=np.float32)
-    
-    # Calculate cosine similarity manually: (a · b) / (||a|| * ||b||)
-    dot_product = np.dot(embedding1, embedding2)
-    norm1 = np.linalg.norm(embedding1)
-    norm2 = np.linalg.norm(embedding2)
-    similarity = float(dot_product / (norm1 * norm2))
-    
     return {'material1': material1, 'material2': material2, 'similarity': similarity}
 
-def _background_add_material_and_log(first_word: str, second_word: str, result_name: str, result_emoji: str, username: str, is_discovery: bool):
-    """Background task: generate embedding, add material, and log combination"""
-    try:
-        # Add material with embedding (slow)
+def get_pairwise_distances(pairs: list[tuple[str, str]]) -> list[dict]:
+    """Cosine similarity for many material pairs in one vectorized pass (None for unknown materials)"""
+    names = tuple({name for pair in pairs for name in pair})
+    similarities = get_embedding_matrix(names).pairwise(pairs)
+    return [
+        {'material1': first, 'material2': second, 'similarity': similarity}
+        for (first, second), similarity in zip(pairs, similarities)
+    ]
+
+def get_one_to_many_distances(material: str, others: list[str]) -> list[dict]:
+    """Cosine similarity of one material against many with a single matrix product"""
+    similarities = get_embedding_matrix((material, *others)).one_to_many(material, others)
+    return [{'material': other, 'similarity': similarity} for other, similarity in zip(others, similarities)]
+
+# Few-shot examples for the LLM prompt: the past recipes nearest in embedding space to the requested pair
+fewshot_selector = FewShotSelector(
+    get_db, get_embedding_matrix, embedder.embed_many, find_similar_materials,
+    k=int(os.environ.get('FEWSHOT_K', 4)),
+    neighbours=int(os.environ.get('FEWSHOT_NEIGHBOURS', 16)),
+    cache_size=int(os.environ.get('FEWSHOT_CACHE_SIZE', 2048)),
+    cache_ttl=float(os.environ.get('FEWSHOT_CACHE_TTL', 600)),
+)
+llm_service.set_example_selector(fewshot_selector.select)
+
+# Exact-cache misses can reuse (or hint the LLM with) a known recipe whose inputs are near-synonyms
+semantic_cache = SemanticCache(
+    get_db, get_embedding_matrix, embedder.embed_many,
+    mode=os.environ.get('SEMANTIC_CACHE_MODE', 'off'),
+    threshold=float(os.environ.get('SEMANTIC_CACHE_THRESHOLD', 0.92)),
+    neighbours=int(os.environ.get('SEMANTIC_CACHE_NEIGHBOURS', 8)),
+)
+
+class LogEvent(NamedTuple):
+    """A crafted combination waiting to be written by the background log queue"""
+    first_word: str
+    second_word: str
+    result_name: str
+    result_emoji: str
+    username: str
+    is_discovery: bool
+
+def _background_add_material_and_log(first_word: str, second_word: str, result_name: str, result_emoji: str, username: str, is_discovery: bool, embedding=None):
+    """Background task: add material (with embedding), log combination and cache the recipe"""
+    # Rank lookup, inserts and recipe cache share one pooled connection and one commit
+    with get_db():
         if is_discovery:
-            add_material(result_name, result_emoji, username)
-        
-        # Log the combination (fast, but do in background too to keep response time minimal)
+            add_material(result_name, result_emoji, username, embedding=embedding)
         per_user_rank = get_per_user_rank(first_word, second_word, username)
         log_combination(first_word, second_word, result_name, result_emoji, username, per_user_rank, is_discovery)
-    except Exception as e:
-        print(f"Error in background task: {e}")
+        cache_combination(first_word, second_word, result_name, result_emoji)
 
-def craft_new_word(first_word: str, second_word: str, username: str = None) -> dict:
-    """
-    Craft a new word by combining two words.
-    Checks cache first, then generates using LLM if not cached.
-    Returns result immediately with isDiscovery flag.
+def _write_log_batch(events: list[LogEvent]):
+    """Write a batch of queued combination events in a single transaction"""
+    # Encode new materials in one batch before taking the write lock (slow)
+    names = list(dict.fromkeys(event.result_name for event in events if event.is_discovery))
+    embeddings = dict(zip(names, embedder.embed_many(names)))
     
-    If username is provided, spawns background task to log to database.
-    If username is None, just returns LLM result without any database logging.
-    isDiscovery = true only if this material has never been discovered by anyone.
+    with time_stage('db_write'), get_db():
+        for event in events:
+            _background_add_material_and_log(*event, embedding=embeddings.get(event.result_name))
+    graph_index.mark_dirty()
+    
+    # Committed: extend the in-memory matrix (if it has been loaded) without rereading the table
+    if embedding_matrix.loaded and names:
+        with _embedding_matrix_lock:
+            for name, embedding in embeddings.items():
+                if name not in embedding_matrix:
+                    embedding_matrix.add(name, embedding)
+
+# Combination logging is written behind the response by a bounded pool of workers,
+# batched into one transaction per flush and drained on shutdown
+log_queue = WriteBehindQueue(
+    _write_log_batch,
+    maxsize=int(os.environ.get('LOG_QUEUE_SIZE', 1000)),
+    workers=int(os.environ.get('LOG_QUEUE_WORKERS', 2)),
+    batch_size=int(os.environ.get('LOG_BATCH_SIZE', 50)),
+    flush_interval=float(os.environ.get('LOG_FLUSH_INTERVAL', 0.05)),
+    put_timeout=float(os.environ.get('LOG_QUEUE_PUT_TIMEOUT', 0.1)),
+    name='combination-log',
+)
+atexit.register(log_queue.shutdown)
+
+# Components keep their own counters; /metrics reads them at scrape time
+metrics.register_stats('infinitecats_db_pool', all_pool_stats, counters=('checkouts', 'hits', 'misses', 'waits', 'wait_seconds_total', 'reentrant'), label='database')
+metrics.register_stats('infinitecats_recipe_cache', recipe_cache.stats, counters=('hits', 'misses', 'evictions', 'expirations'))
+metrics.register_stats('infinitecats_generation_flight', generation_flight.stats, counters=('leaders', 'coalesced', 'timeouts', 'errors'))
+metrics.register_stats('infinitecats_llm_engine', llm_service.engine.stats, counters=('calls', 'timeouts', 'errors', 'rejected', 'hedges_fired', 'hedges_won'))
+metrics.register_stats('infinitecats_log_queue', log_queue.stats, counters=('enqueued', 'processed', 'dropped', 'failed', 'batches'))
+metrics.register_stats('infinitecats_embedder', embedder.stats, counters=('batches', 'items', 'encode_seconds_total'))
+metrics.register_stats('infinitecats_fewshot', fewshot_selector.stats, counters=('selections', 'empty', 'cache_hits'))
+metrics.register_stats('infinitecats_semantic_cache', semantic_cache.stats,
+                       counters=('lookups', 'matches', 'reused', 'llm_calls_saved', 'hinted', 'hints_followed', 'indexed', 'errors'))
+metrics.register_stats('infinitecats_process', lambda: {'active_threads': threading.active_count()})
+
+def _resolve_miss(first_word: str, second_word: str) -> dict | None:
+    """Answer an exact-cache miss from a near-duplicate recipe if the semantic cache allows it, else with the LLM"""
+    match = None
+    if semantic_cache.enabled:
+        with time_stage('semantic_lookup'):
+            match = semantic_cache.lookup(first_word, second_word)
+    if match is None:
+        return generate_combination(first_word, second_word)
+
+    if semantic_cache.mode == 'reuse':
+        semantic_cache.record_reuse()
+        cache_combination(first_word, second_word, match['result'], match['emoji'], source='semantic')
+        return {'result': match['result'], 'emoji': match['emoji'], 'source': 'semantic'}
+    combination = generate_combination(
+        first_word, second_word, hint=(match['first'], match['second'], match['result'], match['emoji'])
+    )
+    semantic_cache.record_hint(match['result'], combination['result'] if combination else None)
+    return combination
+
+def _generate_new_combination(first_word: str, second_word: str) -> dict | None:
+    """Resolve a miss (semantic cache, then the LLM), joining any in-flight resolution for the same pair"""
+    try:
+        with time_stage('generation'):
+            combination = generation_flight.do(
+                consistent_order(first_word, second_word), _resolve_miss, first_word, second_word
+            )
+    except SingleFlightTimeout as e:
+        log.error("Error generating combination: %s", e)
+        combination = None
+    if combination and combination['result']:
+        CRAFTS.inc('semantic' if combination.get('source') == 'semantic' else 'llm')
+    else:
+        CRAFTS.inc('failed')
+    return combination
+
+def _finish_craft(first_word: str, second_word: str, username: str | None, cached: dict | None,
+                  combination: dict | None) -> dict:
     """
-    # Check cache
-    cached = get_cached_combination(first_word, second_word)
+    Build the craft response for a cache hit (`cached`) or a fresh generation
+    (`combination`) and queue its log event.
+    isDiscovery = true only if the generated material has never been discovered by anyone.
+    Precomputed recipes have not been crafted by a player yet, so they are
+    checked for discovery like a fresh generation.
+    """
+    if cached and cached.get('source') == 'precompute':
+        combination, cached = cached, None
     if cached:
-        # Spawn background task to log only if username is provided
+        # Queue background logging only if username is provided
         if username:
-            thread = threading.Thread(
-                target=_background_add_material_and_log,
-                args=(first_word, second_word, cached['result'], cached['emoji'], username, False),
-                daemon=True
-            )
-            thread.start()
-        return {**cached, 'isDiscovery': False}
-    
-    # Generate new combination
-    combination = generate_combination(first_word, second_word)
+            log_queue.submit(LogEvent(first_word, second_word, cached['result'], cached['emoji'], username, False))
+        return {'result': cached['result'], 'emoji': cached['emoji'], 'isDiscovery': False}
 
     if combination and combination['result']:
         result_name = combination['result']
@@ -294,20 +646,14 @@ def craft_new_word(first_word: str, second_word: str, username: str = None) -> d
         # Only check discovery status if username is provided
         is_discovery = False
         if username:
-            conn = get_db()
-            cursor = conn.cursor()
-            cursor.execute('SELECT name FROM materials WHERE name = ?', (result_name,))
-            is_discovery = cursor.fetchone() is None
-            conn.close()
+            with get_db() as conn:
+                cursor = conn.cursor()
+                cursor.execute('SELECT name FROM materials WHERE name = ?', (result_name,))
+                is_discovery = cursor.fetchone() is None
         
-        # Spawn background task for embedding generation and logging only if username is provided
+        # Queue embedding generation and logging only if username is provided
         if username:
-            thread = threading.Thread(
-                target=_background_add_material_and_log,
-                args=(first_word, second_word, result_name, result_emoji, username, is_discovery),
-                daemon=True
-            )
-            thread.start()
+            log_queue.submit(LogEvent(first_word, second_word, result_name, result_emoji, username, is_discovery))
         
         # Return result immediately with isDiscovery flag
         return {'result': result_name, 'emoji': result_emoji, 'isDiscovery': is_discovery}
@@ -315,88 +661,359 @@ def craft_new_word(first_word: str, second_word: str, username: str = None) -> d
     # Return empty result if generation failed
     return {'result': '', 'emoji': '', 'isDiscovery': False}
 
-def get_nodes_and_edges(username: str | None = None):
-    """Retrieve graph nodes/edges filtered by username when provided."""
-    scope = f"user={username}" if username else "all users"
-    print(f"Fetching graph data from database for {scope}...")
+def craft_new_word(first_word: str, second_word: str, username: str = None) -> dict:
+    """
+    Craft a new word by combining two words.
+    Checks cache first, then generates using LLM if not cached.
+    Returns result immediately with isDiscovery flag.
+    
+    If username is provided, queues the event for the background log writer.
+    If username is None, just returns LLM result without any database logging.
+    isDiscovery = true only if this material has never been discovered by anyone.
+    """
+    # Check cache
+    with time_stage('cache_lookup'):
+        cached = get_cached_combination(first_word, second_word)
+    if cached:
+        CRAFTS.inc('precompute' if cached.get('source') == 'precompute' else 'cache')
+        return _finish_craft(first_word, second_word, username, cached, None)
+    
+    combination = _generate_new_combination(first_word, second_word)
+    return _finish_craft(first_word, second_word, username, None, combination)
 
-    # Pull combinations scoped to a specific user when username is provided
-    conn = get_db()
-    cursor = conn.cursor()
-    if username:
-        cursor.execute(
-            'SELECT firstWord, secondWord, resultName, resultEmoji FROM combinations WHERE username = ?',
-            (username,)
-        )
-    else:
-        cursor.execute('SELECT firstWord, secondWord, resultName, resultEmoji FROM combinations')
-    rows = cursor.fetchall()
-    conn.close()
+# Misses in a batch craft are generated concurrently by these threads; upstream
+# calls still go through the engine's shared concurrency and backlog limits
+batch_executor = ThreadPoolExecutor(
+    max_workers=int(os.environ.get('BATCH_CRAFT_WORKERS', 16)), thread_name_prefix='batch-craft'
+)
 
-    nodes: dict[str, dict] = {}
-    edges = []
+def craft_many(pairs: list[tuple[str, str]], username: str = None) -> Iterator[tuple[int, dict]]:
+    """
+    Craft many pairs, yielding (index, result) as each one is ready.
+    Cache hits are resolved up front with one lookup and yielded first; misses
+    are generated concurrently and yielded in completion order. Each result is
+    the same as craft_new_word() would return for that pair, or carries an
+    `error` if the generation engine is overloaded.
+    """
+    with time_stage('cache_lookup'):
+        cached = get_cached_combinations(pairs)
 
-    # Always include base materials
-    base_materials = ['Fire', 'Water', 'Earth', 'Air']
-    needed_names = set(base_materials)
+    misses = {}
+    for index, (first_word, second_word) in enumerate(pairs):
+        hit = cached.get(consistent_order(first_word, second_word))
+        if hit:
+            CRAFTS.inc('precompute' if hit.get('source') == 'precompute' else 'cache')
+            yield index, _finish_craft(first_word, second_word, username, hit, None)
+        else:
+            misses[batch_executor.submit(_generate_new_combination, first_word, second_word)] = index
 
-    for row in rows:
-        needed_names.update([row['firstWord'], row['secondWord'], row['resultName']])
+    for future in as_completed(misses):
+        index = misses[future]
+        first_word, second_word = pairs[index]
+        try:
+            combination = future.result()
+        except LLMOverloaded:
+            yield index, {'result': '', 'emoji': '', 'isDiscovery': False, 'error': 'overloaded'}
+            continue
+        yield index, _finish_craft(first_word, second_word, username, None, combination)
 
-    # Fetch emojis for needed materials in a single query
-    materials = []
-    if needed_names:
-        placeholders = ','.join(['?'] * len(needed_names))
-        conn = get_db()
-        cursor = conn.cursor()
-        cursor.execute(f'SELECT name, emoji FROM materials WHERE name IN ({placeholders})', tuple(needed_names))
-        materials = cursor.fetchall()
-        conn.close()
+def _load_precompute_materials(recent: int, popular: int) -> tuple[list[str], list[tuple[str, int]]]:
+    """The most recently discovered materials, and the materials made by the most players with their counts"""
+    with get_db() as conn:
+        recent_names = [row['name'] for row in conn.execute('SELECT name FROM materials ORDER BY rowid DESC LIMIT ?', (recent,))]
+        popular_rows = conn.execute(
+            'SELECT resultName, players FROM result_stats ORDER BY players DESC, resultName LIMIT ?',
+            (popular,)
+        ).fetchall()
+    return recent_names, [(row['resultName'], row['players']) for row in popular_rows]
 
-    for material in materials:
-        nodes[material['name']] = {
-            'id': material['name'],
-            'label': material['name'],
-            'emoji': material['emoji']
-        }
+def _uncached_pairs(pairs: list[tuple[str, str]], chunk_size: int = 400) -> list[tuple[str, str]]:
+    """
+    The pairs with no stored recipe, in their original order. Runs whenever the
+    engine is idle, so it only probes idx_recipes_pair (covering, no table reads).
+    """
+    ordered = [consistent_order(first, second) for first, second in pairs]
+    unique = list(dict.fromkeys(ordered))
+    stored = set()
+    with get_db() as conn:
+        for i in range(0, len(unique), chunk_size):
+            stored.update((row['firstWord'], row['secondWord'])
+                          for row in _join_pairs(conn, 'r.firstWord, r.secondWord', unique[i:i + chunk_size]))
+    return [pair for pair in ordered if pair not in stored]
+
+def _precompute_combination(first_word: str, second_word: str) -> dict | None:
+    """Generate a recipe ahead of demand and store it in the recipe cache, marked as precomputed"""
+    combination = generation_flight.do(
+        consistent_order(first_word, second_word), generate_combination, first_word, second_word
+    )
+    if not combination or not combination['result']:
+        return None
+    return cache_combination(first_word, second_word, combination['result'], combination['emoji'], source='precompute')
+
+# Spends spare LLM capacity on likely upcoming pairs (disabled unless PRECOMPUTE_BUDGET_PER_HOUR > 0)
+precompute_scheduler = PrecomputeScheduler(
+    _load_precompute_materials,
+    _uncached_pairs,
+    _precompute_combination,
+    is_idle=lambda: llm_service.engine.stats()['outstanding'] == 0,
+    budget_per_hour=int(os.environ.get('PRECOMPUTE_BUDGET_PER_HOUR', 0)),
+    interval=float(os.environ.get('PRECOMPUTE_INTERVAL', 2)),
+    recent=int(os.environ.get('PRECOMPUTE_RECENT', 50)),
+    popular=int(os.environ.get('PRECOMPUTE_POPULAR', 50)),
+    recent_weight=float(os.environ.get('PRECOMPUTE_RECENT_WEIGHT', 1)),
+    popular_weight=float(os.environ.get('PRECOMPUTE_POPULAR_WEIGHT', 1)),
+)
+metrics.register_stats('infinitecats_precompute', precompute_scheduler.stats, counters=('generated', 'failed', 'skipped_busy', 'refills'))
 
-    # Add edges from combinations and ensure nodes exist
-    for row in rows:
-        first_word = row['firstWord']
-        second_word = row['secondWord']
-        result_name = row['resultName']
+# Combinations compacted out of the log, as rollups and memory-mapped archive segments
+event_archive = EventArchive(get_db, lambda: os.environ.get('EVENT_ARCHIVE_DIR') or f'{DB_PATH}.archive')
+metrics.register_stats('infinitecats_event_archive', event_archive.stats, counters=('replayed', 'compacted'))
 
-        if first_word not in nodes:
-            nodes[first_word] = {'id': first_word, 'label': first_word, 'emoji': get_emoji_by_word(first_word) or '❓'}
-        if second_word not in nodes:
-            nodes[second_word] = {'id': second_word, 'label': second_word, 'emoji': get_emoji_by_word(second_word) or '❓'}
-        if result_name not in nodes:
-            result_emoji = row['resultEmoji']
-            nodes[result_name] = {'id': result_name, 'label': result_name, 'emoji': result_emoji}
+def _load_graph_rows(username: str | None, after_id: int) -> list:
+    """Combination rows logged after `after_id` (archived ones first), scoped to a user when provided"""
+    with get_db() as conn:
+        if username:
+            rows = conn.execute(
+                'SELECT id, firstWord, secondWord, resultName, resultEmoji FROM combinations WHERE username = ? AND id > ? ORDER BY id',
+                (username, after_id)
+            ).fetchall()
+        else:
+            rows = conn.execute(
+                'SELECT id, firstWord, secondWord, resultName, resultEmoji FROM combinations WHERE id > ? ORDER BY id',
+                (after_id,)
+            ).fetchall()
+    # Read after the live log: rows compacted in between are then in both, and Graph.apply() skips repeated ids
+    return event_archive.graph_rows(username, after_id) + rows
+
+def _load_material_emojis(names) -> dict[str, str]:
+    """Emojis for the given material names, in as few queries as SQLite's parameter limit allows"""
+    names = list(names)
+    emojis = {}
+    with get_db() as conn:
+        for i in range(0, len(names), 500):
+            chunk = names[i:i + 500]
+            placeholders = ','.join(['?'] * len(chunk))
+            for row in conn.execute(f'SELECT name, emoji FROM materials WHERE name IN ({placeholders})', chunk):
+                emojis[row['name']] = row['emoji']
+    return emojis
 
-        edges.append({'from1': first_word, 'from2': second_word, 'to': result_name})
+# Global and per-user graphs, kept in memory and caught up as combinations are logged
+graph_index = GraphIndex(
+    _load_graph_rows,
+    _load_material_emojis,
+    max_users=int(os.environ.get('GRAPH_CACHE_USERS', 500)),
+)
+metrics.register_stats('infinitecats_graph_index', graph_index.stats)
+
+def _load_lineage_edges(material: str, username: str | None = None) -> list[tuple[str, str, str, str]]:
+    """Every recipe edge in the ancestry of `material`: global recipes, or the user's own crafts"""
+    with get_db() as conn:
+        if username:
+            rows = conn.execute(lineage_sql('user'), {'material': material, 'username': username}).fetchall()
+        else:
+            rows = conn.execute(lineage_sql('global'), {'material': material}).fetchall()
+    return list(dict.fromkeys(tuple(row) for row in rows))
 
-    print(f"Fetched {len(nodes)} nodes and {len(edges)} edges for {scope}.")
-    return list(nodes.values()), edges
+# Memoized shortest recipe trees, dropped when a recipe for one of their ancestors appears
+lineage_index = LineageIndex(_load_lineage_edges, maxsize=int(os.environ.get('LINEAGE_CACHE_SIZE', 5000)))
+metrics.register_stats('infinitecats_lineage', lineage_index.stats, counters=('hits', 'misses', 'invalidations'))
+
+# Startup work run in the background once the database is initialized; /health/ready reports on it.
+# With STARTUP_WARMUP=0 no tasks are registered and the process is ready as soon as it starts.
+warmup = Warmup()
+if os.environ.get('STARTUP_WARMUP', '1') != '0':
+    warmup.add('embedding_model', embedder.warm)
+    warmup.add('llm_sdk', llm_service.preload_sdk)
+    warmup.add('embedding_matrix', sync_embedding_matrix)
+    warmup.add('graph', graph_index.get)
+    if semantic_cache.enabled:
+        warmup.add('semantic_index', semantic_cache.index_pending)
+metrics.register_stats('infinitecats_warmup', lambda: {'ready': int(warmup.ready)})
+
+def _read_change_counters() -> dict[str, int]:
+    with get_db() as conn:
+        return {row['name']: row['version'] for row in conn.execute('SELECT name, version FROM change_counters')}
+
+class _NewRows:
+    """Cursor over rows appended to a table (by any process) since the last read"""
+
+    def __init__(self, sql: str, max_id_sql: str):
+        self.sql = sql
+        self.max_id_sql = max_id_sql
+        self.cursor = None
+        self.lock = threading.Lock()
+
+    def start(self):
+        with self.lock, get_db() as conn:
+            self.cursor = conn.execute(self.max_id_sql).fetchone()[0] or 0
+
+    def read(self) -> list:
+        with self.lock, get_db() as conn:
+            rows = conn.execute(self.sql, (self.cursor,)).fetchall()
+            if rows:
+                self.cursor = rows[-1]['id']
+        return rows
+
+_new_recipes = _NewRows('SELECT id, resultName FROM recipes WHERE id > ? ORDER BY id', 'SELECT MAX(id) FROM recipes')
+_promoted_recipes = _NewRows(
+    'SELECT id, firstWord, secondWord FROM recipe_promotions WHERE id > ? ORDER BY id', 'SELECT MAX(id) FROM recipe_promotions'
+)
+_new_combinations = _NewRows(
+    'SELECT id, username, resultName FROM combinations WHERE id > ? ORDER BY id', 'SELECT MAX(id) FROM combinations'
+)
+
+def _on_new_recipes(version: int):
+    for row in _new_recipes.read():
+        lineage_index.note_recipe(row['resultName'])
+    # Precomputed recipes another process promoted to 'live' (an update, so it also bumps 'recipes')
+    for row in _promoted_recipes.read():
+        recipe_cache.invalidate(row['firstWord'], row['secondWord'])
+
+def _on_new_combinations(version: int):
+    graph_index.sync_version(version)
+    for row in _new_combinations.read():
+        lineage_index.note_recipe(row['resultName'], row['username'])
+
+def _on_new_materials(version: int):
+    if embedding_matrix.loaded:
+        sync_embedding_matrix()
+
+def _on_recipes_rewritten(version: int):
+    recipe_cache.clear()
+    fewshot_selector.cache.clear()
+    lineage_index.clear()
+
+def _on_combinations_rewritten(version: int):
+    graph_index.invalidate()
+    lineage_index.clear()
+
+# Writes made by other worker processes reach this process's caches through the change counters.
+# Each process also updates its caches directly for its own writes; CHANGE_POLL_INTERVAL=0 disables polling.
+change_watcher = ChangeWatcher(_read_change_counters, interval=float(os.environ.get('CHANGE_POLL_INTERVAL', 1)))
+change_watcher.on_change('recipes', _on_new_recipes)
+change_watcher.on_change('combinations', _on_new_combinations)
+change_watcher.on_change('materials', _on_new_materials)
+change_watcher.on_change('recipe_rewrites', _on_recipes_rewritten)
+change_watcher.on_change('combination_rewrites', _on_combinations_rewritten)
+metrics.register_stats('infinitecats_change_watcher', change_watcher.stats, counters=('polls', 'changes', 'errors'))
+
+_singleton_locks = []
+
+def _claim_singleton(name: str) -> bool:
+    """
+    Take an exclusive lock file next to the database for the life of this process.
+    Returns False if another process (e.g. another worker) already holds it.
+    """
+    import fcntl
+    path = f'{DB_PATH}.{name}.lock'
+    lock_file = open(path, 'a+')
+    try:
+        fcntl.flock(lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+    except BlockingIOError:
+        lock_file.seek(0)
+        log.info("%s runs in process %s (holds %s)", name, lock_file.read().strip() or '?', path)
+        lock_file.close()
+        return False
+    # The holder's pid, so a lock taken by the wrong process can be found
+    lock_file.truncate(0)
+    lock_file.write(str(os.getpid()))
+    lock_file.flush()
+    _singleton_locks.append(lock_file)
+    return True
+
+def start_background_work():
+    """
+    Start this process's background threads once the database is initialized:
+    warmup, the change watcher and, in only one process per database, the precompute scheduler.
+    """
+    warmup.start()
+    if change_watcher.enabled:
+        _new_recipes.start()
+        _promoted_recipes.start()
+        _new_combinations.start()
+        change_watcher.start()
+    if precompute_scheduler.enabled and _claim_singleton('precompute'):
+        precompute_scheduler.start()
+
+def get_change_versions(username: str | None = None) -> dict[str, int]:
+    """
+    Current change counters, bumped by triggers on every write:
+    'materials', 'combinations' and, with a username, 'user' (that user's combinations).
+    """
+    with get_db() as conn:
+        rows = conn.execute(
+            'SELECT name, version FROM change_counters WHERE name IN (?, ?)', ('materials', 'combinations')
+        ).fetchall()
+        versions = {row['name']: row['version'] for row in rows}
+        if username:
+            row = conn.execute('SELECT version FROM user_change_counters WHERE username = ?', (username,)).fetchone()
+            versions['user'] = row['version'] if row else 0
+    return versions
+
+def get_nodes_and_edges(username: str | None = None, since: int | None = None, columnar: bool = False):
+    """
+    Retrieve graph nodes/edges filtered by username when provided.
+    With `since`, only nodes and edges added after that cursor are returned.
+    Returns (nodes, edges, cursor).
+    """
+    graph = graph_index.get(username or None)
+    return graph.snapshot_columnar(since) if columnar else graph.snapshot(since)
 
 @app.route('/api/graph', methods=['GET'])
 def get_graph_data():
-    username = request.args.get('username')
-    nodes, edges = get_nodes_and_edges(username)
-    return jsonify({'nodes': nodes, 'links': edges})
+    """
+    Graph of materials and combinations, for everyone or one user (?username=).
+    Every response carries a `cursor`; pass it back as ?since=<cursor> to get only new nodes and links.
+    ?format=columnar returns parallel arrays with integer node ids instead of one object per node and link.
+    """
+    username = request.args.get('username') or None
+    since = request.args.get('since')
+    if since is not None:
+        try:
+            since = int(since)
+        except ValueError:
+            return jsonify({'error': 'since must be an integer cursor'}), 400
+    graph_format = request.args.get('format', 'objects')
+    if graph_format not in ('objects', 'columnar'):
+        return jsonify({'error': 'format must be objects or columnar'}), 400
+
+    versions = get_change_versions(username)
+    etag = responses.version_etag(versions['user'] if username else versions['combinations'])
+    cached = responses.not_modified(etag)
+    if cached is not None:
+        return cached
+    # Catch up even if this commit's mark_dirty() hasn't run yet, so the body is at least as new as the ETag
+    graph_index.sync_version(versions['combinations'])
+
+    nodes, edges, cursor = get_nodes_and_edges(username, since, columnar=graph_format == 'columnar')
+    response = {'nodes': nodes, 'links': edges, 'cursor': cursor}
+    if since is not None:
+        response['since'] = since
+    return responses.with_etag(jsonify(response), etag)
 
 @app.route('/', methods=['GET'])
 def get_available_materials():
     """Get all discovered materials"""
-    conn = get_db()
-    cursor = conn.cursor()
-    cursor.execute('SELECT name, emoji FROM materials ORDER BY name')
-    materials = cursor.fetchall()
-    conn.close()
+    etag = responses.version_etag(get_change_versions()['materials'])
+    cached = responses.not_modified(etag)
+    if cached is not None:
+        return cached
+
+    with get_db() as conn:
+        cursor = conn.cursor()
+        cursor.execute('SELECT name, emoji FROM materials ORDER BY name')
+        materials = cursor.fetchall()
     
-    return jsonify({
+    return responses.with_etag(jsonify({
         'materials': [{'name': m['name'], 'emoji': m['emoji']} for m in materials]
-    })
+    }), etag)
+
+BATCH_MAX_PAIRS = int(os.environ.get('BATCH_MAX_PAIRS', 100))
+
+def normalize_word(word) -> str:
+    """Trim and lowercase a submitted word, then capitalize its first letter"""
+    word = word.strip().lower() if isinstance(word, str) else ''
+    return word[0].upper() + word[1:] if word else ''
 
 @app.route('/', methods=['POST'])
 def combine_custom_words():
@@ -406,35 +1023,141 @@ def combine_custom_words():
     if not data or 'first' not in data or 'second' not in data:
         return jsonify({'error': 'Missing first or second word'}), 400
     
-    first_word = data['first'].strip().lower()
-    second_word = data['second'].strip().lower()
+    first_word = normalize_word(data['first'])
+    second_word = normalize_word(data['second'])
     username = data.get('username')  # None if not provided
     
     if not first_word or not second_word:
         return jsonify({'error': 'Words cannot be empty'}), 400
     
-    # Capitalize first letter
-    first_word = first_word[0].upper() + first_word[1:] if first_word else ''
-    second_word = second_word[0].upper() + second_word[1:] if second_word else ''
-    
-    result = craft_new_word(first_word, second_word, username)
+    try:
+        result = craft_new_word(first_word, second_word, username)
+    except LLMOverloaded:
+        return jsonify({'error': 'Too many combinations in progress, please try again'}), 503
     return jsonify(result)
 
+@app.route('/api/combine/batch', methods=['POST'])
+def combine_batch():
+    """
+    Combine many pairs in one request.
+    Body: {"pairs": [["fire", "water"], ["earth", "air"], ...], "username": "shm"}
+    Response: newline-delimited JSON, one line per pair as soon as it is ready
+    (cache hits first, then generated pairs in completion order):
+        {"index": 0, "first": "Fire", "second": "Water", "result": "Steam", "emoji": "💨", "isDiscovery": false}
+    Words are normalized like POST /. A pair that can't be generated right now
+    because the LLM is overloaded gets "error": "overloaded".
+    """
+    data = request.get_json(silent=True)
+    if not isinstance(data, dict) or not isinstance(data.get('pairs'), list) or not data['pairs']:
+        return jsonify({'error': 'Missing pairs'}), 400
+    if len(data['pairs']) > BATCH_MAX_PAIRS:
+        return jsonify({'error': f'At most {BATCH_MAX_PAIRS} pairs per batch'}), 400
+    
+    pairs = []
+    for pair in data['pairs']:
+        if not isinstance(pair, (list, tuple)) or len(pair) != 2:
+            return jsonify({'error': 'Each pair must be [first, second]'}), 400
+        first_word, second_word = normalize_word(pair[0]), normalize_word(pair[1])
+        if not first_word or not second_word:
+            return jsonify({'error': 'Words cannot be empty'}), 400
+        pairs.append((first_word, second_word))
+    username = data.get('username')
+    
+    def generate():
+        for index, result in craft_many(pairs, username):
+            first_word, second_word = pairs[index]
+            yield json.dumps({'index': index, 'first': first_word, 'second': second_word, **result}) + '\n'
+    
+    return Response(stream_with_context(generate()), mimetype='application/x-ndjson')
+
 @app.route('/health', methods=['GET'])
 def health_check():
-    """Health check endpoint"""
-    return jsonify({'status': 'ok'})
+    """Liveness: the process is serving requests. `ready` says whether startup warmup has finished."""
+    return jsonify({'status': 'ok', 'ready': warmup.ready})
+
+@app.route('/health/ready', methods=['GET'])
+def readiness_check():
+    """
+    Readiness: 200 once every warmup task has succeeded, 503 before that (or if one failed).
+    Response: {"ready": false, "elapsed_seconds": 1.2, "tasks": {"embedding_model": {"state": "running"}, ...}, ...}
+    """
+    stats = warmup.stats()
+    return jsonify(stats), 200 if stats['ready'] else 503
+
+@app.route('/api/db-stats', methods=['GET'])
+def get_db_stats():
+    """
+    Connection pool statistics (hit rate, wait times, open connections).
+    Response: {"pools": {"global.db": {"hits": 120, "misses": 4, "hit_rate": 0.97, ...}}}
+    """
+    return jsonify({'pools': all_pool_stats()})
+
+@app.route('/api/cache-stats', methods=['GET'])
+def get_cache_stats():
+    """
+    In-memory recipe cache and LLM call coalescing counters.
+    Response: {"recipes": {"size": 812, "hits": 5400, "misses": 900, "evictions": 0, "hit_rate": 0.86, ...},
+               "generations": {"in_flight": 1, "leaders": 300, "coalesced": 12, "timeouts": 0, "errors": 0, ...},
+               "llm": {"outstanding": 2, "calls": 310, "timeouts": 1, "rejected": 0, "hedges_fired": 4, "hedges_won": 3, ...},
+               "fewshot": {"k": 4, "selections": 280, "empty": 3, "avg_candidates": 96.5, "cache_hits": 40, "cache_size": 280},
+               "precompute": {"enabled": true, "budget_left": 112, "generated": 88, "failed": 2, "served": 31, ...},
+               "semantic": {"mode": "reuse", "threshold": 0.92, "lookups": 90, "matches": 14, "llm_calls_saved": 14, ...}}
+    """
+    return jsonify({
+        'recipes': recipe_cache.stats(),
+        'generations': generation_flight.stats(),
+        'llm': llm_service.engine.stats(),
+        'fewshot': fewshot_selector.stats(),
+        'precompute': {**precompute_scheduler.stats(), 'served': CRAFTS.value('precompute')},
+        'semantic': semantic_cache.stats(),
+    })
+
+@app.route('/api/queue-stats', methods=['GET'])
+def get_queue_stats():
+    """
+    Background combination log queue and embedding batcher metrics.
+    Response: {"combinationLog": {"depth": 3, "enqueued": 900, "processed": 897, "dropped": 0, "avg_flush_seconds": 0.004, ...},
+               "embeddings": {"pending": 0, "batches": 40, "items": 310, "avg_batch_size": 7.75, ...}}
+    """
+    return jsonify({'combinationLog': log_queue.stats(), 'embeddings': embedder.stats()})
+
+@app.route('/metrics', methods=['GET'])
+def get_metrics():
+    """Prometheus text exposition of stage timings, counters and component stats"""
+    return Response(REGISTRY.render(), mimetype='text/plain; version=0.0.4')
 
 @app.route('/api/distance', methods=['POST'])
 def get_distance():
     """
-    Calculate cosine similarity distance between two materials.
+    Calculate cosine similarity distance between materials.
     Request: POST /api/distance
     Body: {"material1": "Fire", "material2": "Water"}
     Response: {"material1": "Fire", "material2": "Water", "similarity": 0.42}
+    
+    Batch modes (similarity is null for unknown materials):
+    Body: {"pairs": [["Fire", "Water"], ["Earth", "Air"]]}
+    Response: {"results": [{"material1": "Fire", "material2": "Water", "similarity": 0.42}, ...]}
+    Body: {"material": "Fire", "others": ["Water", "Steam"]}
+    Response: {"material": "Fire", "results": [{"material": "Water", "similarity": 0.42}, ...]}
     """
     data = request.get_json()
     
+    if data and 'pairs' in data:
+        pairs = data['pairs']
+        if not isinstance(pairs, list) or not all(isinstance(p, list) and len(p) == 2 and all(isinstance(n, str) for n in p) for p in pairs):
+            return jsonify({'error': 'pairs must be a list of [material1, material2] name pairs'}), 400
+        pairs = [(first.strip(), second.strip()) for first, second in pairs]
+        return jsonify({'results': get_pairwise_distances(pairs)})
+    
+    if data and 'material' in data and 'others' in data:
+        others = data['others']
+        if not isinstance(data['material'], str) or not isinstance(others, list) or not all(isinstance(n, str) for n in others):
+            return jsonify({'error': 'material must be a name and others a list of names'}), 400
+        material = data['material'].strip()
+        if not material:
+            return jsonify({'error': 'Material names cannot be empty'}), 400
+        return jsonify({'material': material, 'results': get_one_to_many_distances(material, [n.strip() for n in others])})
+    
     if not data or 'material1' not in data or 'material2' not in data:
         return jsonify({'error': 'Missing material1 or material2'}), 400
     
@@ -447,6 +1170,51 @@ def get_distance():
     result = get_material_distance(material1, material2)
     return jsonify(result)
 
+@app.route('/api/similar', methods=['GET'])
+def get_similar_materials():
+    """
+    Find the materials nearest to a material name or free text.
+    Query params: material=Fire or text=hot lava, k=10 (max 100)
+    Response: {"query": "Fire", "results": [{"name": "Flame", "emoji": "🔥", "similarity": 0.81}, ...]}
+    """
+    material = (request.args.get('material') or '').strip()
+    text = (request.args.get('text') or '').strip()
+    if not material and not text:
+        return jsonify({'error': 'Missing material or text parameter'}), 400
+    try:
+        k = min(max(int(request.args.get('k', 10)), 1), 100)
+    except ValueError:
+        return jsonify({'error': 'k must be an integer'}), 400
+    
+    embedding = get_embedding_matrix((material,)).vector(material) if material else None
+    if embedding is None:
+        # Unknown material names are embedded like free text
+        embedding = generate_embedding(material or text)
+    
+    results = find_similar_materials(embedding, k=k, exclude=material or None)
+    return jsonify({'query': material or text, 'results': results})
+
+@app.route('/api/lineage', methods=['GET'])
+def get_lineage():
+    """
+    Shortest recipe tree from the base elements to a material.
+    Query params: material=Steam, optional username=shm to use only that player's crafts.
+    Response: {"material": "Steam", "crafts": 1, "depth": 1,
+               "steps": [{"first": "Fire", "second": "Water", "result": "Steam", "emoji": "💨"}],
+               "tree": {"name": "Steam", "emoji": "💨", "from": [{"name": "Fire"}, {"name": "Water"}]}}
+    `steps` lists each craft once, in an order that can be followed; `crafts` counts
+    every craft in the tree. 404 if the material can't be reached in that scope.
+    """
+    material = request.args.get('material', '').strip()
+    username = request.args.get('username') or None
+    if not material:
+        return jsonify({'error': 'Missing material parameter'}), 400
+    
+    lineage = lineage_index.get(material, username)
+    if lineage is None:
+        return jsonify({'error': f'No recipe path from the base elements to {material}'}), 404
+    return jsonify({**lineage, 'username': username})
+
 @app.route('/api/user-materials', methods=['GET'])
 def get_user_materials():
     """
@@ -458,22 +1226,112 @@ def get_user_materials():
     
     if not username:
         return jsonify({'error': 'Missing username parameter'}), 400
+
+    etag = responses.version_etag(get_change_versions(username)['user'])
+    cached = responses.not_modified(etag)
+    if cached is not None:
+        return cached
     
-    conn = get_db()
-    cursor = conn.cursor()
-    
-    # Get all unique materials discovered by this user (from combinations table)
-    cursor.execute(
-        'SELECT DISTINCT resultName, resultEmoji FROM combinations WHERE username = ? ORDER BY resultName',
-        (username,)
-    )
-    rows = cursor.fetchall()
-    conn.close()
+    with get_db() as conn:
+        cursor = conn.cursor()
+        
+        # Get all unique materials discovered by this user (from the materialized depth table)
+        cursor.execute(
+            'SELECT material, emoji FROM user_depths WHERE username = ? ORDER BY material',
+            (username,)
+        )
+        rows = cursor.fetchall()
     
-    materials = [{'name': row['resultName'], 'emoji': row['resultEmoji']} for row in rows]
+    materials = [{'name': row['material'], 'emoji': row['emoji']} for row in rows]
     
-    return jsonify({'materials': materials})
+    return responses.with_etag(jsonify({'materials': materials}), etag)
+
+STATS_MAX_LIMIT = 100
+STATS_MAX_HOURS = 24 * 30
+LEADERBOARDS = {'discoveries': 'discoveries', 'materials': 'materials', 'depth': 'maxRank'}
+
+def _user_stats_row(row) -> dict:
+    return {'username': row['username'], 'crafts': row['crafts'], 'discoveries': row['discoveries'],
+            'materials': row['materials'], 'maxRank': row['maxRank']}
+
+@app.route('/api/stats', methods=['GET'])
+def get_stats():
+    """
+    Leaderboards, most crafted results and hourly activity, read from the
+    aggregate tables log_combination() keeps up to date (no scans of the event log).
+    Query params: limit=10 (max 100) entries per leaderboard, hours=24 (max 720)
+    of hourly buckets ending with the current hour, optional username=shm for that player's totals.
+    Response: {"leaderboards": {"discoveries": [...], "materials": [...], "depth": [...]},
+               "topResults": [{"name": "Steam", "emoji": "💨", "crafts": 12, "players": 5}, ...],
+               "hourly": [{"hour": "2026-10-16T13", "crafts": 40, "discoveries": 3, "newPlayers": 1}, ...],
+               "user": {"username": "shm", "crafts": 10, ...} or null}
+    """
+    try:
+        limit = min(max(int(request.args.get('limit', 10)), 1), STATS_MAX_LIMIT)
+        hours = min(max(int(request.args.get('hours', 24)), 1), STATS_MAX_HOURS)
+    except ValueError:
+        return jsonify({'error': 'limit and hours must be integers'}), 400
+    username = request.args.get('username') or None
+
+    now = datetime.now().replace(minute=0, second=0, microsecond=0)
+    # The hourly window moves with the clock, so the current hour is part of the ETag
+    etag = responses.version_etag(get_change_versions()['combinations'], int(now.timestamp()) // 3600)
+    cached = responses.not_modified(etag)
+    if cached is not None:
+        return cached
+
+    buckets = [(now - timedelta(hours=offset)).isoformat()[:13] for offset in range(hours - 1, -1, -1)]
+    with get_db() as conn:
+        leaderboards = {
+            name: [_user_stats_row(row) for row in conn.execute(
+                f'SELECT username, crafts, discoveries, materials, maxRank FROM user_stats '
+                f'ORDER BY {column} DESC, username LIMIT ?', (limit,)
+            )]
+            for name, column in LEADERBOARDS.items()
+        }
+        top_results = [
+            {'name': row['resultName'], 'emoji': row['resultEmoji'], 'crafts': row['crafts'], 'players': row['players']}
+            for row in conn.execute(
+                'SELECT resultName, resultEmoji, crafts, players FROM result_stats ORDER BY crafts DESC, resultName LIMIT ?',
+                (limit,)
+            )
+        ]
+        hourly_rows = {
+            row['hour']: row for row in conn.execute(
+                'SELECT hour, crafts, discoveries, newPlayers FROM hourly_stats WHERE hour >= ? ORDER BY hour',
+                (buckets[0],)
+            )
+        }
+        user = None
+        if username:
+            row = conn.execute(
+                'SELECT username, crafts, discoveries, materials, maxRank, firstCraftAt, lastCraftAt FROM user_stats WHERE username = ?',
+                (username,)
+            ).fetchone()
+            if row is not None:
+                user = {**_user_stats_row(row), 'firstCraftAt': row['firstCraftAt'], 'lastCraftAt': row['lastCraftAt']}
+
+    # Hours without crafts have no row; report them as zeros so the series is contiguous
+    hourly = []
+    for hour in buckets:
+        row = hourly_rows.get(hour)
+        hourly.append({'hour': hour, 'crafts': row['crafts'] if row else 0,
+                       'discoveries': row['discoveries'] if row else 0,
+                       'newPlayers': row['newPlayers'] if row else 0})
+
+    return responses.with_etag(jsonify({
+        'leaderboards': leaderboards,
+        'topResults': top_results,
+        'hourly': hourly,
+        'user': user,
+    }), etag)
 
 if __name__ == '__main__':
     init_db()
+    # debug=True runs this file twice: a reloader parent that only watches the
+    # source files, and the child (WERKZEUG_RUN_MAIN=true) that serves requests.
+    # Warmup and the change watcher belong in the child, and so does the precompute
+    # lock: the parent outlives every restarted child and would hold it for good
+    if os.environ.get('WERKZEUG_RUN_MAIN') == 'true':
+        start_background_work()
     app.run(debug=True, host='0.0.0.0', port=3000)
@@ -0,0 +1,122 @@
+"""
+Microbenchmark: per-call prompt preparation overhead in generate_combination.
+
+"before" replays what every call used to do: rebuild the system prompt and
+primer turns, construct TypeAdapter(Material) twice (one for an unused
+json_schema()), and open cache.db twice for few-shot examples. "after" is
+llm_service.build_messages() plus the module-level validator.
+
+Usage (from server/):
+    python bench/bench_prompt.py [--iterations 2000] [--cache-rows 5000]
+"""
+import argparse
+import json
+import os
+import sqlite3
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+from pydantic import TypeAdapter
+
+import llm_service
+from llm_service import build_messages, consistent_order, MATERIAL_ADAPTER
+from models import Material
+
+SAMPLE_OUTPUT = {"name": "Steam", "emoji": "💨"}
+
+
+def _legacy_fetch_examples_for_word(word, limit=5):
+    if not os.path.exists(llm_service.DB_PATH):
+        return []
+    conn = sqlite3.connect(llm_service.DB_PATH)
+    cursor = conn.cursor()
+    cursor.execute(
+        """
+        SELECT first_word, second_word, result, emoji
+        FROM word_cache
+        WHERE first_word = ? OR second_word = ?
+        ORDER BY id DESC
+        LIMIT ?
+        """,
+        (word, word, limit),
+    )
+    rows = cursor.fetchall()
+    conn.close()
+    return rows
+
+
+def legacy_prepare(first_word, second_word):
+    """Preparation as done per call before prompts and validators were precompiled"""
+    first_word, second_word = consistent_order(first_word, second_word)
+    examples = _legacy_fetch_examples_for_word(first_word, limit=3) + _legacy_fetch_examples_for_word(second_word, limit=3)
+    # The primer turns were dict literals rebuilt on every call
+    messages = [{'role': message['role'], 'content': message['content']} for message in llm_service.PRIMER_MESSAGES]
+    seen_pairs = set()
+    for fw, sw, res, emo in examples:
+        ordered_fw, ordered_sw = consistent_order(fw, sw)
+        key = (ordered_fw, ordered_sw, res, emo)
+        if key in seen_pairs:
+            continue
+        seen_pairs.add(key)
+        messages.append({'role': 'user', 'content': f"combine {ordered_fw} and {ordered_sw}"})
+        messages.append({'role': 'assistant', 'content': json.dumps({"name": res, "emoji": emo})})
+    TypeAdapter(Material).json_schema()
+    messages.append({'role': 'user', 'content': f'Combine {first_word} and {second_word}. remember to only output JSON, no other text'})
+    TypeAdapter(Material).validate_python(SAMPLE_OUTPUT)
+    return messages
+
+
+def current_prepare(first_word, second_word):
+    first_word, second_word = consistent_order(first_word, second_word)
+    messages = build_messages(first_word, second_word)
+    MATERIAL_ADAPTER.validate_python(SAMPLE_OUTPUT)
+    return messages
+
+
+def seed_cache(path, rows):
+    conn = sqlite3.connect(path)
+    conn.execute('CREATE TABLE word_cache (id INTEGER PRIMARY KEY, first_word TEXT, second_word TEXT, result TEXT, emoji TEXT)')
+    words = ['Fire', 'Water', 'Earth', 'Air'] + [f'Word{i}' for i in range(200)]
+    conn.executemany(
+        'INSERT INTO word_cache (first_word, second_word, result, emoji) VALUES (?, ?, ?, ?)',
+        [(words[i % len(words)], words[(i * 7) % len(words)], f'Result{i}', '✨') for i in range(rows)]
+    )
+    conn.commit()
+    conn.close()
+
+
+def bench(fn, iterations):
+    pairs = [('Fire', 'Water'), ('Word3', 'Earth'), ('Air', 'Word150')]
+    for i in range(min(50, iterations)):
+        fn(*pairs[i % len(pairs)])
+    start = time.perf_counter()
+    for i in range(iterations):
+        fn(*pairs[i % len(pairs)])
+    return (time.perf_counter() - start) / iterations
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('--iterations', type=int, default=2000)
+    parser.add_argument('--cache-rows', type=int, default=5000)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        llm_service.DB_PATH = os.path.join(tmp, 'cache.db')
+        seed_cache(llm_service.DB_PATH, args.cache_rows)
+        assert legacy_prepare('Fire', 'Water') == current_prepare('Fire', 'Water'), 'prompts differ'
+
+        before = bench(legacy_prepare, args.iterations)
+        after = bench(current_prepare, args.iterations)
+
+    print(f"word_cache rows: {args.cache_rows}, iterations: {args.iterations}")
+    print(f"before: {before * 1e6:8.1f} µs/call")
+    print(f"after:  {after * 1e6:8.1f} µs/call")
+    print(f"speedup: {before / after:.1f}x")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,124 @@
+"""
+Startup benchmark: how long a fresh server process takes to import the app,
+open the database, answer its first request and become ready (warmup done).
+
+Each run is a new interpreter. "lazy" is the app as shipped; "eager" first
+imports sentence_transformers and the Cerebras SDK, as app import used to.
+Also reports which heavy modules were loaded by the time the first request
+was answered, and the latency of the first embedding after warmup.
+
+Usage (from server/):
+    python bench/bench_startup.py [--runs 5] [--db bench/data/global-100k.db]
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+_PROCESS_START = time.perf_counter()
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+HEAVY_MODULES = ('torch', 'sentence_transformers', 'cerebras.cloud.sdk')
+PHASES = ('import_s', 'init_db_s', 'first_response_s', 'ready_s', 'first_embedding_ms')
+
+
+def measure(db: str, eager: bool, ready_timeout: float) -> dict:
+    """Run in the child process: time each startup phase from interpreter start"""
+    if eager:
+        import sentence_transformers  # noqa: F401
+        import cerebras.cloud.sdk  # noqa: F401
+    import app
+    imported = time.perf_counter()
+
+    app.DB_PATH = db
+    app.init_db()
+    initialized = time.perf_counter()
+
+    status = app.app.test_client().get('/health').status_code
+    first_response = time.perf_counter()
+    heavy = [name for name in HEAVY_MODULES if name in sys.modules]
+
+    app.warmup.start()
+    ready = app.warmup.wait(ready_timeout)
+    warmed = time.perf_counter()
+
+    start = time.perf_counter()
+    app.generate_embedding('Startup benchmark')
+    first_embedding = time.perf_counter() - start
+
+    return {
+        'import_s': imported - _PROCESS_START,
+        'init_db_s': initialized - imported,
+        'first_response_s': first_response - _PROCESS_START,
+        'ready_s': warmed - _PROCESS_START,
+        'first_embedding_ms': first_embedding * 1000,
+        'health_status': status,
+        'ready': ready,
+        'heavy_modules_at_first_response': heavy,
+        'warmup': app.warmup.stats()['tasks'],
+    }
+
+
+def run_child(db: str, eager: bool, ready_timeout: float) -> dict:
+    command = [sys.executable, __file__, '--child', '--db', db, '--ready-timeout', str(ready_timeout)]
+    if eager:
+        command.append('--eager')
+    start = time.perf_counter()
+    output = subprocess.run(command, check=True, capture_output=True, text=True).stdout
+    result = json.loads(output.strip().splitlines()[-1])
+    result['process_s'] = time.perf_counter() - start
+    return result
+
+
+def prepare_db(path: str):
+    """Create a database with the schema and base elements (loads the model once, untimed)"""
+    subprocess.run([sys.executable, __file__, '--prepare', '--db', path], check=True, stdout=subprocess.DEVNULL)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Measure server process startup time')
+    parser.add_argument('--db', help='Database to start against (default: a fresh one with only the base elements)')
+    parser.add_argument('--runs', type=int, default=5)
+    parser.add_argument('--ready-timeout', type=float, default=300)
+    parser.add_argument('--child', action='store_true', help=argparse.SUPPRESS)
+    parser.add_argument('--prepare', action='store_true', help=argparse.SUPPRESS)
+    parser.add_argument('--eager', action='store_true', help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.prepare:
+        import app
+        app.DB_PATH = args.db
+        app.init_db()
+        return
+    if args.child:
+        print(json.dumps(measure(args.db, args.eager, args.ready_timeout)))
+        return
+
+    with tempfile.TemporaryDirectory() as tmp:
+        db = args.db
+        if db is None:
+            db = os.path.join(tmp, 'global.db')
+            prepare_db(db)
+        results = {mode: [run_child(db, mode == 'eager', args.ready_timeout) for _ in range(args.runs)]
+                   for mode in ('lazy', 'eager')}
+
+    print(f"Median of {args.runs} fresh processes (seconds from interpreter start unless noted)")
+    print(f"{'mode':<8}" + ''.join(f"{phase:>20}" for phase in PHASES))
+    for mode, runs in results.items():
+        print(f"{mode:<8}" + ''.join(f"{statistics.median(run[phase] for run in runs):>20.3f}" for phase in PHASES))
+    for mode, runs in results.items():
+        last = runs[-1]
+        print(f"{mode}: ready={last['ready']}, heavy modules loaded before first response: "
+              f"{', '.join(last['heavy_modules_at_first_response']) or 'none'}")
+        print(f"  warmup tasks: " + ', '.join(
+            f"{name} {status['state']} {status.get('seconds', 0):.2f}s" for name, status in last['warmup'].items()
+        ))
+
+
+if __name__ == '__main__':
+    main()
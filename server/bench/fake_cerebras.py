@@ -0,0 +1,97 @@
+"""
+Local stand-in for the AsyncCerebras client, so the server can be benchmarked
+without API credits.
+
+Responses are deterministic per input pair (the same pair always yields the
+same material), latency is log-normal around a configurable median, and a
+configurable fraction of calls fail or return output the validator rejects.
+
+Usage:
+    from bench.fake_cerebras import FakeAsyncCerebras
+    FakeAsyncCerebras(latency=0.4, failure_rate=0.02, garbage_rate=0.05).install()
+"""
+import asyncio
+import hashlib
+import json
+import random
+import re
+import threading
+from types import SimpleNamespace
+
+import llm_service
+
+EMOJIS = ['✨', '🔥', '💧', '🌍', '💨', '🌫️', '🌋', '🌱', '⚡', '🧊', '🪨', '🌈']
+SYLLABLES = ['ka', 'lo', 'mi', 'ra', 'sen', 'tu', 'vo', 'qui', 'zel', 'dor', 'ph', 'ax']
+COMBINE_PATTERN = re.compile(r'combine (.+?) and (.+?)\.', re.IGNORECASE)
+
+
+def fake_material(first_word: str, second_word: str) -> dict:
+    """The material the fake model always returns for a pair"""
+    digest = hashlib.blake2b(f'{first_word}+{second_word}'.encode(), digest_size=8).digest()
+    name = ''.join(SYLLABLES[b % len(SYLLABLES)] for b in digest[:3 + digest[7] % 3])
+    return {'name': name.capitalize(), 'emoji': EMOJIS[digest[6] % len(EMOJIS)]}
+
+
+class FakeUpstreamError(RuntimeError):
+    pass
+
+
+class _Completions:
+    def __init__(self, owner: 'FakeAsyncCerebras'):
+        self.owner = owner
+
+    async def create(self, messages: list[dict], **kwargs):
+        return await self.owner.respond(messages)
+
+
+class FakeAsyncCerebras:
+    """Mimics `client.chat.completions.create(...)` of the async Cerebras SDK"""
+
+    def __init__(self, latency: float = 0.3, sigma: float = 0.35, failure_rate: float = 0.0,
+                 garbage_rate: float = 0.0, seed: int | None = None):
+        self.latency = latency
+        self.sigma = sigma
+        self.failure_rate = failure_rate
+        self.garbage_rate = garbage_rate
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+        self.chat = SimpleNamespace(completions=_Completions(self))
+        self.calls = 0
+        self.failures = 0
+        self.garbage = 0
+
+    def install(self) -> 'FakeAsyncCerebras':
+        llm_service.set_client(self)
+        return self
+
+    def _draw(self) -> tuple[float, float]:
+        with self._lock:
+            self.calls += 1
+            return self._random.lognormvariate(0, self.sigma), self._random.random()
+
+    async def respond(self, messages: list[dict]):
+        spread, roll = self._draw()
+        if self.latency > 0:
+            await asyncio.sleep(self.latency * spread)
+
+        if roll < self.failure_rate:
+            with self._lock:
+                self.failures += 1
+            raise FakeUpstreamError('fake upstream error')
+
+        # Retries append a system turn, so look for the last user request
+        request = next(message['content'] for message in reversed(messages) if message['role'] == 'user')
+        match = COMBINE_PATTERN.search(request)
+        first_word, second_word = match.groups() if match else ('Fire', 'Water')
+        if roll < self.failure_rate + self.garbage_rate:
+            with self._lock:
+                self.garbage += 1
+            # Alternate between unparseable text and JSON that fails validation
+            content = 'Sure! Here is the result: Steam' if spread > 1 else json.dumps({'name': '', 'emoji': ''})
+        else:
+            content = json.dumps(fake_material(first_word, second_word))
+        return SimpleNamespace(choices=[SimpleNamespace(message=SimpleNamespace(content=content))])
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {'calls': self.calls, 'failures': self.failures, 'garbage': self.garbage}
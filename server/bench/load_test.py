@@ -0,0 +1,227 @@
+"""
+Load test: replay craft traffic against the Flask app in-process, with the
+Cerebras API replaced by bench/fake_cerebras.py.
+
+Traffic is either a recorded JSONL file (one {"method": "POST", "path": "/",
+"body": {...}} or {"method": "GET", "path": "/api/graph?username=u"} per line)
+or is synthesized from the database's own combinations log: the logged crafts
+are replayed as POST / (a --miss-rate fraction is turned into unseen pairs so
+the LLM path is exercised), mixed with /api/graph, /api/distance and
+/api/user-materials reads for the same users.
+
+Reports p50/p95/p99 latency per endpoint and overall throughput. With
+--sizes, seeds one database per size and runs the same load against each
+(in a fresh process) to show how latency scales with DB size.
+
+Usage (from server/):
+    python bench/load_test.py --db bench/data/global-1m.db --requests 5000 --concurrency 16
+    python bench/load_test.py --sizes 10000,100000,1000000 --requests 3000
+    python bench/load_test.py --db global-copy.db --traffic recorded.jsonl --latency 0.6 --failure-rate 0.02
+"""
+import argparse
+import json
+import os
+import random
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from collections import defaultdict
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+# Share of synthesized requests per endpoint
+DEFAULT_MIX = {'combine': 0.6, 'graph': 0.15, 'distance': 0.15, 'user-materials': 0.1}
+
+
+def percentile(ordered: list[float], p: float) -> float:
+    if not ordered:
+        return 0.0
+    return ordered[min(len(ordered) - 1, int(round(p * (len(ordered) - 1))))]
+
+
+def synthesize_traffic(conn, count: int, mix: dict[str, float], miss_rate: float, rng: random.Random) -> list[dict]:
+    """Build a request list from the most recent `count` logged crafts"""
+    crafts = conn.execute(
+        'SELECT firstWord, secondWord, username FROM combinations ORDER BY id DESC LIMIT ?', (count,)
+    ).fetchall()
+    if not crafts:
+        crafts = [('Fire', 'Water', 'player1')]
+    materials = [row[0] for row in conn.execute('SELECT name FROM materials ORDER BY rowid DESC LIMIT 5000')]
+
+    kinds, weights = zip(*mix.items())
+    traffic = []
+    for i in range(count):
+        first, second, username = crafts[i % len(crafts)]
+        kind = rng.choices(kinds, weights)[0]
+        if kind == 'combine':
+            if rng.random() < miss_rate:
+                second = f'{second} {rng.randrange(10 ** 9)}'
+            traffic.append({'method': 'POST', 'path': '/', 'body': {'first': first, 'second': second, 'username': username}})
+        elif kind == 'graph':
+            traffic.append({'method': 'GET', 'path': f'/api/graph?username={username}'})
+        elif kind == 'distance':
+            others = rng.sample(materials, min(20, len(materials)))
+            traffic.append({'method': 'POST', 'path': '/api/distance', 'body': {'material': first, 'others': others}})
+        else:
+            traffic.append({'method': 'GET', 'path': f'/api/user-materials?username={username}'})
+    return traffic
+
+
+def load_traffic(path: str) -> list[dict]:
+    with open(path) as f:
+        return [json.loads(line) for line in f if line.strip()]
+
+
+def endpoint_of(entry: dict) -> str:
+    return f"{entry['method']} {entry['path'].split('?')[0]}"
+
+
+def replay(flask_app, traffic: list[dict], concurrency: int) -> tuple[dict[str, list[float]], dict[str, int], float]:
+    """Send every request from `concurrency` client threads; returns latencies, error counts and wall time"""
+    latencies: dict[str, list[float]] = defaultdict(list)
+    errors: dict[str, int] = defaultdict(int)
+    lock = threading.Lock()
+    next_index = iter(range(len(traffic)))
+
+    def client():
+        http = flask_app.test_client()
+        while True:
+            with lock:
+                i = next(next_index, None)
+            if i is None:
+                return
+            entry = traffic[i]
+            start = time.perf_counter()
+            if entry['method'] == 'POST':
+                response = http.post(entry['path'], json=entry.get('body'))
+            else:
+                response = http.get(entry['path'])
+            elapsed = time.perf_counter() - start
+            endpoint = endpoint_of(entry)
+            with lock:
+                latencies[endpoint].append(elapsed)
+                if response.status_code >= 400:
+                    errors[endpoint] += 1
+
+    threads = [threading.Thread(target=client) for _ in range(concurrency)]
+    started = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return latencies, errors, time.perf_counter() - started
+
+
+def run(args) -> dict:
+    import app
+    import llm_service
+    from bench.fake_cerebras import FakeAsyncCerebras
+
+    app.DB_PATH = args.db
+    llm_service.DB_PATH = args.db + '.no-cache'
+    app.init_db()
+    fake = FakeAsyncCerebras(
+        latency=args.latency, failure_rate=args.failure_rate, garbage_rate=args.garbage_rate, seed=args.seed
+    ).install()
+
+    rng = random.Random(args.seed)
+    if args.traffic:
+        traffic = load_traffic(args.traffic)[:args.requests]
+    else:
+        with app.get_db() as conn:
+            traffic = synthesize_traffic(conn, args.requests, DEFAULT_MIX, args.miss_rate, rng)
+
+    # Warm up lazy state (embedding matrix, graphs, model) outside the measurement
+    replay(app.app, traffic[:min(50, len(traffic))], 1)
+    latencies, errors, wall = replay(app.app, traffic, args.concurrency)
+    app.log_queue.shutdown()
+
+    with app.get_db() as conn:
+        combinations = conn.execute('SELECT MAX(id) FROM combinations').fetchone()[0] or 0
+    report = {
+        'db_bytes': os.path.getsize(args.db),
+        'combinations': combinations,
+        'requests': len(traffic),
+        'seconds': wall,
+        'throughput': len(traffic) / wall if wall else 0.0,
+        'llm': fake.stats(),
+        'endpoints': {},
+    }
+    for endpoint, samples in sorted(latencies.items()):
+        ordered = sorted(samples)
+        report['endpoints'][endpoint] = {
+            'count': len(ordered),
+            'errors': errors.get(endpoint, 0),
+            'p50_ms': percentile(ordered, 0.50) * 1000,
+            'p95_ms': percentile(ordered, 0.95) * 1000,
+            'p99_ms': percentile(ordered, 0.99) * 1000,
+        }
+    return report
+
+
+def print_report(report: dict):
+    print(f"DB: {report['combinations']} combinations, {report['db_bytes'] / 1e6:.1f} MB")
+    print(f"{report['requests']} requests in {report['seconds']:.1f}s: {report['throughput']:.0f} req/s "
+          f"(fake LLM calls {report['llm']['calls']}, failures {report['llm']['failures']}, garbage {report['llm']['garbage']})")
+    print(f"{'endpoint':<28}{'count':>8}{'errors':>8}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}")
+    for endpoint, row in report['endpoints'].items():
+        print(f"{endpoint:<28}{row['count']:>8}{row['errors']:>8}{row['p50_ms']:>10.1f}{row['p95_ms']:>10.1f}{row['p99_ms']:>10.1f}")
+
+
+def run_scaling(args):
+    """Seed a database per size and load-test each in its own process"""
+    sizes = [int(size) for size in args.sizes.split(',')]
+    passthrough = [
+        '--requests', str(args.requests), '--concurrency', str(args.concurrency), '--latency', str(args.latency),
+        '--failure-rate', str(args.failure_rate), '--garbage-rate', str(args.garbage_rate),
+        '--miss-rate', str(args.miss_rate), '--seed', str(args.seed), '--json',
+    ]
+    rows = []
+    with tempfile.TemporaryDirectory() as tmp:
+        for size in sizes:
+            path = os.path.join(tmp, f'global-{size}.db')
+            print(f"Seeding {size} combinations...")
+            subprocess.run([sys.executable, os.path.join(os.path.dirname(__file__), 'seed_db.py'), path,
+                            '--combinations', str(size), '--seed', str(args.seed)], check=True, stdout=subprocess.DEVNULL)
+            output = subprocess.run([sys.executable, __file__, '--db', path, *passthrough],
+                                    check=True, capture_output=True, text=True).stdout
+            rows.append((size, json.loads(output.strip().splitlines()[-1])))
+
+    endpoints = sorted({endpoint for _, report in rows for endpoint in report['endpoints']})
+    print(f"{'combinations':>14}{'MB':>9}{'req/s':>9}" + ''.join(f"{endpoint + ' p95':>32}" for endpoint in endpoints))
+    for size, report in rows:
+        cells = ''.join(f"{report['endpoints'].get(endpoint, {}).get('p95_ms', 0.0):>32.1f}" for endpoint in endpoints)
+        print(f"{size:>14}{report['db_bytes'] / 1e6:>9.1f}{report['throughput']:>9.0f}{cells}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Replay craft traffic against the app with a fake LLM')
+    parser.add_argument('--db', help='global.db to test against (use a copy; the run writes to it)')
+    parser.add_argument('--sizes', help='Comma-separated combination counts for a DB-size scaling run')
+    parser.add_argument('--traffic', help='Recorded JSONL traffic to replay instead of synthesizing it')
+    parser.add_argument('--requests', type=int, default=2000)
+    parser.add_argument('--concurrency', type=int, default=16)
+    parser.add_argument('--latency', type=float, default=0.3, help='Median fake LLM latency in seconds')
+    parser.add_argument('--failure-rate', type=float, default=0.0)
+    parser.add_argument('--garbage-rate', type=float, default=0.0)
+    parser.add_argument('--miss-rate', type=float, default=0.05, help='Share of synthesized crafts that are unseen pairs')
+    parser.add_argument('--seed', type=int, default=1)
+    parser.add_argument('--json', action='store_true', help='Print the report as one JSON line')
+    args = parser.parse_args()
+
+    if args.sizes:
+        run_scaling(args)
+        return
+    if not args.db:
+        parser.error('--db or --sizes is required')
+    report = run(args)
+    if args.json:
+        print(json.dumps(report))
+    else:
+        print_report(report)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,156 @@
+"""
+Synthetic data generator: seed a global.db with a realistic-looking crafting history.
+
+Players start from the base elements and combine materials they have already
+made. Popular materials are picked more often than obscure ones, most crafts
+repeat a known recipe, and a small fraction discover something new. Material
+embeddings are random vectors unless --real-embeddings is given.
+
+The database is created with init_db() and the usual migrations, so recipes,
+user_depths and material_embeddings are derived the same way as in production.
+
+Usage (from server/):
+    python bench/seed_db.py bench/data/global-1m.db --combinations 1000000 [--users 2000] [--seed 1]
+"""
+import argparse
+import os
+import random
+import sys
+import time
+from datetime import datetime, timedelta
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+import numpy as np
+
+from embedder import EMBEDDING_DIM
+from graph_cache import BASE_MATERIALS
+from bench.fake_cerebras import fake_material
+
+CHUNK = 50000
+BASE_EMOJIS = {'Fire': '🔥', 'Water': '💧', 'Earth': '🌍', 'Air': '💨'}
+
+
+def _generate(combinations: int, users: int, discovery_rate: float, rng: random.Random):
+    """Yield (materials, combinations) chunks; materials are (name, emoji, timestamp, discoverer)"""
+    names = list(BASE_MATERIALS)
+    emoji_of = dict(BASE_EMOJIS)
+    depth = dict.fromkeys(BASE_MATERIALS, 0)
+    recipes: dict[tuple[str, str], str] = {}
+    # Per user: lowest rank per material, plus the same names as a list to sample from
+    user_rank = [dict.fromkeys(BASE_MATERIALS, 0) for _ in range(users)]
+    user_known = [list(BASE_MATERIALS) for _ in range(users)]
+    start = datetime(2025, 1, 1)
+    materials, rows = [], []
+
+    for i in range(combinations):
+        user = rng.randrange(users)
+        known = user_rank[user]
+        # Mostly the player's own materials, skewed towards the oldest (most popular) ones
+        pool = names if rng.random() < 0.3 else user_known[user]
+        first = pool[int(len(pool) * rng.random() ** 2)]
+        second = pool[int(len(pool) * rng.random() ** 2)]
+        first, second = min(first, second), max(first, second)
+        timestamp = (start + timedelta(seconds=i * 3)).isoformat()
+
+        result_name = recipes.get((first, second))
+        is_discovery = False
+        if result_name is None:
+            if rng.random() < discovery_rate or len(names) < 64:
+                material = fake_material(first, second)
+                result_name = f"{material['name']} {len(names)}"
+                names.append(result_name)
+                emoji_of[result_name] = material['emoji']
+                depth[result_name] = max(depth[first], depth[second]) + 1
+                materials.append((result_name, material['emoji'], timestamp, f'user{user}'))
+                is_discovery = True
+            else:
+                result_name = names[rng.randrange(len(names))]
+            recipes[(first, second)] = result_name
+
+        rank = max(known.get(first, depth[first]), known.get(second, depth[second])) + 1
+        if result_name not in known:
+            user_known[user].append(result_name)
+            known[result_name] = rank
+        elif rank < known[result_name]:
+            known[result_name] = rank
+        rows.append((first, second, result_name, emoji_of[result_name], f'user{user}', timestamp, rank, is_discovery))
+
+        if len(rows) >= CHUNK:
+            yield materials, rows
+            materials, rows = [], []
+    yield materials, rows
+
+
+def seed(path: str, combinations: int, users: int = 1000, discovery_rate: float = 0.08,
+         seed: int = 1, real_embeddings: bool = False) -> dict:
+    """Create a database at `path` with synthetic history and return its row counts and size"""
+    import app
+    import llm_service
+    from migrations import backfill_recipes, rebuild_stats, rebuild_user_depths
+    from sqlite_vec import serialize_float32
+
+    app.DB_PATH = path
+    # Keep the legacy word_cache out of the synthetic recipes
+    llm_service.DB_PATH = path + '.no-cache'
+    app.init_db()
+
+    rng = random.Random(seed)
+    vectors = np.random.default_rng(seed)
+    started = time.perf_counter()
+    written = 0
+    with app.get_db() as conn:
+        for materials, rows in _generate(combinations, users, discovery_rate, rng):
+            if real_embeddings:
+                embeddings = app.embedder.embed_many([m[0] for m in materials])
+            else:
+                embeddings = vectors.standard_normal((len(materials), EMBEDDING_DIM), dtype=np.float32)
+            conn.executemany(
+                'INSERT OR IGNORE INTO materials (name, emoji, firstDiscoveredAt, discoverer, embedding) VALUES (?, ?, ?, ?, ?)',
+                [(*material, serialize_float32(embedding)) for material, embedding in zip(materials, embeddings)]
+            )
+            conn.executemany(
+                '''INSERT INTO combinations
+                   (firstWord, secondWord, resultName, resultEmoji, username, timestamp, perUserRank, isDiscovery)
+                   VALUES (?, ?, ?, ?, ?, ?, ?, ?)''',
+                rows
+            )
+            conn.commit()
+            written += len(rows)
+            print(f"  {written}/{combinations} combinations ({time.perf_counter() - started:.0f}s)")
+
+        print("Deriving recipes, user depths, stats and the vector index...")
+        backfill_recipes(conn)
+        rebuild_user_depths(conn)
+        rebuild_stats(conn)
+        app.backfill_material_embeddings(conn)
+        conn.commit()
+        conn.execute('ANALYZE')
+        counts = {
+            table: conn.execute(f'SELECT COUNT(*) FROM {table}').fetchone()[0]
+            for table in ('materials', 'combinations', 'recipes', 'user_depths')
+        }
+    counts['bytes'] = os.path.getsize(path)
+    return counts
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Seed a global.db with synthetic crafting history')
+    parser.add_argument('path', help='Database file to create')
+    parser.add_argument('--combinations', type=int, default=100000)
+    parser.add_argument('--users', type=int, default=1000)
+    parser.add_argument('--discovery-rate', type=float, default=0.08, help='Chance that an unseen pair makes a new material')
+    parser.add_argument('--seed', type=int, default=1)
+    parser.add_argument('--real-embeddings', action='store_true', help='Embed material names with the real model (slow)')
+    args = parser.parse_args()
+
+    if os.path.exists(args.path):
+        parser.error(f'{args.path} already exists')
+    os.makedirs(os.path.dirname(os.path.abspath(args.path)), exist_ok=True)
+    counts = seed(args.path, args.combinations, args.users, args.discovery_rate, args.seed, args.real_embeddings)
+    print(f"✓ {args.path}: {counts['materials']} materials, {counts['combinations']} combinations, "
+          f"{counts['recipes']} recipes, {counts['user_depths']} user depth rows, {counts['bytes'] / 1e6:.1f} MB")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,90 @@
+import threading
+from typing import Callable
+
+from logger import get_logger
+
+log = get_logger('changes')
+
+
+class ChangeWatcher:
+    """
+    Keeps per-process caches coherent across worker processes sharing one database.
+
+    Every write bumps a row in change_counters (via triggers), whichever
+    process made it. A background thread reads the counters every `interval`
+    seconds and calls the handlers registered for each counter that moved,
+    with its new version. The first poll only records the starting versions.
+    """
+
+    def __init__(self, read_versions: Callable[[], dict[str, int]], interval: float = 1.0):
+        self.read_versions = read_versions
+        self.interval = interval
+        self._handlers: dict[str, list[Callable[[int], None]]] = {}
+        self._versions: dict[str, int] | None = None
+        self._stop = threading.Event()
+        self._thread = None
+        self._lock = threading.Lock()
+        self.polls = 0
+        self.changes = 0
+        self.errors = 0
+
+    @property
+    def enabled(self) -> bool:
+        return self.interval > 0
+
+    def on_change(self, name: str, handler: Callable[[int], None]):
+        self._handlers.setdefault(name, []).append(handler)
+
+    def poll_once(self) -> list[str]:
+        """Read the counters and run handlers for those that moved; returns their names"""
+        versions = self.read_versions()
+        with self._lock:
+            self.polls += 1
+            previous, self._versions = self._versions, versions
+        if previous is None:
+            return []
+        changed = [name for name, version in versions.items() if previous.get(name) != version]
+        for name in changed:
+            for handler in self._handlers.get(name, ()):
+                try:
+                    handler(versions[name])
+                except Exception as e:
+                    log.error("Change handler for %s failed: %s", name, e)
+                    with self._lock:
+                        self.errors += 1
+        with self._lock:
+            self.changes += len(changed)
+        return changed
+
+    def start(self):
+        with self._lock:
+            if not self.enabled or self._thread is not None:
+                return
+            self._thread = threading.Thread(target=self._run, name='change-watcher', daemon=True)
+            self._thread.start()
+
+    def stop(self, timeout: float = 5.0):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(timeout)
+
+    def _run(self):
+        while True:
+            try:
+                self.poll_once()
+            except Exception as e:
+                log.error("Change poll failed: %s", e)
+                with self._lock:
+                    self.errors += 1
+            if self._stop.wait(self.interval):
+                return
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                'interval': self.interval,
+                'polls': self.polls,
+                'changes': self.changes,
+                'errors': self.errors,
+                'versions': dict(self._versions or {}),
+            }
@@ -0,0 +1,219 @@
+import os
+import queue
+import sqlite3
+import threading
+import time
+from contextlib import contextmanager
+from typing import Callable
+
+import sqlite_vec
+
+# Pragmas applied once to every pooled connection. WAL lets readers keep going
+# while the background logger holds the write lock; busy_timeout makes writers
+# wait for the lock instead of failing with "database is locked".
+PRAGMAS = (
+    'PRAGMA journal_mode = WAL',
+    'PRAGMA synchronous = NORMAL',
+    'PRAGMA busy_timeout = {busy_timeout_ms}',
+    'PRAGMA temp_store = MEMORY',
+    'PRAGMA cache_size = -16000',
+    'PRAGMA mmap_size = 268435456',
+)
+
+
+class ConnectionPool:
+    """
+    Hands out long-lived SQLite connections instead of reconnecting per query.
+
+    A thread checks out one connection with `with pool.connection() as conn:`.
+    Nested checkouts on the same thread reuse that connection, and only the
+    outermost block commits (or rolls back on error) and returns it to the pool.
+    Each connection keeps sqlite3's prepared statement cache warm across requests.
+    """
+
+    def __init__(self, path: str, max_connections: int = 8, busy_timeout_ms: int = 5000,
+                 cached_statements: int = 256, load_vec: bool = True, acquire_timeout: float = 30.0):
+        self.path = path
+        self.max_connections = max_connections
+        self.busy_timeout_ms = busy_timeout_ms
+        self.cached_statements = cached_statements
+        self.load_vec = load_vec
+        self.acquire_timeout = acquire_timeout
+
+        self._idle = queue.LifoQueue()
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self._created = 0
+        self._closed = False
+        self._stats = {
+            'checkouts': 0,
+            'hits': 0,
+            'misses': 0,
+            'waits': 0,
+            'wait_seconds_total': 0.0,
+            'wait_seconds_max': 0.0,
+            'reentrant': 0,
+        }
+
+    def _connect(self) -> sqlite3.Connection:
+        conn = sqlite3.connect(
+            self.path,
+            check_same_thread=False,
+            cached_statements=self.cached_statements,
+            timeout=self.busy_timeout_ms / 1000,
+        )
+        conn.row_factory = sqlite3.Row
+        if self.load_vec:
+            conn.enable_load_extension(True)
+            sqlite_vec.load(conn)
+            conn.enable_load_extension(False)
+        for pragma in PRAGMAS:
+            conn.execute(pragma.format(busy_timeout_ms=self.busy_timeout_ms))
+        return conn
+
+    def _acquire(self) -> sqlite3.Connection:
+        try:
+            conn = self._idle.get_nowait()
+            with self._lock:
+                self._stats['hits'] += 1
+            return conn
+        except queue.Empty:
+            pass
+
+        with self._lock:
+            if self._created < self.max_connections:
+                self._created += 1
+                self._stats['misses'] += 1
+                create = True
+            else:
+                create = False
+
+        if create:
+            try:
+                return self._connect()
+            except Exception:
+                with self._lock:
+                    self._created -= 1
+                raise
+
+        # Pool exhausted: wait for another thread to return a connection
+        start = time.perf_counter()
+        try:
+            conn = self._idle.get(timeout=self.acquire_timeout)
+        except queue.Empty:
+            raise TimeoutError(f'Timed out waiting for a database connection to {self.path}')
+        waited = time.perf_counter() - start
+        with self._lock:
+            self._stats['hits'] += 1
+            self._stats['waits'] += 1
+            self._stats['wait_seconds_total'] += waited
+            self._stats['wait_seconds_max'] = max(self._stats['wait_seconds_max'], waited)
+        return conn
+
+    def _release(self, conn: sqlite3.Connection):
+        if self._closed:
+            conn.close()
+            with self._lock:
+                self._created -= 1
+            return
+        self._idle.put(conn)
+
+    @contextmanager
+    def connection(self):
+        """Check out a connection for the current thread, committing on success."""
+        held = getattr(self._local, 'conn', None)
+        if held is not None:
+            with self._lock:
+                self._stats['reentrant'] += 1
+            yield held
+            return
+
+        conn = self._acquire()
+        with self._lock:
+            self._stats['checkouts'] += 1
+        self._local.conn = conn
+        self._local.after_commit = []
+        try:
+            yield conn
+            if conn.in_transaction:
+                conn.commit()
+        except BaseException:
+            if conn.in_transaction:
+                conn.rollback()
+            raise
+        else:
+            callbacks = self._local.after_commit
+        finally:
+            self._local.conn = None
+            self._local.after_commit = []
+            self._release(conn)
+        for callback in callbacks:
+            callback()
+
+    def after_commit(self, callback: Callable[[], None]):
+        """
+        Run `callback` once the current thread's outermost connection() block
+        has committed (it is dropped on rollback), or right away if no block is open.
+        Use it to invalidate in-memory state that must not see uncommitted rows.
+        """
+        if getattr(self._local, 'conn', None) is None:
+            callback()
+        else:
+            self._local.after_commit.append(callback)
+
+    def stats(self) -> dict:
+        """Snapshot of pool usage counters"""
+        with self._lock:
+            stats = dict(self._stats)
+            stats['connections_open'] = self._created
+        stats['connections_idle'] = self._idle.qsize()
+        stats['connections_in_use'] = stats['connections_open'] - stats['connections_idle']
+        acquired = stats['hits'] + stats['misses']
+        stats['hit_rate'] = stats['hits'] / acquired if acquired else 0.0
+        stats['wait_seconds_avg'] = stats['wait_seconds_total'] / stats['waits'] if stats['waits'] else 0.0
+        return stats
+
+    def close(self):
+        """Close all idle connections; connections still checked out close on release."""
+        self._closed = True
+        while True:
+            try:
+                conn = self._idle.get_nowait()
+            except queue.Empty:
+                break
+            conn.close()
+            with self._lock:
+                self._created -= 1
+
+
+_pools: dict[str, ConnectionPool] = {}
+_pools_lock = threading.Lock()
+
+
+def get_pool(path: str, **kwargs) -> ConnectionPool:
+    """Return the process-wide pool for a database file, creating it on first use."""
+    with _pools_lock:
+        pool = _pools.get(path)
+        if pool is None:
+            kwargs.setdefault('max_connections', int(os.environ.get('DB_POOL_SIZE', 8)))
+            kwargs.setdefault('busy_timeout_ms', int(os.environ.get('DB_BUSY_TIMEOUT_MS', 5000)))
+            pool = ConnectionPool(path, **kwargs)
+            _pools[path] = pool
+        return pool
+
+
+def _forget_pools_after_fork():
+    # SQLite connections must not be used across fork(); a forked child opens its own
+    global _pools, _pools_lock
+    _pools = {}
+    _pools_lock = threading.Lock()
+
+
+os.register_at_fork(after_in_child=_forget_pools_after_fork)
+
+
+def all_pool_stats() -> dict:
+    """Stats for every pool opened by this process, keyed by database file name."""
+    with _pools_lock:
+        pools = list(_pools.values())
+    return {os.path.basename(pool.path): pool.stats() for pool in pools}
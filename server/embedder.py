@@ -0,0 +1,175 @@
+import multiprocessing
+import queue
+import threading
+import time
+from concurrent.futures import Future, ProcessPoolExecutor
+from typing import TYPE_CHECKING
+
+import numpy as np
+
+from metrics import STAGE_SECONDS
+
+if TYPE_CHECKING:
+    from sentence_transformers import SentenceTransformer
+
+MODEL_NAME = 'sentence-transformers/all-MiniLM-L6-v2'
+EMBEDDING_DIM = 384
+
+# The model loaded in each encoder process (see EmbeddingService `processes`)
+_process_model = None
+
+
+def _load_process_model(model_name: str):
+    global _process_model
+    from sentence_transformers import SentenceTransformer
+    _process_model = SentenceTransformer(model_name)
+
+
+def _encode_in_process(texts: list[str]) -> np.ndarray:
+    embeddings = _process_model.encode(texts, batch_size=len(texts), convert_to_tensor=False)
+    return np.asarray(embeddings, dtype=np.float32)
+
+
+class EmbeddingService:
+    """
+    Micro-batching front end for the SentenceTransformer model.
+
+    Callers submit single strings and get a Future back. One worker thread
+    collects pending strings for up to `max_wait` seconds (or until
+    `batch_size` are waiting), encodes them with a single encode() call and
+    resolves each caller's future with its row of the result.
+
+    With `processes` > 0 the model lives in that many spawned encoder
+    processes instead, so CPU-heavy encodes don't hold this process's GIL.
+    """
+
+    def __init__(self, model_name: str = MODEL_NAME, batch_size: int = 32, max_wait: float = 0.01, processes: int = 0):
+        self.model_name = model_name
+        self.batch_size = batch_size
+        self.max_wait = max_wait
+        self.processes = processes
+        self._model = None
+        self._model_lock = threading.Lock()
+        self._executor = None
+        self._pending: queue.Queue[tuple[str, Future]] = queue.Queue()
+        self._worker = None
+        self._worker_lock = threading.Lock()
+        self._stats_lock = threading.Lock()
+        self.batches = 0
+        self.items = 0
+        self.encode_seconds_total = 0.0
+
+    def get_model(self) -> 'SentenceTransformer':
+        """
+        Lazy load the embedding model. sentence_transformers (and torch) are
+        imported here rather than at module import, so processes that never
+        embed anything don't pay for them.
+        """
+        if self._model is None:
+            with self._model_lock:
+                if self._model is None:
+                    from sentence_transformers import SentenceTransformer
+                    self._model = SentenceTransformer(self.model_name)
+        return self._model
+
+    def _get_executor(self) -> ProcessPoolExecutor:
+        if self._executor is None:
+            with self._model_lock:
+                if self._executor is None:
+                    # Spawn, not fork: this process already runs threads
+                    self._executor = ProcessPoolExecutor(
+                        max_workers=self.processes,
+                        mp_context=multiprocessing.get_context('spawn'),
+                        initializer=_load_process_model,
+                        initargs=(self.model_name,),
+                    )
+        return self._executor
+
+    def _encode(self, texts: list[str]) -> np.ndarray:
+        if self.processes > 0:
+            return self._get_executor().submit(_encode_in_process, texts).result()
+        embeddings = self.get_model().encode(texts, batch_size=len(texts), convert_to_tensor=False)
+        return np.asarray(embeddings, dtype=np.float32)
+
+    def warm(self, batch: tuple[str, ...] = ('Fire', 'Water', 'Earth', 'Air')):
+        """Load the model and encode a throwaway batch, so the first real encode runs at full speed"""
+        self._encode(list(batch))
+
+    def shutdown(self):
+        if self._executor is not None:
+            self._executor.shutdown(wait=False, cancel_futures=True)
+
+    def encode_batch(self, texts: list[str]) -> np.ndarray:
+        """Encode a list of strings with one model call, bypassing the micro-batcher"""
+        if not texts:
+            return np.zeros((0, EMBEDDING_DIM), dtype=np.float32)
+        start = time.perf_counter()
+        embeddings = self._encode(texts)
+        elapsed = time.perf_counter() - start
+        STAGE_SECONDS.observe(elapsed, 'embedding_encode')
+        with self._stats_lock:
+            self.batches += 1
+            self.items += len(texts)
+            self.encode_seconds_total += elapsed
+        return embeddings
+
+    def submit(self, text: str) -> Future:
+        """Queue a string for the next micro-batch"""
+        if self._worker is None:
+            self._start()
+        future = Future()
+        self._pending.put((text, future))
+        return future
+
+    def embed(self, text: str) -> np.ndarray:
+        return self.submit(text).result()
+
+    def embed_many(self, texts: list[str]) -> list[np.ndarray]:
+        """Submit several strings at once so they share micro-batches"""
+        futures = [self.submit(text) for text in texts]
+        return [future.result() for future in futures]
+
+    def _start(self):
+        with self._worker_lock:
+            if self._worker is None:
+                self._worker = threading.Thread(target=self._run, name='embedding-batcher', daemon=True)
+                self._worker.start()
+
+    def _next_batch(self) -> list[tuple[str, Future]]:
+        batch = [self._pending.get()]
+        deadline = time.monotonic() + self.max_wait
+        while len(batch) < self.batch_size:
+            remaining = deadline - time.monotonic()
+            try:
+                batch.append(self._pending.get(timeout=remaining) if remaining > 0 else self._pending.get_nowait())
+            except queue.Empty:
+                break
+        return batch
+
+    def _run(self):
+        while True:
+            batch = self._next_batch()
+            # Identical strings in one batch are encoded once
+            unique_texts = list(dict.fromkeys(text for text, _ in batch))
+            try:
+                embeddings = self.encode_batch(unique_texts)
+            except Exception as e:
+                for _, future in batch:
+                    future.set_exception(e)
+                continue
+            rows = dict(zip(unique_texts, embeddings))
+            for text, future in batch:
+                future.set_result(rows[text])
+
+    def stats(self) -> dict:
+        with self._stats_lock:
+            return {
+                'pending': self._pending.qsize(),
+                'processes': self.processes,
+                'batch_size': self.batch_size,
+                'max_wait': self.max_wait,
+                'batches': self.batches,
+                'items': self.items,
+                'avg_batch_size': self.items / self.batches if self.batches else 0.0,
+                'encode_seconds_total': self.encode_seconds_total,
+            }
@@ -0,0 +1,121 @@
+import threading
+from typing import Callable, Optional
+
+import numpy as np
+
+from embedder import EMBEDDING_DIM
+
+
+class EmbeddingMatrix:
+    """
+    Memory-resident, pre-normalized float32 matrix of material embeddings.
+
+    Rows are unit vectors, so cosine similarity is a plain dot product and a
+    one-to-many or many-pair comparison is a single matrix product. The matrix
+    grows by doubling its capacity as materials are added, and `index` maps
+    each material name to its row.
+    """
+
+    def __init__(self, dim: int = EMBEDDING_DIM, capacity: int = 1024):
+        self.dim = dim
+        self._matrix = np.zeros((capacity, dim), dtype=np.float32)
+        self.names: list[str] = []
+        self.index: dict[str, int] = {}
+        self.last_rowid = 0
+        self.loaded = False
+        self._lock = threading.RLock()
+
+    def __len__(self):
+        return len(self.names)
+
+    def __contains__(self, name: str):
+        return name in self.index
+
+    @staticmethod
+    def _normalize(vectors: np.ndarray) -> np.ndarray:
+        norms = np.linalg.norm(vectors, axis=-1, keepdims=True)
+        norms[norms == 0] = 1.0
+        return vectors / norms
+
+    def add(self, name: str, embedding, rowid: Optional[int] = None):
+        """Add or replace one material's embedding"""
+        self.add_many([name], np.asarray(embedding, dtype=np.float32).reshape(1, -1), rowid)
+
+    def add_many(self, names: list[str], embeddings: np.ndarray, last_rowid: Optional[int] = None):
+        vectors = self._normalize(np.asarray(embeddings, dtype=np.float32).reshape(len(names), self.dim))
+        with self._lock:
+            for name, vector in zip(names, vectors):
+                row = self.index.get(name)
+                if row is None:
+                    row = len(self.names)
+                    if row == self._matrix.shape[0]:
+                        grown = np.zeros((row * 2, self.dim), dtype=np.float32)
+                        grown[:row] = self._matrix[:row]
+                        self._matrix = grown
+                    self.names.append(name)
+                    self.index[name] = row
+                self._matrix[row] = vector
+            if last_rowid is not None:
+                self.last_rowid = max(self.last_rowid, last_rowid)
+
+    def load_rows(self, rows):
+        """Add (rowid, name, embedding BLOB) rows read from the materials table"""
+        rows = [row for row in rows if row[2]]
+        if not rows:
+            return
+        embeddings = np.stack([np.frombuffer(row[2], dtype=np.float32) for row in rows])
+        self.add_many([row[1] for row in rows], embeddings, last_rowid=rows[-1][0])
+
+    def vector(self, name: str) -> Optional[np.ndarray]:
+        with self._lock:
+            row = self.index.get(name)
+            return None if row is None else self._matrix[row].copy()
+
+    def unit_vectors(self, names: list[str], embed_many: Callable[[list[str]], list]) -> list[np.ndarray]:
+        """Unit vectors for `names`, read from the matrix or (for names it doesn't hold) encoded with `embed_many`"""
+        vectors = [self.vector(name) for name in names]
+        unknown = list(dict.fromkeys(name for name, vector in zip(names, vectors) if vector is None))
+        if unknown:
+            embedded = dict(zip(unknown, self._normalize(np.asarray(embed_many(unknown), dtype=np.float32))))
+            vectors = [embedded[name] if vector is None else vector for name, vector in zip(names, vectors)]
+        return vectors
+
+    def rows_for(self, names: list[str]) -> list[Optional[int]]:
+        with self._lock:
+            return [self.index.get(name) for name in names]
+
+    def similarity(self, first: str, second: str) -> Optional[float]:
+        with self._lock:
+            a, b = self.index.get(first), self.index.get(second)
+            if a is None or b is None:
+                return None
+            return float(self._matrix[a] @ self._matrix[b])
+
+    def pairwise(self, pairs: list[tuple[str, str]]) -> list[Optional[float]]:
+        """Cosine similarity for many (a, b) pairs with one vectorized row-wise dot product"""
+        with self._lock:
+            rows = [(self.index.get(a), self.index.get(b)) for a, b in pairs]
+            known = [i for i, (a, b) in enumerate(rows) if a is not None and b is not None]
+            results: list[Optional[float]] = [None] * len(pairs)
+            if known:
+                left = self._matrix[[rows[i][0] for i in known]]
+                right = self._matrix[[rows[i][1] for i in known]]
+                scores = np.einsum('ij,ij->i', left, right)
+                for i, score in zip(known, scores):
+                    results[i] = float(score)
+            return results
+
+    def one_to_many(self, name: str, others: list[str]) -> list[Optional[float]]:
+        """Cosine similarity of one material against many with a single matrix-vector product"""
+        with self._lock:
+            row = self.index.get(name)
+            if row is None:
+                return [None] * len(others)
+            rows = [self.index.get(other) for other in others]
+            known = [i for i, r in enumerate(rows) if r is not None]
+            results: list[Optional[float]] = [None] * len(others)
+            if known:
+                scores = self._matrix[[rows[i] for i in known]] @ self._matrix[row]
+                for i, score in zip(known, scores):
+                    results[i] = float(score)
+            return results
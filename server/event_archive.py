@@ -0,0 +1,311 @@
+import os
+import sqlite3
+import threading
+from datetime import datetime, timedelta
+from typing import Callable, Iterator, Optional
+
+import numpy as np
+
+from logger import get_logger
+
+log = get_logger('archive')
+
+# One fixed-width record per archived combination; names are interned_names ids
+EVENT_DTYPE = np.dtype([
+    ('id', '<i8'),
+    ('username', '<i4'),
+    ('firstWord', '<i4'),
+    ('secondWord', '<i4'),
+    ('resultName', '<i4'),
+    ('resultEmoji', '<i4'),
+    ('timestamp', '<i8'),  # microseconds since 1970-01-01, naive local time like the log
+    ('perUserRank', '<i4'),
+    ('isDiscovery', 'u1'),
+])
+NO_RANK = -1
+NO_TIMESTAMP = np.iinfo(np.int64).min
+_EPOCH = datetime(1970, 1, 1)
+_MICROSECOND = timedelta(microseconds=1)
+
+
+def _to_micros(timestamp) -> int:
+    try:
+        moment = datetime.fromisoformat(str(timestamp))
+    except ValueError:
+        return NO_TIMESTAMP
+    if moment.tzinfo is not None:
+        moment = moment.astimezone().replace(tzinfo=None)
+    return (moment - _EPOCH) // _MICROSECOND
+
+
+def _from_micros(micros: int) -> Optional[str]:
+    if micros == NO_TIMESTAMP:
+        return None
+    return (_EPOCH + micros * _MICROSECOND).isoformat()
+
+
+def size_report(conn) -> dict:
+    """Database file size, space in use, row counts and, where SQLite has dbstat, bytes per table and index"""
+    page_size = conn.execute('PRAGMA page_size').fetchone()[0]
+    page_count = conn.execute('PRAGMA page_count').fetchone()[0]
+    free_pages = conn.execute('PRAGMA freelist_count').fetchone()[0]
+    report = {
+        'file_bytes': page_size * page_count,
+        'used_bytes': page_size * (page_count - free_pages),
+        'rows': {
+            table: conn.execute(f'SELECT COUNT(*) FROM {table}').fetchone()[0]
+            for table in ('combinations', 'combination_rollups', 'interned_names')
+        },
+        'archive_bytes': conn.execute('SELECT COALESCE(SUM(bytes), 0) FROM event_archives').fetchone()[0],
+    }
+    try:
+        report['objects'] = {
+            row[0]: row[1] for row in conn.execute('SELECT name, SUM(pgsize) FROM dbstat GROUP BY name ORDER BY 2 DESC')
+        }
+    except sqlite3.OperationalError:
+        pass  # SQLite built without SQLITE_ENABLE_DBSTAT_VTAB
+    return report
+
+
+class EventArchive:
+    """
+    Cold storage for the combinations log.
+
+    compact() moves events logged before a cutoff out of the combinations
+    table. Each one is folded into combination_rollups (one row per user,
+    inputs, result and emoji, with a count and the aggregates user_depths and
+    the stats tables are rebuilt from), and written as a fixed-width record to
+    an .npy segment file in `get_directory()`. Material names, emojis and
+    usernames are stored once, in interned_names, and referenced by id.
+
+    Segments are never modified after they are written and are read through
+    memory maps, so replaying archived events (graph builds, events()) only
+    pages in what it touches.
+    """
+
+    def __init__(self, get_db: Callable, get_directory: Callable[[], str]):
+        self.get_db = get_db
+        self.get_directory = get_directory
+        self._names: list[Optional[str]] = [None]  # interned id -> name
+        self._ids: dict[str, int] = {}
+        self._segments: dict[str, np.ndarray] = {}
+        self._lock = threading.Lock()
+        self.replayed = 0
+        self.compacted = 0
+
+    def _sync_names(self, conn):
+        # Caller holds self._lock; interned ids only grow, so read the new ones
+        rows = conn.execute('SELECT id, name FROM interned_names WHERE id >= ? ORDER BY id', (len(self._names),)).fetchall()
+        for row in rows:
+            self._names.extend([None] * (row[0] - len(self._names) + 1))
+            self._names[row[0]] = row[1]
+            self._ids[row[1]] = row[0]
+
+    def _intern(self, conn, names: set[str]) -> dict[str, int]:
+        """Ids for `names`, adding the ones not yet interned"""
+        ids = {}
+        names = list(names)
+        for attempt in range(2):
+            missing = [name for name in names if name not in ids]
+            for i in range(0, len(missing), 500):
+                chunk = missing[i:i + 500]
+                placeholders = ','.join(['?'] * len(chunk))
+                for row in conn.execute(f'SELECT id, name FROM interned_names WHERE name IN ({placeholders})', chunk):
+                    ids[row[1]] = row[0]
+            if attempt == 0:
+                conn.executemany('INSERT OR IGNORE INTO interned_names (name) VALUES (?)',
+                                 [(name,) for name in names if name not in ids])
+        return ids
+
+    def segments(self, after_id: int = 0) -> list[dict]:
+        """Archive segments holding events with ids above `after_id`, oldest first"""
+        with self.get_db() as conn:
+            rows = conn.execute(
+                'SELECT path, firstId, lastId, events, bytes FROM event_archives WHERE lastId > ? ORDER BY firstId', (after_id,)
+            ).fetchall()
+        return [dict(row) for row in rows]
+
+    def load(self, path: str) -> np.ndarray:
+        """A segment's records, memory-mapped read-only"""
+        with self._lock:
+            records = self._segments.get(path)
+            if records is None:
+                records = np.load(os.path.join(self.get_directory(), path), mmap_mode='r')
+                self._segments[path] = records
+        return records
+
+    def _select(self, username: Optional[str], after_id: int, material: Optional[str] = None):
+        """Yield (records, names) for each segment's events matching the filters"""
+        segments = self.segments(after_id)
+        if not segments:
+            return
+        with self._lock, self.get_db() as conn:
+            self._sync_names(conn)
+            names = self._names
+            user_id = self._ids.get(username) if username else None
+            material_id = self._ids.get(material) if material else None
+        if (username and user_id is None) or (material and material_id is None):
+            return
+        for segment in segments:
+            records = self.load(segment['path'])
+            mask = records['id'] > after_id
+            if user_id is not None:
+                mask &= records['username'] == user_id
+            if material_id is not None:
+                mask &= ((records['firstWord'] == material_id) | (records['secondWord'] == material_id)
+                         | (records['resultName'] == material_id))
+            yield records[mask], names
+
+    def graph_rows(self, username: Optional[str] = None, after_id: int = 0) -> list[tuple[int, str, str, str, str]]:
+        """Archived (id, firstWord, secondWord, resultName, resultEmoji) rows after `after_id`, in id order"""
+        rows = []
+        for records, names in self._select(username, after_id):
+            rows.extend(
+                (combination_id, names[first], names[second], names[result], names[emoji])
+                for combination_id, first, second, result, emoji in zip(
+                    records['id'].tolist(), records['firstWord'].tolist(), records['secondWord'].tolist(),
+                    records['resultName'].tolist(), records['resultEmoji'].tolist(),
+                )
+            )
+        with self._lock:
+            self.replayed += len(rows)
+        return rows
+
+    def events(self, username: Optional[str] = None, material: Optional[str] = None,
+               limit: Optional[int] = None) -> Iterator[dict]:
+        """Archived events as combinations rows, oldest first, optionally for one user or involving one material"""
+        emitted = 0
+        for records, names in self._select(username, 0, material):
+            for record in records.tolist():
+                if limit is not None and emitted >= limit:
+                    return
+                combination_id, user, first, second, result, emoji, micros, rank, discovery = record
+                yield {
+                    'id': combination_id, 'firstWord': names[first], 'secondWord': names[second],
+                    'resultName': names[result], 'resultEmoji': names[emoji], 'username': names[user],
+                    'timestamp': _from_micros(micros), 'perUserRank': None if rank == NO_RANK else rank,
+                    'isDiscovery': bool(discovery),
+                }
+                emitted += 1
+
+    def compact(self, cutoff: str, batch_size: int = 50000, vacuum: bool = False) -> dict:
+        """
+        Archive and roll up every combination logged before `cutoff` (an ISO
+        timestamp, truncated to the hour), `batch_size` events per transaction.
+        Only events older than the oldest one at or after the cutoff are moved,
+        so the archive and the live table never interleave ids. Returns the
+        size report before and after.
+        """
+        # Whole hours only, so rebuild_stats() can recompute hourly_stats from the live log after the cutoff
+        cutoff = cutoff[:13]
+        with self.get_db() as conn:
+            before = size_report(conn)
+            boundary = conn.execute('SELECT MIN(id) FROM combinations WHERE timestamp >= ?', (cutoff,)).fetchone()[0]
+            if boundary is None:
+                boundary = (conn.execute('SELECT MAX(id) FROM combinations').fetchone()[0] or 0) + 1
+
+        moved = segments = 0
+        while True:
+            with self.get_db() as conn:
+                rows = conn.execute(
+                    '''SELECT id, firstWord, secondWord, resultName, resultEmoji, username, timestamp, perUserRank, isDiscovery
+                       FROM combinations WHERE id < ? ORDER BY id LIMIT ?''',
+                    (boundary, batch_size)
+                ).fetchall()
+                if not rows:
+                    break
+                ids = self._intern(conn, {
+                    name for row in rows
+                    for name in (row['username'], row['firstWord'], row['secondWord'], row['resultName'], row['resultEmoji'])
+                })
+                self._roll_up(conn, rows, ids)
+                self._archive(conn, rows, ids)
+                conn.execute('DELETE FROM combinations WHERE id BETWEEN ? AND ?', (rows[0]['id'], rows[-1]['id']))
+            moved += len(rows)
+            segments += 1
+            log.info("Compacted %d combinations up to id %d", moved, rows[-1]['id'])
+
+        if vacuum and moved:
+            with self.get_db() as conn:
+                conn.execute('VACUUM')
+        with self.get_db() as conn:
+            after = size_report(conn)
+            conn.execute(
+                'INSERT INTO compactions (ranAt, cutoff, events, usedBytesBefore, usedBytesAfter, archiveBytes) VALUES (?, ?, ?, ?, ?, ?)',
+                (datetime.now().isoformat(), cutoff, moved, before['used_bytes'], after['used_bytes'], after['archive_bytes'])
+            )
+        with self._lock:
+            self.compacted += moved
+        return {'cutoff': cutoff, 'events': moved, 'segments': segments,
+                'before': before, 'after': after}
+
+    def _roll_up(self, conn, rows: list, ids: dict[str, int]):
+        """Fold rows into combination_rollups, one row per (user, result, inputs, emoji)"""
+        groups: dict[tuple, dict] = {}
+        for row in rows:
+            key = (ids[row['username']], ids[row['resultName']], ids[row['firstWord']],
+                   ids[row['secondWord']], ids[row['resultEmoji']])
+            rank = row['perUserRank']
+            group = groups.get(key)
+            if group is None:
+                groups[key] = {'id': row['id'], 'count': 1, 'discoveries': int(bool(row['isDiscovery'])),
+                               'minRank': rank, 'maxRank': rank, 'firstAt': row['timestamp'],
+                               'lastAt': row['timestamp'], 'lastId': row['id']}
+                continue
+            group['count'] += 1
+            group['discoveries'] += int(bool(row['isDiscovery']))
+            if rank is not None:
+                group['minRank'] = rank if group['minRank'] is None else min(group['minRank'], rank)
+                group['maxRank'] = rank if group['maxRank'] is None else max(group['maxRank'], rank)
+            group['lastAt'] = max(group['lastAt'], row['timestamp'])
+            group['lastId'] = row['id']
+
+        # min()/max() of NULL is NULL in SQLite, so fall back to whichever side has a rank
+        conn.executemany(
+            '''INSERT INTO combination_rollups
+                   (id, usernameId, resultNameId, firstWordId, secondWordId, resultEmojiId,
+                    count, discoveries, minRank, maxRank, firstAt, lastAt, lastId)
+               VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+               ON CONFLICT (usernameId, resultNameId, firstWordId, secondWordId, resultEmojiId) DO UPDATE SET
+                   count = count + excluded.count,
+                   discoveries = discoveries + excluded.discoveries,
+                   minRank = COALESCE(MIN(minRank, excluded.minRank), minRank, excluded.minRank),
+                   maxRank = COALESCE(MAX(maxRank, excluded.maxRank), maxRank, excluded.maxRank),
+                   lastAt = MAX(lastAt, excluded.lastAt),
+                   lastId = excluded.lastId''',
+            [(group['id'], *key, group['count'], group['discoveries'], group['minRank'], group['maxRank'],
+              group['firstAt'], group['lastAt'], group['lastId']) for key, group in groups.items()]
+        )
+
+    def _archive(self, conn, rows: list, ids: dict[str, int]):
+        """Write rows to a new segment file and record it"""
+        records = np.array([
+            (row['id'], ids[row['username']], ids[row['firstWord']], ids[row['secondWord']], ids[row['resultName']],
+             ids[row['resultEmoji']], _to_micros(row['timestamp']),
+             NO_RANK if row['perUserRank'] is None else row['perUserRank'], int(bool(row['isDiscovery'])))
+            for row in rows
+        ], dtype=EVENT_DTYPE)
+
+        directory = self.get_directory()
+        os.makedirs(directory, exist_ok=True)
+        path = f'combinations-{rows[0]["id"]:012d}-{rows[-1]["id"]:012d}.npy'
+        # Written under a temporary name first, so a crash never leaves a truncated segment
+        temporary = os.path.join(directory, path + '.tmp')
+        with open(temporary, 'wb') as f:
+            np.save(f, records)
+        os.replace(temporary, os.path.join(directory, path))
+        conn.execute(
+            '''INSERT INTO event_archives (path, firstId, lastId, events, bytes, createdAt) VALUES (?, ?, ?, ?, ?, ?)
+               ON CONFLICT (path) DO UPDATE SET events = excluded.events, bytes = excluded.bytes, createdAt = excluded.createdAt''',
+            (path, rows[0]['id'], rows[-1]['id'], len(rows), os.path.getsize(os.path.join(directory, path)),
+             datetime.now().isoformat())
+        )
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                'segments_loaded': len(self._segments),
+                'interned_names': len(self._ids),
+                'replayed': self.replayed,
+                'compacted': self.compacted,
+            }
@@ -0,0 +1,101 @@
+import threading
+from typing import Callable
+
+import numpy as np
+
+from embedding_index import EmbeddingMatrix
+from llm_service import consistent_order
+from recipe_cache import RecipeCache
+
+Example = tuple[str, str, str, str]  # (firstWord, secondWord, resultName, resultEmoji)
+
+
+class FewShotSelector:
+    """
+    Picks the k known recipes most similar to an incoming pair as few-shot examples.
+
+    A pair is represented by the normalized sum of its two input embeddings.
+    Candidates are recipes that use one of the nearest materials to either
+    input (sqlite-vec KNN on material_embeddings); they are ranked by the
+    cosine similarity of their pair vector to the incoming one. Selections
+    are cached per ordered pair.
+    """
+
+    def __init__(self, get_db: Callable, get_matrix: Callable[[tuple], EmbeddingMatrix],
+                 embed_many: Callable[[list[str]], list], find_similar: Callable[..., list[dict]],
+                 k: int = 4, neighbours: int = 16, max_candidates: int = 400,
+                 cache_size: int = 2048, cache_ttl: float = 600):
+        self.get_db = get_db
+        self.get_matrix = get_matrix
+        self.embed_many = embed_many
+        self.find_similar = find_similar
+        self.k = k
+        self.neighbours = neighbours
+        self.max_candidates = max_candidates
+        self.cache = RecipeCache(maxsize=cache_size, ttl=cache_ttl)
+        self._lock = threading.Lock()
+        self.selections = 0
+        self.empty = 0
+        self.candidates_total = 0
+
+    def _input_vectors(self, words: tuple[str, str]) -> list[np.ndarray]:
+        return self.get_matrix(()).unit_vectors(list(words), self.embed_many)
+
+    def _candidates(self, vectors: list[np.ndarray], words: tuple[str, str]) -> list[Example]:
+        names = set(words)
+        for vector in vectors:
+            names.update(row['name'] for row in self.find_similar(vector, k=self.neighbours))
+        names = list(names)
+        placeholders = ','.join(['?'] * len(names))
+        with self.get_db() as conn:
+            rows = conn.execute(
+                f'''SELECT firstWord, secondWord, resultName, resultEmoji FROM recipes
+                    WHERE firstWord IN ({placeholders}) OR secondWord IN ({placeholders})
+                    LIMIT ?''',
+                (*names, *names, self.max_candidates)
+            ).fetchall()
+        return [tuple(row) for row in rows if (row[0], row[1]) != words]
+
+    def select(self, first_word: str, second_word: str) -> list[Example]:
+        words = consistent_order(first_word, second_word)
+        cached = self.cache.get(*words)
+        if cached is not None:
+            return cached['examples']
+
+        vectors = self._input_vectors(words)
+        query = vectors[0] + vectors[1]
+        query /= np.linalg.norm(query) or 1.0
+        candidates = self._candidates(vectors, words)
+
+        # Score candidates by their own pair vector, using the in-memory matrix
+        matrix = self.get_matrix(tuple({name for candidate in candidates for name in candidate[:2]}))
+        scored = []
+        for candidate in candidates:
+            first_vector, second_vector = matrix.vector(candidate[0]), matrix.vector(candidate[1])
+            if first_vector is None or second_vector is None:
+                continue
+            pair_vector = first_vector + second_vector
+            score = float(pair_vector @ query) / (np.linalg.norm(pair_vector) or 1.0)
+            scored.append((score, candidate))
+        scored.sort(key=lambda item: item[0], reverse=True)
+        examples = [candidate for _, candidate in scored[:self.k]]
+
+        with self._lock:
+            self.selections += 1
+            self.candidates_total += len(candidates)
+            if not examples:
+                self.empty += 1
+        self.cache.put(*words, {'examples': examples})
+        return examples
+
+    def stats(self) -> dict:
+        cache = self.cache.stats()
+        with self._lock:
+            return {
+                'k': self.k,
+                'selections': self.selections,
+                'empty': self.empty,
+                'avg_candidates': self.candidates_total / self.selections if self.selections else 0.0,
+                'cache_hits': cache['hits'],
+                'cache_size': cache['size'],
+            }
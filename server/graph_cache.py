@@ -0,0 +1,193 @@
+import threading
+from collections import OrderedDict
+from typing import Callable, Iterable, Optional
+
+from metrics import time_stage
+
+BASE_MATERIALS = ['Fire', 'Water', 'Earth', 'Air']
+UNKNOWN_EMOJI = '❓'
+
+
+class Graph:
+    """
+    Nodes and edges built from combination rows, in the order they were logged.
+
+    `cursor` is the id of the last combinations row applied. Every node and edge
+    remembers the cursor at which it appeared, so a client holding an older
+    cursor can be sent just what is new.
+    """
+
+    def __init__(self):
+        self.nodes: dict[str, tuple[str, int]] = {}  # name -> (emoji, cursor first seen)
+        self.ids: dict[str, int] = {}  # name -> position in `nodes`, the integer id used by columnar snapshots
+        self.edges: list[tuple[int, str, str, str]] = []  # (combination id, from1, from2, to)
+        self.cursor = 0
+        self.synced_epoch = -1
+        self.lock = threading.Lock()
+
+    def apply(self, rows: list, emojis: dict[str, str]):
+        """
+        Apply (id, firstWord, secondWord, resultName, resultEmoji) rows newer than the cursor.
+        `emojis` maps names to their materials-table emoji. A name with no material
+        falls back to the row's resultEmoji when it first appears as a result, or to ❓.
+        """
+        for combination_id, first_word, second_word, result_name, result_emoji in rows:
+            if combination_id <= self.cursor:
+                continue
+            for name in (first_word, second_word):
+                if name not in self.nodes:
+                    self.add_node(name, emojis.get(name) or UNKNOWN_EMOJI, combination_id)
+            if result_name not in self.nodes:
+                self.add_node(result_name, emojis.get(result_name) or result_emoji, combination_id)
+            self.edges.append((combination_id, first_word, second_word, result_name))
+            self.cursor = combination_id
+
+    def add_node(self, name: str, emoji: str, cursor: int):
+        self.ids[name] = len(self.nodes)
+        self.nodes[name] = (emoji, cursor)
+
+    def _select(self, since: Optional[int]) -> tuple[list, list]:
+        # Caller holds self.lock
+        if since is None:
+            return list(self.nodes.items()), list(self.edges)
+        node_items = [(name, node) for name, node in self.nodes.items() if node[1] > since]
+        return node_items, self.edges[self._first_edge_after(since):]
+
+    def snapshot(self, since: Optional[int] = None) -> tuple[list[dict], list[dict], int]:
+        """Nodes and links for the API, optionally only those added after `since`"""
+        with self.lock:
+            node_items, edges = self._select(since)
+            cursor = self.cursor
+        nodes = [{'id': name, 'label': name, 'emoji': emoji} for name, (emoji, _) in node_items]
+        links = [{'from1': from1, 'from2': from2, 'to': to} for _, from1, from2, to in edges]
+        return nodes, links, cursor
+
+    def snapshot_columnar(self, since: Optional[int] = None) -> tuple[dict, dict, int]:
+        """
+        The same nodes and links as parallel arrays. Links refer to nodes by
+        integer id; ids are stable for the life of the graph, so links in a
+        `since` delta may point at nodes sent in earlier responses.
+        """
+        with self.lock:
+            node_items, edges = self._select(since)
+            cursor = self.cursor
+            ids = self.ids
+            nodes = {
+                'id': [ids[name] for name, _ in node_items],
+                'name': [name for name, _ in node_items],
+                'emoji': [emoji for _, (emoji, _) in node_items],
+            }
+            links = {
+                'from1': [ids[from1] for _, from1, _, _ in edges],
+                'from2': [ids[from2] for _, _, from2, _ in edges],
+                'to': [ids[to] for _, _, _, to in edges],
+            }
+        return nodes, links, cursor
+
+    def _first_edge_after(self, since: int) -> int:
+        # Edges are appended in id order, so binary search for the first id > since
+        lo, hi = 0, len(self.edges)
+        while lo < hi:
+            mid = (lo + hi) // 2
+            if self.edges[mid][0] <= since:
+                lo = mid + 1
+            else:
+                hi = mid
+        return lo
+
+
+class GraphIndex:
+    """
+    In-memory graphs for the global scope and for recently requested users.
+
+    Graphs are built once from the combinations table and then caught up
+    incrementally by reading only rows with an id past their cursor. The log
+    writer calls `mark_dirty()` after each commit, so reads of a graph with
+    nothing new don't touch the database at all.
+    """
+
+    def __init__(self, load_rows: Callable[[Optional[str], int], list],
+                 load_emojis: Callable[[Iterable[str]], dict[str, str]], max_users: int = 500):
+        self.load_rows = load_rows
+        self.load_emojis = load_emojis
+        self.max_users = max_users
+        self._global = Graph()
+        self._users: OrderedDict[str, Graph] = OrderedDict()
+        self._lock = threading.Lock()
+        self._epoch = 0
+        self._version = -1  # last combinations change counter passed to sync_version()
+
+    def mark_dirty(self):
+        """Note that new combinations were committed since graphs were last synced"""
+        with self._lock:
+            self._epoch += 1
+
+    def sync_version(self, version: int):
+        """
+        Mark graphs dirty if the combinations change counter has moved past the
+        last one seen. Covers commits whose mark_dirty() hasn't run yet (or ran
+        in another process) when a request already read the newer counter.
+        """
+        with self._lock:
+            if version > self._version:
+                self._version = version
+                self._epoch += 1
+
+    def invalidate(self):
+        """Drop every cached graph (e.g. after combinations were rewritten or deleted)"""
+        with self._lock:
+            self._global = Graph()
+            self._users.clear()
+            self._epoch += 1
+
+    def get(self, username: Optional[str] = None) -> Graph:
+        with self._lock:
+            if username is None:
+                graph = self._global
+            else:
+                graph = self._users.get(username)
+                if graph is None:
+                    graph = self._users[username] = Graph()
+                    while len(self._users) > self.max_users:
+                        self._users.popitem(last=False)
+                self._users.move_to_end(username)
+            epoch = self._epoch
+
+        if graph.synced_epoch != epoch:
+            self._catch_up(graph, username, epoch)
+        return graph
+
+    def _catch_up(self, graph: Graph, username: Optional[str], epoch: int):
+        with graph.lock:
+            if graph.synced_epoch == epoch:
+                return
+            with time_stage('graph_build'):
+                self._apply_new_rows(graph, username)
+            graph.synced_epoch = epoch
+
+    def _apply_new_rows(self, graph: Graph, username: Optional[str]):
+        rows = self.load_rows(username, graph.cursor)
+        first_sync = graph.synced_epoch == -1
+
+        # Look up emojis only for names the graph hasn't seen yet, in one query
+        needed = set(BASE_MATERIALS) if first_sync else set()
+        for _, first_word, second_word, result_name, _ in rows:
+            needed.update((first_word, second_word, result_name))
+        needed.difference_update(graph.nodes)
+        emojis = self.load_emojis(needed) if needed else {}
+
+        # Base materials are always included (when they exist in the materials table)
+        if first_sync:
+            for name in BASE_MATERIALS:
+                if name in emojis:
+                    graph.add_node(name, emojis[name], 0)
+        graph.apply(rows, emojis)
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                'epoch': self._epoch,
+                'global_cursor': self._global.cursor,
+                'global_edges': len(self._global.edges),
+                'cached_users': len(self._users),
+            }
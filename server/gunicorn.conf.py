@@ -0,0 +1,42 @@
+"""
+Production server: several gunicorn worker processes sharing global.db.
+
+    gunicorn -c gunicorn.conf.py app:app
+
+Each worker is a separate process with its own connection pool, caches and
+background threads; SQLite (WAL, busy_timeout) serializes their writes, and
+each worker's change watcher picks up the others' writes. The master applies
+migrations once before forking, without opening the database itself.
+
+Configured with BIND (default 0.0.0.0:3000), WEB_WORKERS (default: CPU count,
+at most 4), WEB_THREADS per worker (default 8) and WEB_TIMEOUT seconds
+(default 60). Embeddings are encoded in a separate process per worker
+unless EMBEDDING_PROCESSES is set.
+"""
+import multiprocessing
+import os
+import subprocess
+import sys
+
+bind = os.environ.get('BIND', '0.0.0.0:3000')
+workers = int(os.environ.get('WEB_WORKERS', min(4, multiprocessing.cpu_count())))
+# Requests block on LLM calls and the database, so each worker serves them from a thread pool
+worker_class = 'gthread'
+threads = int(os.environ.get('WEB_THREADS', 8))
+timeout = int(os.environ.get('WEB_TIMEOUT', 60))
+graceful_timeout = 30
+# Import the app in each worker, after fork, so no connections or threads cross fork()
+preload_app = False
+
+os.environ.setdefault('EMBEDDING_PROCESSES', '1')
+
+
+def on_starting(server):
+    # Migrate and insert the base elements once, in a separate process, before any worker starts
+    manage = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'manage.py')
+    subprocess.run([sys.executable, manage, 'migrate'], check=True)
+
+
+def post_worker_init(worker):
+    import app
+    app.start_background_work()
@@ -0,0 +1,148 @@
+import heapq
+import threading
+from collections import OrderedDict
+from typing import Callable, Optional
+
+from graph_cache import BASE_MATERIALS
+
+Edge = tuple[str, str, str, str]  # (firstWord, secondWord, resultName, resultEmoji)
+
+
+def shortest_recipe_tree(material: str, edges: list[Edge]) -> Optional[dict]:
+    """
+    The cheapest way to craft `material` from the base elements using `edges`.
+
+    Cost is the number of crafts in the tree (a sub-material used twice is
+    crafted twice), found with Knuth's generalization of Dijkstra: a result is
+    settled once both inputs of one of its recipes are settled, cheapest first.
+    Ties go to the shallower tree. Returns None if there is no path.
+    """
+    uses: dict[str, list[Edge]] = {}
+    for edge in edges:
+        uses.setdefault(edge[0], []).append(edge)
+        if edge[1] != edge[0]:
+            uses.setdefault(edge[1], []).append(edge)
+
+    settled: dict[str, tuple[int, int, Optional[Edge]]] = {}  # name -> (crafts, depth, recipe used)
+    heap = [(0, 0, name, None) for name in BASE_MATERIALS]
+    while heap:
+        crafts, depth, name, recipe = heapq.heappop(heap)
+        if name in settled:
+            continue
+        settled[name] = (crafts, depth, recipe)
+        if name == material:
+            break
+        for edge in uses.get(name, ()):
+            first, second, result = edge[0], edge[1], edge[2]
+            if result in settled or first not in settled or second not in settled:
+                continue
+            heapq.heappush(heap, (
+                settled[first][0] + settled[second][0] + 1,
+                max(settled[first][1], settled[second][1]) + 1,
+                result,
+                edge,
+            ))
+
+    if material not in settled:
+        return None
+
+    steps = []
+    emitted = set()
+
+    def build(name: str) -> dict:
+        _, _, recipe = settled[name]
+        if recipe is None:
+            return {'name': name}
+        first, second, result, emoji = recipe
+        node = {'name': name, 'emoji': emoji, 'from': [build(first), build(second)]}
+        if name not in emitted:
+            emitted.add(name)
+            steps.append({'first': first, 'second': second, 'result': result, 'emoji': emoji})
+        return node
+
+    tree = build(material)
+    crafts, depth, _ = settled[material]
+    return {'material': material, 'crafts': crafts, 'depth': depth, 'steps': steps, 'tree': tree}
+
+
+class LineageIndex:
+    """
+    Memoized lineages per (username or None for global, material).
+
+    Each entry remembers the ancestor set it was computed from. A new recipe
+    can only change lineages whose ancestor set contains its result, so
+    `note_recipe()` drops exactly those entries (found through a reverse index).
+    """
+
+    def __init__(self, load_edges: Callable[[str, Optional[str]], list[Edge]], maxsize: int = 5000):
+        self.load_edges = load_edges
+        self.maxsize = maxsize
+        self._entries: OrderedDict[tuple, tuple[Optional[dict], frozenset]] = OrderedDict()
+        self._by_ancestor: dict[tuple, set[tuple]] = {}  # (username, ancestor) -> entry keys
+        self._lock = threading.Lock()
+        self._epoch = 0
+        self.hits = 0
+        self.misses = 0
+        self.invalidations = 0
+
+    def get(self, material: str, username: Optional[str] = None) -> Optional[dict]:
+        key = (username, material)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return entry[0]
+            self.misses += 1
+            epoch = self._epoch
+
+        edges = self.load_edges(material, username)
+        lineage = shortest_recipe_tree(material, edges)
+        ancestors = frozenset({material, *(name for edge in edges for name in edge[:3])})
+
+        with self._lock:
+            # Skip memoizing if recipes changed while we were reading
+            if epoch == self._epoch and self.maxsize > 0:
+                self._entries[key] = (lineage, ancestors)
+                for name in ancestors:
+                    self._by_ancestor.setdefault((username, name), set()).add(key)
+                while len(self._entries) > self.maxsize:
+                    self._drop(next(iter(self._entries)))
+        return lineage
+
+    def _drop(self, key: tuple):
+        # Caller holds self._lock
+        _, ancestors = self._entries.pop(key)
+        username = key[0]
+        for name in ancestors:
+            keys = self._by_ancestor.get((username, name))
+            if keys is not None:
+                keys.discard(key)
+                if not keys:
+                    del self._by_ancestor[(username, name)]
+
+    def note_recipe(self, result_name: str, username: Optional[str] = None):
+        """A recipe producing `result_name` was added (globally, or to `username`'s crafts)"""
+        with self._lock:
+            self._epoch += 1
+            for key in list(self._by_ancestor.get((username, result_name), ())):
+                self._drop(key)
+                self.invalidations += 1
+
+    def clear(self):
+        with self._lock:
+            self._epoch += 1
+            self._entries.clear()
+            self._by_ancestor.clear()
+
+    def stats(self) -> dict:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                'size': len(self._entries),
+                'maxsize': self.maxsize,
+                'hits': self.hits,
+                'misses': self.misses,
+                'invalidations': self.invalidations,
+                'hit_rate': self.hits / lookups if lookups else 0.0,
+            }
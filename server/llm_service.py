@@ -1,19 +1,209 @@
+import asyncio
 import json
 import os
-import sqlite3
+import threading
 import time
+from collections import deque
 from typing import Optional, List, Tuple
 
 from pydantic import TypeAdapter
-from cerebras.cloud.sdk import Cerebras
 
+from db import get_pool
+from logger import get_logger
+from metrics import REGISTRY, STAGE_SECONDS, time_stage
 from models import Material
 
+log = get_logger('llm')
+
+GENERATION_ATTEMPTS = REGISTRY.histogram(
+    'infinitecats_llm_generation_attempts', 'Upstream attempts needed per generation', ('outcome',),
+    buckets=(1, 2, 3, 4, 5)
+)
+FAILED_ATTEMPTS = REGISTRY.counter(
+    'infinitecats_llm_failed_attempts_total', 'Generation attempts whose output was rejected or errored, by reason', ('reason',)
+)
+
 DB_PATH = os.path.join(os.path.dirname(__file__), 'cache.db')
 MODEL = 'llama-3.3-70b'
 
-# Initialize Cerebras client
-client = Cerebras(api_key=os.environ.get("CEREBRAS_API_KEY"))
+# Async Cerebras client, created on first use inside the engine's event loop
+async_client = None
+
+def get_async_client():
+    global async_client
+    if async_client is None:
+        from cerebras.cloud.sdk import AsyncCerebras
+        # Retries and deadlines are handled by GenerationEngine, not the SDK
+        async_client = AsyncCerebras(api_key=os.environ.get("CEREBRAS_API_KEY"), max_retries=0)
+    return async_client
+
+def preload_sdk():
+    """
+    Import the Cerebras SDK ahead of the first generation. The client itself
+    is still created lazily, inside the engine loop.
+    """
+    if async_client is None:
+        import cerebras.cloud.sdk  # noqa: F401
+
+def set_client(client):
+    """Replace the async Cerebras client (e.g. with a local stand-in)"""
+    global async_client
+    async_client = client
+
+
+class LLMOverloaded(RuntimeError):
+    """Raised instead of queueing when too many generations are already outstanding."""
+
+
+class GenerationEngine:
+    """
+    Runs LLM calls on a private asyncio event loop.
+
+    - At most `max_concurrency` upstream calls run at once (semaphore).
+    - At most `max_outstanding` generations may be running or waiting; beyond
+      that `run` raises LLMOverloaded immediately rather than tying up a worker.
+    - Each upstream attempt has its own `attempt_timeout` deadline.
+    - Hedging: once enough latencies are recorded, an attempt still running
+      after the `hedge_percentile` latency gets a second identical request
+      (only if a concurrency slot is free). The first success wins.
+
+    Sync callers use `run(coroutine_function, *args)`, which blocks until the
+    coroutine finishes on the engine loop.
+    """
+
+    def __init__(self, max_concurrency: int = 8, max_outstanding: int = 64, attempt_timeout: float = 15.0,
+                 hedge_percentile: float = 0.95, hedge_min_samples: int = 20):
+        self.max_concurrency = max_concurrency
+        self.max_outstanding = max_outstanding
+        self.attempt_timeout = attempt_timeout
+        self.hedge_percentile = hedge_percentile
+        self.hedge_min_samples = hedge_min_samples
+        self._latencies = deque(maxlen=256)
+        self._loop = None
+        self._semaphore = None
+        self._lock = threading.Lock()
+        self._outstanding = 0
+        self.calls = 0
+        self.timeouts = 0
+        self.errors = 0
+        self.rejected = 0
+        self.hedges_fired = 0
+        self.hedges_won = 0
+
+    def _ensure_loop(self) -> asyncio.AbstractEventLoop:
+        with self._lock:
+            if self._loop is None:
+                loop = asyncio.new_event_loop()
+                self._semaphore = asyncio.Semaphore(self.max_concurrency)
+                threading.Thread(target=loop.run_forever, name='llm-engine', daemon=True).start()
+                self._loop = loop
+            return self._loop
+
+    def run(self, coroutine_function, *args):
+        """Run a coroutine on the engine loop from synchronous code and return its result"""
+        with self._lock:
+            if self._outstanding >= self.max_outstanding:
+                self.rejected += 1
+                raise LLMOverloaded(f'{self._outstanding} generations already outstanding')
+            self._outstanding += 1
+        try:
+            loop = self._ensure_loop()
+            return asyncio.run_coroutine_threadsafe(coroutine_function(*args), loop).result()
+        finally:
+            with self._lock:
+                self._outstanding -= 1
+
+    def hedge_delay(self) -> Optional[float]:
+        """Latency after which an attempt is hedged, or None if hedging is off or there's too little data"""
+        if not self.hedge_percentile or len(self._latencies) < self.hedge_min_samples:
+            return None
+        ordered = sorted(self._latencies)
+        return ordered[min(len(ordered) - 1, int(self.hedge_percentile * (len(ordered) - 1)))]
+
+    async def _call(self, messages: list[dict]) -> str:
+        async with self._semaphore:
+            with self._lock:
+                self.calls += 1
+            start = time.perf_counter()
+            try:
+                response = await asyncio.wait_for(
+                    get_async_client().chat.completions.create(
+                        messages=messages,
+                        model=MODEL,
+                        max_completion_tokens=1024,
+                        temperature=0.2,
+                        top_p=1,
+                        stream=False
+                    ),
+                    timeout=self.attempt_timeout,
+                )
+            except asyncio.TimeoutError:
+                with self._lock:
+                    self.timeouts += 1
+                raise TimeoutError(f'LLM attempt exceeded {self.attempt_timeout}s deadline')
+            except asyncio.CancelledError:
+                raise
+            except Exception:
+                with self._lock:
+                    self.errors += 1
+                raise
+            elapsed = time.perf_counter() - start
+            self._latencies.append(elapsed)
+            STAGE_SECONDS.observe(elapsed, 'llm_call')
+            return response.choices[0].message.content
+
+    async def complete(self, messages: list[dict]) -> str:
+        """One logical attempt: an upstream call, hedged with a second one if it runs long"""
+        first = asyncio.ensure_future(self._call(messages))
+        delay = self.hedge_delay()
+        if delay is None:
+            return await first
+        done, _ = await asyncio.wait({first}, timeout=delay)
+        if done or self._semaphore.locked():
+            # Finished in time, or no spare capacity to hedge with
+            return await first
+
+        with self._lock:
+            self.hedges_fired += 1
+        hedge = asyncio.ensure_future(self._call(messages))
+        pending = {first, hedge}
+        error = None
+        while pending:
+            done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+            for task in done:
+                if task.exception() is None:
+                    for other in pending:
+                        other.cancel()
+                    if task is hedge:
+                        with self._lock:
+                            self.hedges_won += 1
+                    return task.result()
+                error = task.exception()
+        raise error
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                'outstanding': self._outstanding,
+                'max_concurrency': self.max_concurrency,
+                'max_outstanding': self.max_outstanding,
+                'calls': self.calls,
+                'timeouts': self.timeouts,
+                'errors': self.errors,
+                'rejected': self.rejected,
+                'hedges_fired': self.hedges_fired,
+                'hedges_won': self.hedges_won,
+                'hedge_delay': self.hedge_delay(),
+            }
+
+
+engine = GenerationEngine(
+    max_concurrency=int(os.environ.get('LLM_MAX_CONCURRENCY', 8)),
+    max_outstanding=int(os.environ.get('LLM_MAX_OUTSTANDING', 64)),
+    attempt_timeout=float(os.environ.get('LLM_ATTEMPT_TIMEOUT', 15)),
+    hedge_percentile=float(os.environ.get('LLM_HEDGE_PERCENTILE', 0.95)),
+    hedge_min_samples=int(os.environ.get('LLM_HEDGE_MIN_SAMPLES', 20)),
+)
 
 def check_common_material_errors(material: Material) -> str:
     """Basic guardrails to reject clearly invalid model outputs."""
@@ -30,46 +220,7 @@ def check_common_material_errors(material: Material) -> str:
         return "The emoji is empty"
     return None
 
-def _fetch_examples_for_word(word: str, limit: int = 5) -> List[Tuple[str, str, str, str]]:
-    """Fetch up to `limit` cached combinations that involve the given word."""
-    if not os.path.exists(DB_PATH):
-        return []
-    try:
-        conn = sqlite3.connect(DB_PATH)
-        cursor = conn.cursor()
-        cursor.execute(
-            """
-            SELECT first_word, second_word, result, emoji
-            FROM word_cache
-            WHERE first_word = ? OR second_word = ?
-            ORDER BY id DESC
-            LIMIT ?
-            """,
-            (word, word, limit),
-        )
-        rows = cursor.fetchall()
-        conn.close()
-        return rows
-    except Exception:
-        return []
-
-def generate_combination(first_word: str, second_word: str, max_retries: int = 2) -> Optional[dict]:
-    """
-    Generate a new material by combining two materials using Cerebras API.
-    
-    Args:
-        first_word: First material name
-        second_word: Second material name
-        max_retries: Number of times to retry on invalid/garbage output
-        
-    Returns:
-        Dict with 'result' and 'emoji' keys, or None if generation fails
-    """
-    first_word, second_word = consistent_order(first_word, second_word)
-    examples_first = _fetch_examples_for_word(first_word, limit=3)
-    examples_second = _fetch_examples_for_word(second_word, limit=3)
-
-    base_system = '''Create a new material based on two given materials. A material should have a name and an emoji that represents the name.
+BASE_SYSTEM = '''Create a new material based on two given materials. A material should have a name and an emoji that represents the name.
             the name should be a single word or short phrase, and the emoji should be a single character that represents the name.
             Output must be ONLY compact JSON matching the schema, no markdown, no extra text, no control tokens.
             for example: 
@@ -87,108 +238,194 @@ def generate_combination(first_word: str, second_word: str, max_retries: int = 2
             Water + Cloud = Rain
             etc.'''
 
-    primer_messages = [
-        {
-            'role': 'system',
-            'content': base_system
-        },
-        {
-            'role': 'user',
-            'content': f"combine Water and Fire"
-        },
-        {
-            'role': 'assistant',
-            'content': '{"name": "Steam", "emoji": "💧"}'
-        },
-        {
-            'role': 'user',
-            'content': f"combine Metal and Rain"
-        },
-        {
-            'role': 'assistant',
-            'content': '{"name": "Rust", "emoji": "🛠️"}'
-        },
-        {
-            'role': 'user',
-            'content': f"combine Lightning and Mud"
-        },
-        {
-            'role': 'assistant',
-            'content': '{"name": "Life", "emoji": "🌱"}'
-        },
-    ]
+# Static prompt prefix, built once: system prompt plus fixed few-shot turns
+PRIMER_MESSAGES = (
+    {
+        'role': 'system',
+        'content': BASE_SYSTEM
+    },
+    {
+        'role': 'user',
+        'content': "combine Water and Fire"
+    },
+    {
+        'role': 'assistant',
+        'content': '{"name": "Steam", "emoji": "💧"}'
+    },
+    {
+        'role': 'user',
+        'content': "combine Metal and Rain"
+    },
+    {
+        'role': 'assistant',
+        'content': '{"name": "Rust", "emoji": "🛠️"}'
+    },
+    {
+        'role': 'user',
+        'content': "combine Lightning and Mud"
+    },
+    {
+        'role': 'assistant',
+        'content': '{"name": "Life", "emoji": "🌱"}'
+    },
+)
+
+# Validator built once at import instead of twice per attempt
+MATERIAL_ADAPTER = TypeAdapter(Material)
+
+def _fetch_examples_for_pair(first_word: str, second_word: str, limit: int = 3) -> List[Tuple[str, str, str, str]]:
+    """Fetch up to `limit` cached combinations involving each word, in one query."""
+    if not os.path.exists(DB_PATH):
+        return []
+    try:
+        with get_pool(DB_PATH, load_vec=False).connection() as conn:
+            rows = conn.execute(
+                """
+                SELECT * FROM (
+                    SELECT first_word, second_word, result, emoji FROM word_cache
+                    WHERE first_word = ? OR second_word = ?
+                    ORDER BY id DESC LIMIT ?
+                )
+                UNION ALL
+                SELECT * FROM (
+                    SELECT first_word, second_word, result, emoji FROM word_cache
+                    WHERE first_word = ? OR second_word = ?
+                    ORDER BY id DESC LIMIT ?
+                )
+                """,
+                (first_word, first_word, limit, second_word, second_word, limit),
+            ).fetchall()
+        return [tuple(row) for row in rows]
+    except Exception:
+        return []
+
+# Optional (first_word, second_word) -> [(first, second, result, emoji)] few-shot source.
+# app.py installs the embedding-based selector; the word_cache lookup is the fallback.
+example_selector = None
+
+def set_example_selector(selector):
+    global example_selector
+    example_selector = selector
+
+def select_examples(first_word: str, second_word: str) -> List[Tuple[str, str, str, str]]:
+    if example_selector is not None:
+        try:
+            examples = example_selector(first_word, second_word)
+            if examples:
+                return examples
+        except Exception as e:
+            log.warning("Few-shot selection failed, using word_cache examples: %s", e)
+    return _fetch_examples_for_pair(first_word, second_word, limit=3)
+
+def _timed_build_messages(first_word: str, second_word: str, hint: Optional[Tuple[str, str, str, str]] = None) -> list[dict]:
+    with time_stage('prompt_build'):
+        return build_messages(first_word, second_word, hint)
+
+def build_messages(first_word: str, second_word: str, hint: Optional[Tuple[str, str, str, str]] = None) -> list[dict]:
+    """
+    Prompt for one combination: the precompiled prefix, few-shot examples, then the request.
+    `hint` is a (first, second, result, emoji) recipe for a near-identical pair,
+    given as the closest example and suggested as the answer.
+    """
+    messages = list(PRIMER_MESSAGES)
 
-    # Add cached examples as few-shot pairs in the conversation
+    # Add example recipes as few-shot pairs in the conversation
     seen_pairs = set()
-    for fw, sw, res, emo in examples_first + examples_second:
+    for fw, sw, res, emo in select_examples(first_word, second_word):
         ordered_fw, ordered_sw = consistent_order(fw, sw)
         key = (ordered_fw, ordered_sw, res, emo)
         if key in seen_pairs:
             continue
         seen_pairs.add(key)
-        primer_messages.append({
+        messages.append({
             'role': 'user',
             'content': f"combine {ordered_fw} and {ordered_sw}"
         })
-        primer_messages.append({
+        messages.append({
             'role': 'assistant',
             'content': json.dumps({"name": res, "emoji": emo})
         })
+
+    if hint is not None:
+        hint_first, hint_second, hint_result, hint_emoji = hint
+        messages.append({'role': 'user', 'content': f"combine {hint_first} and {hint_second}"})
+        messages.append({'role': 'assistant', 'content': json.dumps({"name": hint_result, "emoji": hint_emoji})})
+        messages.append({
+            'role': 'system',
+            'content': f'{first_word} and {second_word} are near-synonyms of {hint_first} and {hint_second}. '
+                       f'Answer {hint_result} again unless the difference clearly changes the result.'
+        })
+
+    messages.append({
+        'role': 'user',
+        'content': f'Combine {first_word} and {second_word}. remember to only output JSON, no other text'
+    })
+    return messages
+
+def generate_combination(first_word: str, second_word: str, max_retries: int = 2,
+                         hint: Optional[Tuple[str, str, str, str]] = None) -> Optional[dict]:
+    """
+    Generate a new material by combining two materials using Cerebras API.
+    Blocking wrapper around generate_combination_async, run on the shared engine.
     
-    schema = TypeAdapter(Material).json_schema()
-    messagesToSend = primer_messages + [
-        {
-            'role': 'user',
-            'content': f'Combine {first_word} and {second_word}. remember to only output JSON, no other text'
-        }
-    ]
+    Args:
+        first_word: First material name
+        second_word: Second material name
+        max_retries: Number of times to retry on invalid/garbage output
+        hint: Optional (first, second, result, emoji) recipe of a near-identical pair to suggest
+        
+    Returns:
+        Dict with 'result' and 'emoji' keys, or None if generation fails
+    
+    Raises:
+        LLMOverloaded: too many generations are already outstanding
+    """
+    return engine.run(generate_combination_async, first_word, second_word, max_retries, hint)
+
+async def generate_combination_async(first_word: str, second_word: str, max_retries: int = 2,
+                                     hint: Optional[Tuple[str, str, str, str]] = None) -> Optional[dict]:
+    """Async version of generate_combination; must run on the engine's event loop"""
+    first_word, second_word = consistent_order(first_word, second_word)
+    # Example lookup touches SQLite, so keep it off the event loop
+    messagesToSend = await asyncio.to_thread(_timed_build_messages, first_word, second_word, hint)
 
     for attempt in range(max_retries + 1):
-        print("-----")
-        print("about to send messages to Cerebras:")
-        print(f"Number of messages: {len(messagesToSend)}")
+        log.debug("Sending %d messages to Cerebras for %s + %s", len(messagesToSend), first_word, second_word)
         try:
-            start_time = time.time()
-            response = client.chat.completions.create(
-                messages=messagesToSend,
-                model=MODEL,
-                max_completion_tokens=1024,
-                temperature=0.2,
-                top_p=1,
-                stream=False
-            )
-            elapsed_time = time.time() - start_time
-            
-            print(response.choices[0].message.role)
-            print(response.choices[0].message.content)
-            print(f"Chat response time: {elapsed_time:.2f} seconds")
-            print("-----")
-
-            material_json = json.loads(response.choices[0].message.content)
-            output_material = TypeAdapter(Material).validate_python(material_json)
-            # Capitalize each word in the generated name (handles single or multi-word)
-            output_material.name = " ".join(word.capitalize() for word in output_material.name.strip().split())
-
-            if (attempt == max_retries):
-                output_material.emoji = output_material.emoji[0] if output_material.emoji else '❓'
-
-            error = check_common_material_errors(output_material)
+            start_time = time.perf_counter()
+            content = await engine.complete(messagesToSend)
+            log.debug("Chat response in %.2fs: %s", time.perf_counter() - start_time, content)
+
+            with time_stage('validation'):
+                material_json = json.loads(content)
+                output_material = MATERIAL_ADAPTER.validate_python(material_json)
+                # Capitalize each word in the generated name (handles single or multi-word)
+                output_material.name = " ".join(word.capitalize() for word in output_material.name.strip().split())
+
+                if (attempt == max_retries):
+                    output_material.emoji = output_material.emoji[0] if output_material.emoji else '❓'
+
+                error = check_common_material_errors(output_material)
             if not error:
                 output_material.emoji = output_material.emoji[0]
+                GENERATION_ATTEMPTS.observe(attempt + 1, 'success')
                 return output_material.to_dict()
             else:
+                FAILED_ATTEMPTS.inc('invalid')
                 messagesToSend.append({
                     'role': 'system',
                     'content': f'The last output was invalid with the following error: {error}. Please try again, output ONLY valid JSON matching the schema.'
                 })
 
         except json.JSONDecodeError as e:
-            print(f"Attempt {attempt+1}: JSON decode failed for {first_word} + {second_word}: {e}")
+            FAILED_ATTEMPTS.inc('json')
+            log.warning("Attempt %d: JSON decode failed for %s + %s: %s", attempt + 1, first_word, second_word, e)
         except Exception as e:
-            print(f"Attempt {attempt+1}: Error generating combination for {first_word} + {second_word}: {type(e).__name__}: {e}")
-            import traceback
-            traceback.print_exc()
+            FAILED_ATTEMPTS.inc('error')
+            log.warning("Attempt %d: Error generating combination for %s + %s: %s: %s",
+                        attempt + 1, first_word, second_word, type(e).__name__, e)
 
+    GENERATION_ATTEMPTS.observe(max_retries + 1, 'failure')
     return None
 
 
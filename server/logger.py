@@ -0,0 +1,90 @@
+"""
+Leveled, sampled logging for the request hot paths.
+
+    log = get_logger('llm')
+    log.debug('Sending %d messages', len(messages))
+
+A message below the configured level costs one integer comparison, and its
+arguments are only formatted when it is actually written. DEBUG and INFO
+messages can also be sampled: with LOG_SAMPLE_RATE=0.1 about one in ten is
+written. Warnings and errors are never sampled.
+
+Configured with LOG_LEVEL (debug, info, warning, error or off; default info)
+and LOG_SAMPLE_RATE (default 1).
+"""
+import os
+import random
+import sys
+import threading
+import time
+import traceback
+
+LEVELS = {'debug': 10, 'info': 20, 'warning': 30, 'error': 40, 'off': 100}
+_LABELS = {10: 'DEBUG', 20: 'INFO', 30: 'WARNING', 40: 'ERROR'}
+
+_loggers: dict[str, 'Logger'] = {}
+_lock = threading.Lock()
+_level = LEVELS.get(os.environ.get('LOG_LEVEL', 'info').lower(), LEVELS['info'])
+_sample_rate = float(os.environ.get('LOG_SAMPLE_RATE', 1))
+
+
+class Logger:
+    __slots__ = ('name', 'level', 'sample_rate')
+
+    def __init__(self, name: str, level: int, sample_rate: float):
+        self.name = name
+        self.level = level
+        self.sample_rate = sample_rate
+
+    def enabled(self, level: int) -> bool:
+        return level >= self.level
+
+    def _write(self, level: int, message: str, args: tuple):
+        if level < LEVELS['warning'] and self.sample_rate < 1 and random.random() >= self.sample_rate:
+            return
+        if args:
+            message = message % args
+        print(f"{time.strftime('%Y-%m-%d %H:%M:%S')} {_LABELS[level]} [{self.name}] {message}", flush=True)
+
+    def debug(self, message: str, *args):
+        if self.level <= 10:
+            self._write(10, message, args)
+
+    def info(self, message: str, *args):
+        if self.level <= 20:
+            self._write(20, message, args)
+
+    def warning(self, message: str, *args):
+        if self.level <= 30:
+            self._write(30, message, args)
+
+    def error(self, message: str, *args):
+        if self.level <= 40:
+            self._write(40, message, args)
+
+    def exception(self, message: str, *args):
+        """Log an error with the traceback of the exception being handled"""
+        if self.level <= 40:
+            self._write(40, message, args)
+            traceback.print_exc(file=sys.stdout)
+
+
+def get_logger(name: str) -> Logger:
+    with _lock:
+        logger = _loggers.get(name)
+        if logger is None:
+            logger = _loggers[name] = Logger(name, _level, _sample_rate)
+        return logger
+
+
+def configure(level: str | None = None, sample_rate: float | None = None):
+    """Change the level and/or sample rate of every logger at runtime"""
+    global _level, _sample_rate
+    with _lock:
+        if level is not None:
+            _level = LEVELS[level.lower()]
+        if sample_rate is not None:
+            _sample_rate = sample_rate
+        for logger in _loggers.values():
+            logger.level = _level
+            logger.sample_rate = _sample_rate
@@ -0,0 +1,178 @@
+"""
+Maintenance commands for global.db.
+
+Usage:
+    python manage.py reembed [--batch-size 512]
+    python manage.py backfill-vec [--batch-size 1000]
+    python manage.py migrate
+    python manage.py check-plans
+    python manage.py rebuild-depths
+    python manage.py rebuild-stats
+    python manage.py compact [--older-than-days 30] [--vacuum]
+    python manage.py archive-query [--username shm] [--material Steam] [--limit 100]
+    python manage.py tune-semantic [--traffic recorded.jsonl] [--sample 2000]
+"""
+import argparse
+import json
+import sys
+from datetime import datetime, timedelta
+
+from app import (init_db, get_db, reembed_materials, backfill_material_embeddings, semantic_cache, normalize_word,
+                 event_archive)
+from llm_service import consistent_order
+from migrations import get_schema_version, check_query_plans, rebuild_stats, rebuild_user_depths, HOT_QUERIES
+from semantic_cache import tune
+
+
+def cmd_reembed(args):
+    total = reembed_materials(batch_size=args.batch_size)
+    print(f"✓ Re-embedded {total} materials")
+
+
+def cmd_backfill_vec(args):
+    total = backfill_material_embeddings(batch_size=args.batch_size)
+    print(f"✓ Added {total} materials to the material_embeddings index")
+
+
+def cmd_migrate(args):
+    # init_db() has already applied pending migrations
+    with get_db() as conn:
+        print(f"✓ Schema is at version {get_schema_version(conn)}")
+
+
+def cmd_check_plans(args):
+    with get_db() as conn:
+        failures = check_query_plans(conn)
+    for name, details in failures.items():
+        print(f"✗ {name}: " + '; '.join(details))
+    if failures:
+        sys.exit(1)
+    print(f"✓ All {len(HOT_QUERIES)} hot queries use an index")
+
+
+def cmd_rebuild_depths(args):
+    with get_db() as conn:
+        total = rebuild_user_depths(conn)
+    print(f"✓ Rebuilt {total} user depth rows")
+
+
+def cmd_rebuild_stats(args):
+    with get_db() as conn:
+        counts = rebuild_stats(conn)
+    print(f"✓ Rebuilt stats for {counts['user_stats']} users, {counts['result_stats']} results "
+          f"and {counts['hourly_stats']} hours")
+
+
+def _print_sizes(label: str, report: dict):
+    print(f"{label}: {report['used_bytes'] / 1e6:.1f} MB in use of a {report['file_bytes'] / 1e6:.1f} MB file, "
+          f"archive {report['archive_bytes'] / 1e6:.1f} MB; "
+          + ', '.join(f"{table} {rows} rows" for table, rows in report['rows'].items()))
+    for name, size in list(report.get('objects', {}).items())[:10]:
+        print(f"    {name:<40}{size / 1e6:>10.1f} MB")
+
+
+def cmd_compact(args):
+    cutoff = (datetime.now() - timedelta(days=args.older_than_days)).isoformat()
+    result = event_archive.compact(cutoff, batch_size=args.batch_size, vacuum=args.vacuum)
+    _print_sizes('Before', result['before'])
+    _print_sizes('After', result['after'])
+    print(f"✓ Compacted {result['events']} combinations logged before {result['cutoff']} "
+          f"into {result['segments']} archive segments")
+    if result['events'] and not args.vacuum:
+        print("  Freed pages are reused by new rows; run with --vacuum to shrink the file")
+
+
+def cmd_archive_query(args):
+    for event in event_archive.events(args.username, args.material, args.limit):
+        print(json.dumps(event, ensure_ascii=False))
+
+
+def _load_tuning_samples(args) -> list[tuple[str, str, str]]:
+    """(first, second, stored result) for recorded crafts that have a recipe, or a random sample of recipes"""
+    with get_db() as conn:
+        if not args.traffic:
+            rows = conn.execute(
+                'SELECT firstWord, secondWord, resultName FROM recipes WHERE source != ? ORDER BY RANDOM() LIMIT ?',
+                ('semantic', args.sample)
+            ).fetchall()
+            return [tuple(row) for row in rows]
+
+        samples = []
+        with open(args.traffic) as f:
+            for line in f:
+                request = json.loads(line)
+                body = request.get('body') or {}
+                if request.get('method') != 'POST' or request.get('path') != '/' or 'first' not in body:
+                    continue
+                pair = consistent_order(normalize_word(body['first']), normalize_word(body['second']))
+                row = conn.execute(
+                    'SELECT resultName FROM recipes WHERE firstWord = ? AND secondWord = ? AND source != ?',
+                    (*pair, 'semantic')
+                ).fetchone()
+                if row:
+                    samples.append((*pair, row['resultName']))
+        return samples[:args.sample]
+
+
+def cmd_tune_semantic(args):
+    indexed = semantic_cache.index_pending()
+    print(f"Indexed {indexed} new recipes")
+    samples = _load_tuning_samples(args)
+    thresholds = [float(t) for t in args.thresholds.split(',')]
+    print(f"Replaying {len(samples)} crafts with known recipes as cache misses")
+    print(f"{'threshold':>10}{'matched':>10}{'coverage':>10}{'precision':>11}")
+    for row in tune(semantic_cache, samples, thresholds):
+        print(f"{row['threshold']:>10.2f}{row['matched']:>10}{row['coverage']:>10.1%}{row['precision']:>11.1%}")
+    print("coverage = share of misses the semantic cache would answer; "
+          "precision = share of those answers matching the stored result")
+
+
+def main():
+    parser = argparse.ArgumentParser(description='infiniteCATs maintenance commands')
+    subparsers = parser.add_subparsers(dest='command', required=True)
+
+    reembed = subparsers.add_parser('reembed', help='Recompute embeddings for every material in large batches')
+    reembed.add_argument('--batch-size', type=int, default=512, help='Names encoded per model call')
+    reembed.set_defaults(func=cmd_reembed)
+
+    backfill_vec = subparsers.add_parser('backfill-vec', help='Add stored embeddings missing from the material_embeddings index')
+    backfill_vec.add_argument('--batch-size', type=int, default=1000, help='Materials read per query')
+    backfill_vec.set_defaults(func=cmd_backfill_vec)
+
+    migrate = subparsers.add_parser('migrate', help='Apply pending schema migrations')
+    migrate.set_defaults(func=cmd_migrate)
+
+    check_plans = subparsers.add_parser('check-plans', help='Fail if any hot query plan scans a table (EXPLAIN QUERY PLAN)')
+    check_plans.set_defaults(func=cmd_check_plans)
+
+    rebuild_depths = subparsers.add_parser('rebuild-depths', help='Recompute user_depths for all users from the combinations log')
+    rebuild_depths.set_defaults(func=cmd_rebuild_depths)
+
+    rebuild_stats_parser = subparsers.add_parser('rebuild-stats', help='Recompute the /api/stats aggregate tables from the combinations log')
+    rebuild_stats_parser.set_defaults(func=cmd_rebuild_stats)
+
+    compact = subparsers.add_parser('compact', help='Move old combinations into rollups and archive files, and report sizes')
+    compact.add_argument('--older-than-days', type=float, default=30, help='Compact events logged before this many days ago')
+    compact.add_argument('--batch-size', type=int, default=50000, help='Events moved per transaction')
+    compact.add_argument('--vacuum', action='store_true', help='VACUUM afterwards to return freed space to the filesystem')
+    compact.set_defaults(func=cmd_compact)
+
+    archive_query = subparsers.add_parser('archive-query', help='Print archived combinations as JSON lines')
+    archive_query.add_argument('--username')
+    archive_query.add_argument('--material', help='Only events with this material as an input or result')
+    archive_query.add_argument('--limit', type=int)
+    archive_query.set_defaults(func=cmd_archive_query)
+
+    tune_semantic = subparsers.add_parser('tune-semantic', help='Report semantic cache coverage and precision per threshold')
+    tune_semantic.add_argument('--traffic', help='Recorded JSONL traffic (as for bench/load_test.py); default samples recipes')
+    tune_semantic.add_argument('--sample', type=int, default=2000, help='Maximum crafts to replay')
+    tune_semantic.add_argument('--thresholds', default='0.80,0.85,0.88,0.90,0.92,0.94,0.96,0.98')
+    tune_semantic.set_defaults(func=cmd_tune_semantic)
+
+    args = parser.parse_args()
+    init_db()
+    args.func(args)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,229 @@
+"""
+In-process metrics in the Prometheus text exposition format.
+
+    REQUESTS = REGISTRY.counter('infinitecats_requests_total', 'Requests served', ('route',))
+    REQUESTS.inc('/api/graph')
+    with time_stage('cache_lookup'):
+        ...
+
+Components that already keep their own counters (pools, caches, queues, the
+LLM engine) are exported with register_stats(), which reads their stats()
+dicts at scrape time instead of duplicating the bookkeeping.
+"""
+import bisect
+import threading
+import time
+from typing import Callable, Iterable
+
+DEFAULT_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+
+def _escape(value) -> str:
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _format_labels(names: tuple, values: tuple, extra: str = '') -> str:
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return '{' + ','.join(pairs) + '}' if pairs else ''
+
+
+def _format_value(value: float) -> str:
+    if value == float('inf'):
+        return '+Inf'
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class _Metric:
+    type_name = 'untyped'
+
+    def __init__(self, name: str, help_text: str, labelnames: tuple = ()):
+        self.name = name
+        self.help = help_text
+        self.labelnames = tuple(labelnames)
+        self._values: dict[tuple, float] = {}
+        self._lock = threading.Lock()
+
+    def header(self) -> list[str]:
+        return [f'# HELP {self.name} {self.help}', f'# TYPE {self.name} {self.type_name}']
+
+    def render(self) -> list[str]:
+        with self._lock:
+            items = list(self._values.items())
+        return [f'{self.name}{_format_labels(self.labelnames, labels)} {_format_value(value)}' for labels, value in items]
+
+
+class Counter(_Metric):
+    type_name = 'counter'
+
+    def inc(self, *labels, amount: float = 1):
+        with self._lock:
+            self._values[labels] = self._values.get(labels, 0) + amount
+
+    def value(self, *labels) -> float:
+        with self._lock:
+            return self._values.get(labels, 0)
+
+
+class Gauge(_Metric):
+    type_name = 'gauge'
+
+    def set(self, value: float, *labels):
+        with self._lock:
+            self._values[labels] = value
+
+    def inc(self, *labels, amount: float = 1):
+        with self._lock:
+            self._values[labels] = self._values.get(labels, 0) + amount
+
+    def dec(self, *labels, amount: float = 1):
+        self.inc(*labels, amount=-amount)
+
+
+class _Timer:
+    __slots__ = ('histogram', 'labels', 'start')
+
+    def __init__(self, histogram: 'Histogram', labels: tuple):
+        self.histogram = histogram
+        self.labels = labels
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.histogram.observe(time.perf_counter() - self.start, *self.labels)
+
+
+class Histogram(_Metric):
+    type_name = 'histogram'
+
+    def __init__(self, name: str, help_text: str, labelnames: tuple = (), buckets: Iterable[float] = DEFAULT_BUCKETS):
+        super().__init__(name, help_text, labelnames)
+        self.buckets = tuple(sorted(buckets))
+        self._series: dict[tuple, list] = {}  # labels -> [per-bucket counts..., +Inf count, sum]
+
+    def observe(self, value: float, *labels):
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._series.get(labels)
+            if series is None:
+                series = self._series[labels] = [0] * (len(self.buckets) + 1) + [0.0]
+            series[index] += 1
+            series[-1] += value
+
+    def time(self, *labels) -> _Timer:
+        """Context manager that observes the elapsed seconds of its block"""
+        return _Timer(self, labels)
+
+    def snapshot(self, *labels) -> tuple[int, float]:
+        """(count, sum) for one label set"""
+        with self._lock:
+            series = self._series.get(labels)
+            return (sum(series[:-1]), series[-1]) if series else (0, 0.0)
+
+    def render(self) -> list[str]:
+        with self._lock:
+            items = [(labels, list(series)) for labels, series in self._series.items()]
+        lines = []
+        for labels, series in items:
+            cumulative = 0
+            for bound, count in zip((*self.buckets, float('inf')), series[:-1]):
+                cumulative += count
+                le = f'le="{_format_value(bound)}"'
+                lines.append(f'{self.name}_bucket{_format_labels(self.labelnames, labels, le)} {cumulative}')
+            lines.append(f'{self.name}_sum{_format_labels(self.labelnames, labels)} {_format_value(series[-1])}')
+            lines.append(f'{self.name}_count{_format_labels(self.labelnames, labels)} {cumulative}')
+        return lines
+
+
+class Registry:
+    def __init__(self):
+        self._metrics: dict[str, _Metric] = {}
+        self._collectors: list[Callable[[], list[str]]] = []
+        self._lock = threading.Lock()
+
+    def _register(self, metric: _Metric) -> _Metric:
+        with self._lock:
+            existing = self._metrics.get(metric.name)
+            if existing is not None:
+                return existing
+            self._metrics[metric.name] = metric
+            return metric
+
+    def counter(self, name: str, help_text: str, labelnames: tuple = ()) -> Counter:
+        return self._register(Counter(name, help_text, labelnames))
+
+    def gauge(self, name: str, help_text: str, labelnames: tuple = ()) -> Gauge:
+        return self._register(Gauge(name, help_text, labelnames))
+
+    def histogram(self, name: str, help_text: str, labelnames: tuple = (), buckets: Iterable[float] = DEFAULT_BUCKETS) -> Histogram:
+        return self._register(Histogram(name, help_text, labelnames, buckets))
+
+    def register_collector(self, collect: Callable[[], list[str]]):
+        """Add a callable returning exposition lines, run at every scrape"""
+        with self._lock:
+            self._collectors.append(collect)
+
+    def render(self) -> str:
+        with self._lock:
+            metrics = list(self._metrics.values())
+            collectors = list(self._collectors)
+        lines = []
+        for metric in metrics:
+            lines.extend(metric.header())
+            lines.extend(metric.render())
+        for collect in collectors:
+            try:
+                lines.extend(collect())
+            except Exception as e:
+                lines.append(f'# collector error: {_escape(e)}')
+        return '\n'.join(lines) + '\n'
+
+
+REGISTRY = Registry()
+
+STAGE_SECONDS = REGISTRY.histogram(
+    'infinitecats_stage_seconds', 'Time spent in each hot-path stage', ('stage',)
+)
+
+
+def time_stage(stage: str) -> _Timer:
+    """`with time_stage('db_write'):` records the block's duration in infinitecats_stage_seconds"""
+    return STAGE_SECONDS.time(stage)
+
+
+def register_stats(prefix: str, stats: Callable[[], dict], counters: Iterable[str] = (), label: str | None = None):
+    """
+    Export the numeric fields of a component's stats() dict at scrape time.
+    Fields named in `counters` are monotonic and exported as `<prefix>_<field>_total`
+    counters; everything else becomes a `<prefix>_<field>` gauge. If `stats`
+    returns {key: {field: value}}, pass `label` to export one series per key
+    with that label name.
+    """
+    counters = set(counters)
+
+    def collect() -> list[str]:
+        result = stats()
+        groups = [((), result)] if label is None else [((key,), fields) for key, fields in result.items()]
+        labelnames = () if label is None else (label,)
+        series: dict[str, tuple[str, list[str]]] = {}
+        for labels, fields in groups:
+            for field, value in fields.items():
+                if isinstance(value, bool) or not isinstance(value, (int, float)):
+                    continue
+                if field in counters:
+                    suffix = '' if field.endswith('_total') else '_total'
+                    name, kind = f'{prefix}_{field}{suffix}', 'counter'
+                else:
+                    name, kind = f'{prefix}_{field}', 'gauge'
+                sample = f'{name}{_format_labels(labelnames, labels)} {_format_value(value)}'
+                series.setdefault(name, (kind, []))[1].append(sample)
+        lines = []
+        for name, (kind, samples) in series.items():
+            lines.append(f'# TYPE {name} {kind}')
+            lines.extend(samples)
+        return lines
+
+    REGISTRY.register_collector(collect)
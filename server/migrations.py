@@ -0,0 +1,647 @@
+"""
+Versioned schema migrations for global.db.
+
+init_db() creates the original materials/combinations tables and then calls
+run_migrations(), which applies every migration newer than the version
+recorded in schema_migrations, each in its own transaction. Running it again
+is a no-op, so it is safe at every startup and from several processes at once.
+
+To change the schema, append a new (version, name, function) entry to
+MIGRATIONS; never edit one that has shipped.
+"""
+import os
+import sqlite3
+from datetime import datetime
+
+import llm_service
+from llm_service import consistent_order
+
+
+def backfill_recipes(conn):
+    """
+    Populate the recipes table from existing data.
+    The combinations log wins (earliest event per pair), then the legacy
+    word_cache in cache.db fills in pairs the log has never seen.
+    """
+    cursor = conn.cursor()
+    # MIN/MAX on TEXT compare the same way as consistent_order()
+    cursor.execute('''
+        INSERT OR IGNORE INTO recipes (firstWord, secondWord, resultName, resultEmoji, createdAt)
+        SELECT MIN(firstWord, secondWord), MAX(firstWord, secondWord), resultName, resultEmoji, timestamp
+        FROM combinations
+        ORDER BY id
+    ''')
+    from_log = cursor.rowcount
+
+    legacy_rows = []
+    if os.path.exists(llm_service.DB_PATH):
+        try:
+            legacy = sqlite3.connect(llm_service.DB_PATH)
+            legacy_rows = legacy.execute(
+                'SELECT first_word, second_word, result, emoji FROM word_cache ORDER BY id'
+            ).fetchall()
+            legacy.close()
+        except sqlite3.Error as e:
+            print(f"Skipping word_cache backfill: {e}")
+
+    now = datetime.now().isoformat()
+    before = conn.total_changes
+    cursor.executemany(
+        'INSERT OR IGNORE INTO recipes (firstWord, secondWord, resultName, resultEmoji, createdAt) VALUES (?, ?, ?, ?, ?)',
+        [(*consistent_order(fw, sw), result, emoji, now) for fw, sw, result, emoji in legacy_rows if result]
+    )
+    from_cache = conn.total_changes - before
+    print(f"Backfilled recipes: {from_log} from combinations, {from_cache} from word_cache.")
+
+
+def _create_recipes(conn):
+    # One canonical row per unordered input pair, so cache lookups are a single
+    # unique-index probe instead of scanning the combinations log
+    cursor = conn.cursor()
+    cursor.execute("SELECT name FROM sqlite_master WHERE type = 'table' AND name = 'recipes'")
+    recipes_existed = cursor.fetchone() is not None
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS recipes (
+            id INTEGER PRIMARY KEY,
+            firstWord TEXT NOT NULL,
+            secondWord TEXT NOT NULL,
+            resultName TEXT NOT NULL,
+            resultEmoji TEXT NOT NULL,
+            createdAt TIMESTAMP NOT NULL
+        )
+    ''')
+    cursor.execute('CREATE UNIQUE INDEX IF NOT EXISTS idx_recipes_pair ON recipes (firstWord, secondWord)')
+    if not recipes_existed:
+        backfill_recipes(conn)
+
+
+def _index_combinations(conn):
+    # Covers the MIN(perUserRank) lookup in get_per_user_rank
+    conn.execute('CREATE INDEX IF NOT EXISTS idx_combinations_result_user ON combinations (resultName, username, perUserRank)')
+    # Covers /api/user-materials (DISTINCT resultName, resultEmoji ... ORDER BY resultName)
+    conn.execute('CREATE INDEX IF NOT EXISTS idx_combinations_user_result ON combinations (username, resultName, resultEmoji)')
+    # Per-user graph catch-up (username = ? AND id > ? ORDER BY id)
+    conn.execute('CREATE INDEX IF NOT EXISTS idx_combinations_user_id ON combinations (username, id)')
+    conn.execute('ANALYZE combinations')
+
+
+# Every logged combination as (id, username, firstWord, secondWord, resultName,
+# resultEmoji, count, discoveries, minRank, maxRank, firstAt, lastAt): one row
+# per live event here, plus one per compacted rollup in the combination_history view
+_LIVE_HISTORY = '''
+    SELECT id, username, firstWord, secondWord, resultName, resultEmoji, 1 AS count, isDiscovery AS discoveries,
+           perUserRank AS minRank, perUserRank AS maxRank, timestamp AS firstAt, timestamp AS lastAt
+    FROM combinations
+'''
+
+
+def _combination_history(conn) -> str:
+    """The combination_history view, or the live log alone on schemas from before compaction existed"""
+    exists = conn.execute("SELECT 1 FROM sqlite_master WHERE type = 'view' AND name = 'combination_history'").fetchone()
+    return 'combination_history' if exists else f'({_LIVE_HISTORY})'
+
+
+def rebuild_user_depths(conn) -> int:
+    """
+    Recompute user_depths for every user from the combinations log (and its
+    compacted rollups) in one pass. minRank is the user's lowest perUserRank
+    for the material; emoji and firstSeen come from the first time the user made it.
+    """
+    conn.execute('DELETE FROM user_depths')
+    cursor = conn.execute(f'''
+        INSERT INTO user_depths (username, material, emoji, minRank, firstSeen)
+        SELECT username, resultName, resultEmoji, minRank, firstAt
+        FROM (
+            SELECT username, resultName, resultEmoji, firstAt,
+                   COALESCE(MIN(minRank) OVER material, 0) AS minRank,
+                   ROW_NUMBER() OVER (material ORDER BY id) AS n
+            FROM {_combination_history(conn)}
+            WINDOW material AS (PARTITION BY username, resultName)
+        )
+        WHERE n = 1
+    ''')
+    return cursor.rowcount
+
+
+def _create_user_depths(conn):
+    # Per-user discovery depth, upserted as combinations are logged, so rank
+    # lookups and /api/user-materials are primary-key reads instead of log scans
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS user_depths (
+            username TEXT NOT NULL,
+            material TEXT NOT NULL,
+            emoji TEXT NOT NULL,
+            minRank INTEGER NOT NULL,
+            firstSeen TIMESTAMP NOT NULL,
+            PRIMARY KEY (username, material)
+        ) WITHOUT ROWID
+    ''')
+    rebuilt = rebuild_user_depths(conn)
+    print(f"Built {rebuilt} user depth rows.")
+    # Both queries these indexes covered now read user_depths
+    conn.execute('DROP INDEX IF EXISTS idx_combinations_result_user')
+    conn.execute('DROP INDEX IF EXISTS idx_combinations_user_result')
+
+
+def _index_recipes_second_word(conn):
+    # Few-shot candidate lookup matches recipes on either input
+    # (firstWord IN (...) OR secondWord IN (...)); idx_recipes_pair covers firstWord
+    conn.execute('CREATE INDEX IF NOT EXISTS idx_recipes_second ON recipes (secondWord)')
+
+
+def _add_recipe_source(conn):
+    # 'live' recipes came from a player's craft, 'precompute' ones from the idle-time scheduler
+    conn.execute("ALTER TABLE recipes ADD COLUMN source TEXT NOT NULL DEFAULT 'live'")
+
+
+def _index_lineage_lookups(conn):
+    # /api/lineage walks recipes (global) or one user's combinations (per user) backwards by result
+    conn.execute('CREATE INDEX IF NOT EXISTS idx_recipes_result ON recipes (resultName)')
+    conn.execute(
+        'CREATE INDEX IF NOT EXISTS idx_combinations_user_lineage '
+        'ON combinations (username, resultName, firstWord, secondWord, resultEmoji)'
+    )
+
+
+def _create_change_counters(conn):
+    # Version numbers bumped by triggers on every write, so read endpoints can
+    # answer If-None-Match with one primary-key read instead of rebuilding a response
+    conn.execute(
+        'CREATE TABLE IF NOT EXISTS change_counters '
+        '(name TEXT PRIMARY KEY, version INTEGER NOT NULL) WITHOUT ROWID'
+    )
+    conn.execute(
+        "INSERT OR IGNORE INTO change_counters (name, version) VALUES ('materials', 0), ('combinations', 0)"
+    )
+    conn.execute(
+        'CREATE TABLE IF NOT EXISTS user_change_counters '
+        '(username TEXT PRIMARY KEY, version INTEGER NOT NULL) WITHOUT ROWID'
+    )
+    for event in ('INSERT', 'UPDATE', 'DELETE'):
+        conn.execute(
+            f'CREATE TRIGGER IF NOT EXISTS materials_changed_{event.lower()} AFTER {event} ON materials '
+            "BEGIN UPDATE change_counters SET version = version + 1 WHERE name = 'materials'; END"
+        )
+    bump_user = (
+        'INSERT INTO user_change_counters (username, version) VALUES ({row}.username, 1) '
+        'ON CONFLICT (username) DO UPDATE SET version = version + 1;'
+    )
+    for event, rows in (('INSERT', ('NEW',)), ('UPDATE', ('OLD', 'NEW')), ('DELETE', ('OLD',))):
+        conn.execute(
+            f'CREATE TRIGGER IF NOT EXISTS combinations_changed_{event.lower()} AFTER {event} ON combinations '
+            "BEGIN UPDATE change_counters SET version = version + 1 WHERE name = 'combinations'; "
+            + ' '.join(bump_user.format(row=row) for row in rows)
+            + ' END'
+        )
+
+
+def _track_rewrites(conn):
+    # Recipe inserts, plus separate counters for updates/deletes of recipes and
+    # combinations: other worker processes poll these and drop caches that
+    # assume rows are only ever appended
+    conn.execute(
+        "INSERT OR IGNORE INTO change_counters (name, version) "
+        "VALUES ('recipes', 0), ('recipe_rewrites', 0), ('combination_rewrites', 0)"
+    )
+    for event in ('INSERT', 'UPDATE', 'DELETE'):
+        conn.execute(
+            f'CREATE TRIGGER IF NOT EXISTS recipes_changed_{event.lower()} AFTER {event} ON recipes '
+            "BEGIN UPDATE change_counters SET version = version + 1 WHERE name = 'recipes'; END"
+        )
+    for table, counter in (('recipes', 'recipe_rewrites'), ('combinations', 'combination_rewrites')):
+        for event in ('UPDATE', 'DELETE'):
+            conn.execute(
+                f'CREATE TRIGGER IF NOT EXISTS {table}_rewritten_{event.lower()} AFTER {event} ON {table} '
+                f"BEGIN UPDATE change_counters SET version = version + 1 WHERE name = '{counter}'; END"
+            )
+
+
+def rebuild_stats(conn) -> dict[str, int]:
+    """
+    Recompute user_stats, result_stats and hourly_stats from the combinations
+    log, its compacted rollups and user_depths. log_combination() keeps them up
+    to date incrementally; this is for creating them and for recovery.
+
+    Rollups don't keep per-hour counts, so hours before the latest compaction
+    cutoff keep their hourly_stats rows; later hours are recomputed from the
+    live log. Returns rows written per table.
+    """
+    history = _combination_history(conn)
+    horizon = ''
+    if conn.execute("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'compactions'").fetchone():
+        horizon = conn.execute('SELECT MAX(cutoff) FROM compactions WHERE events > 0').fetchone()[0] or ''
+    conn.execute('DELETE FROM user_stats')
+    conn.execute('DELETE FROM result_stats')
+    conn.execute('DELETE FROM hourly_stats WHERE hour >= ?', (horizon[:13],))
+    counts = {}
+    counts['user_stats'] = conn.execute(f'''
+        INSERT INTO user_stats (username, crafts, discoveries, materials, maxRank, firstCraftAt, lastCraftAt)
+        SELECT c.username, c.crafts, c.discoveries, COALESCE(d.materials, 0), c.maxRank, c.firstCraftAt, c.lastCraftAt
+        FROM (
+            SELECT username, SUM(count) AS crafts, SUM(discoveries) AS discoveries,
+                   COALESCE(MAX(maxRank), 0) AS maxRank, MIN(firstAt) AS firstCraftAt, MAX(lastAt) AS lastCraftAt
+            FROM {history}
+            GROUP BY username
+        ) AS c
+        LEFT JOIN (SELECT username, COUNT(*) AS materials FROM user_depths GROUP BY username) AS d
+            ON d.username = c.username
+    ''').rowcount
+    counts['result_stats'] = conn.execute(f'''
+        INSERT INTO result_stats (resultName, resultEmoji, crafts, players)
+        SELECT resultName, resultEmoji, crafts, players
+        FROM (
+            SELECT resultName, resultEmoji,
+                   SUM(count) OVER result AS crafts,
+                   ROW_NUMBER() OVER (result ORDER BY id) AS n
+            FROM {history}
+            WINDOW result AS (PARTITION BY resultName)
+        )
+        JOIN (SELECT resultName, COUNT(DISTINCT username) AS players FROM {history} GROUP BY resultName)
+            USING (resultName)
+        WHERE n = 1
+    ''').rowcount
+    counts['hourly_stats'] = conn.execute('''
+        INSERT INTO hourly_stats (hour, crafts, discoveries, newPlayers)
+        SELECT crafts.hour, crafts.crafts, crafts.discoveries, COALESCE(players.newPlayers, 0)
+        FROM (
+            SELECT substr(timestamp, 1, 13) AS hour, COUNT(*) AS crafts, SUM(isDiscovery) AS discoveries
+            FROM combinations
+            WHERE timestamp >= ?
+            GROUP BY hour
+        ) AS crafts
+        LEFT JOIN (
+            SELECT substr(firstCraftAt, 1, 13) AS hour, COUNT(*) AS newPlayers FROM user_stats GROUP BY hour
+        ) AS players ON players.hour = crafts.hour
+    ''', (horizon,)).rowcount
+    return counts
+
+
+def _create_stats(conn):
+    # Aggregates behind /api/stats, updated in the same transaction as each logged
+    # combination, so leaderboards and hourly counts never scan the event log
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS user_stats (
+            username TEXT PRIMARY KEY,
+            crafts INTEGER NOT NULL,
+            discoveries INTEGER NOT NULL,
+            materials INTEGER NOT NULL,
+            maxRank INTEGER NOT NULL,
+            firstCraftAt TIMESTAMP NOT NULL,
+            lastCraftAt TIMESTAMP NOT NULL
+        ) WITHOUT ROWID
+    ''')
+    conn.execute('CREATE INDEX IF NOT EXISTS idx_user_stats_discoveries ON user_stats (discoveries DESC, username)')
+    conn.execute('CREATE INDEX IF NOT EXISTS idx_user_stats_materials ON user_stats (materials DESC, username)')
+    conn.execute('CREATE INDEX IF NOT EXISTS idx_user_stats_rank ON user_stats (maxRank DESC, username)')
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS result_stats (
+            resultName TEXT PRIMARY KEY,
+            resultEmoji TEXT NOT NULL,
+            crafts INTEGER NOT NULL,
+            players INTEGER NOT NULL
+        ) WITHOUT ROWID
+    ''')
+    conn.execute('CREATE INDEX IF NOT EXISTS idx_result_stats_crafts ON result_stats (crafts DESC, resultName)')
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS hourly_stats (
+            hour TEXT PRIMARY KEY,
+            crafts INTEGER NOT NULL,
+            discoveries INTEGER NOT NULL,
+            newPlayers INTEGER NOT NULL
+        ) WITHOUT ROWID
+    ''')
+    counts = rebuild_stats(conn)
+    print(f"Built stats: {counts['user_stats']} users, {counts['result_stats']} results, {counts['hourly_stats']} hours.")
+
+
+def _create_compaction(conn):
+    # Cold tier for the combinations log (see event_archive.py): compacted events
+    # leave the table for per-(user, inputs, result, emoji) rollups with interned
+    # names, and for .npy segment files recorded in event_archives
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS interned_names (
+            id INTEGER PRIMARY KEY,
+            name TEXT NOT NULL UNIQUE
+        )
+    ''')
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS combination_rollups (
+            id INTEGER PRIMARY KEY,
+            usernameId INTEGER NOT NULL,
+            resultNameId INTEGER NOT NULL,
+            firstWordId INTEGER NOT NULL,
+            secondWordId INTEGER NOT NULL,
+            resultEmojiId INTEGER NOT NULL,
+            count INTEGER NOT NULL,
+            discoveries INTEGER NOT NULL,
+            minRank INTEGER,
+            maxRank INTEGER,
+            firstAt TIMESTAMP NOT NULL,
+            lastAt TIMESTAMP NOT NULL,
+            lastId INTEGER NOT NULL
+        )
+    ''')
+    # Also the per-user lineage access path (user, then result)
+    conn.execute(
+        'CREATE UNIQUE INDEX IF NOT EXISTS idx_combination_rollups_key '
+        'ON combination_rollups (usernameId, resultNameId, firstWordId, secondWordId, resultEmojiId)'
+    )
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS event_archives (
+            id INTEGER PRIMARY KEY,
+            path TEXT NOT NULL UNIQUE,
+            firstId INTEGER NOT NULL,
+            lastId INTEGER NOT NULL,
+            events INTEGER NOT NULL,
+            bytes INTEGER NOT NULL,
+            createdAt TIMESTAMP NOT NULL
+        )
+    ''')
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS compactions (
+            id INTEGER PRIMARY KEY,
+            ranAt TIMESTAMP NOT NULL,
+            cutoff TIMESTAMP NOT NULL,
+            events INTEGER NOT NULL,
+            usedBytesBefore INTEGER NOT NULL,
+            usedBytesAfter INTEGER NOT NULL,
+            archiveBytes INTEGER NOT NULL
+        )
+    ''')
+    conn.execute(f'''
+        CREATE VIEW IF NOT EXISTS combination_history AS
+        {_LIVE_HISTORY}
+        UNION ALL
+        SELECT r.id, u.name, f.name, s.name, n.name, e.name, r.count, r.discoveries,
+               r.minRank, r.maxRank, r.firstAt, r.lastAt
+        FROM combination_rollups r
+        JOIN interned_names u ON u.id = r.usernameId
+        JOIN interned_names f ON f.id = r.firstWordId
+        JOIN interned_names s ON s.id = r.secondWordId
+        JOIN interned_names n ON n.id = r.resultNameId
+        JOIN interned_names e ON e.id = r.resultEmojiId
+    ''')
+
+
+def _track_recipe_promotions(conn):
+    # A player's first craft of a precomputed recipe promotes it to source 'live'.
+    # That is not a rewrite (other processes need not drop their caches), so the
+    # rewrite trigger only watches the recipe itself; promotions are logged for
+    # other processes to refresh just those pairs
+    conn.execute('DROP TRIGGER IF EXISTS recipes_rewritten_update')
+    conn.execute(
+        'CREATE TRIGGER recipes_rewritten_update AFTER UPDATE OF firstWord, secondWord, resultName, resultEmoji ON recipes '
+        "BEGIN UPDATE change_counters SET version = version + 1 WHERE name = 'recipe_rewrites'; END"
+    )
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS recipe_promotions (
+            id INTEGER PRIMARY KEY,
+            firstWord TEXT NOT NULL,
+            secondWord TEXT NOT NULL
+        )
+    ''')
+    conn.execute(
+        'CREATE TRIGGER IF NOT EXISTS recipes_promoted AFTER UPDATE OF source ON recipes '
+        "WHEN OLD.source = 'precompute' AND NEW.source = 'live' "
+        'BEGIN INSERT INTO recipe_promotions (firstWord, secondWord) VALUES (NEW.firstWord, NEW.secondWord); END'
+    )
+
+
+
+def _index_result_players(conn):
+    # Precompute refills its popular materials from result_stats, most players first
+    conn.execute('CREATE INDEX IF NOT EXISTS idx_result_stats_players ON result_stats (players DESC, resultName)')
+
+
+def _create_recipe_pair_embeddings(conn):
+    # Semantic cache pair vectors (rowid = recipes.id). vec0 comes from sqlite-vec,
+    # which every pooled connection loads. Databases that already made the table
+    # outside migrations keep it
+    conn.execute('CREATE VIRTUAL TABLE IF NOT EXISTS recipe_pair_embeddings USING vec0(embedding float[384])')
+
+
+MIGRATIONS = [
+    (1, 'create recipes table', _create_recipes),
+    (2, 'index combinations access paths', _index_combinations),
+    (3, 'materialize per-user discovery depths', _create_user_depths),
+    (4, 'index recipes by second word', _index_recipes_second_word),
+    (5, 'record recipe source', _add_recipe_source),
+    (6, 'index lineage lookups', _index_lineage_lookups),
+    (7, 'track change counters', _create_change_counters),
+    (8, 'track recipe inserts and rewrites', _track_rewrites),
+    (9, 'materialize leaderboard and hourly stats', _create_stats),
+    (10, 'add compacted rollups and the event archive', _create_compaction),
+    (11, 'promote precomputed recipes once crafted', _track_recipe_promotions),
+    (12, 'index results by player count', _index_result_players),
+    (13, 'add the recipe pair vector index', _create_recipe_pair_embeddings),
+]
+
+
+def get_schema_version(conn) -> int:
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS schema_migrations (
+            version INTEGER PRIMARY KEY,
+            name TEXT NOT NULL,
+            appliedAt TIMESTAMP NOT NULL
+        )
+    ''')
+    row = conn.execute('SELECT MAX(version) FROM schema_migrations').fetchone()
+    return row[0] or 0
+
+
+def run_migrations(conn) -> int:
+    """Apply pending migrations in order and return the resulting schema version"""
+    if conn.in_transaction:
+        conn.commit()
+    version = get_schema_version(conn)
+    for target, name, migrate in MIGRATIONS:
+        if target <= version:
+            continue
+        # Take the write lock first, then re-check, in case another process migrated meanwhile
+        conn.execute('BEGIN IMMEDIATE')
+        try:
+            if get_schema_version(conn) >= target:
+                conn.commit()
+                continue
+            print(f"Applying migration {target}: {name}")
+            migrate(conn)
+            conn.execute(
+                'INSERT INTO schema_migrations (version, name, appliedAt) VALUES (?, ?, ?)',
+                (target, name, datetime.now().isoformat())
+            )
+            conn.commit()
+        except Exception:
+            conn.rollback()
+            raise
+        version = target
+    return version
+
+
+# Edge sources for the /api/lineage walk, as (username, firstWord, secondWord, resultName,
+# resultEmoji). Each is a plain join, not a compound view, so the planner can
+# flatten it into the recursive step and probe it by resultName instead of
+# materializing it.
+_LINEAGE_SOURCES = {
+    'global': ['SELECT NULL AS username, firstWord, secondWord, resultName, resultEmoji FROM recipes'],
+    'user': [
+        'SELECT username, firstWord, secondWord, resultName, resultEmoji FROM combinations',
+        '''SELECT u.name AS username, f.name AS firstWord, s.name AS secondWord, n.name AS resultName, e.name AS resultEmoji
+           FROM interned_names u
+           JOIN combination_rollups r ON r.usernameId = u.id
+           JOIN interned_names n ON n.id = r.resultNameId
+           JOIN interned_names f ON f.id = r.firstWordId
+           JOIN interned_names s ON s.id = r.secondWordId
+           JOIN interned_names e ON e.id = r.resultEmojiId''',
+    ],
+}
+
+
+def lineage_sql(scope: str) -> str:
+    """
+    Edges that can lead to :material in the 'global' recipes or one user's
+    (:username) crafts: a recursive walk back through the edges producing each
+    ancestor, stopping at the base elements. CROSS JOIN pins the join order so
+    each step is an index probe by resultName (and username). The username rides
+    along in the walk rather than filtering the sources, so older SQLite does not
+    build a bloom filter over the whole log for it. An edge can come back once
+    per source (a user's live and compacted crafts), so callers dedupe.
+    """
+    sources = _LINEAGE_SOURCES[scope]
+    base = "('Fire', 'Water', 'Earth', 'Air')"
+    match = 'e.resultName = ancestors.name' + (' AND e.username = ancestors.username' if scope == 'user' else '')
+    edges = ',\n'.join(f'edges{i} AS NOT MATERIALIZED ({sql})' for i, sql in enumerate(sources))
+    steps = '\nUNION\n'.join(f'''
+        SELECT ancestors.username, CASE side.n WHEN 0 THEN e.firstWord ELSE e.secondWord END
+        FROM ancestors
+        CROSS JOIN edges{i} e ON {match}
+        CROSS JOIN (SELECT 0 AS n UNION ALL SELECT 1) AS side
+        WHERE ancestors.name NOT IN {base}''' for i in range(len(sources)))
+    found = '\nUNION ALL\n'.join(f'''
+        SELECT e.firstWord, e.secondWord, e.resultName, e.resultEmoji
+        FROM ancestors
+        CROSS JOIN edges{i} e ON {match}
+        WHERE ancestors.name NOT IN {base}''' for i in range(len(sources)))
+    return f'''
+        WITH RECURSIVE
+            {edges},
+            ancestors(username, name) AS (
+                SELECT {':username' if scope == 'user' else 'NULL'}, :material
+                UNION {steps}
+            ) {found}
+    '''
+
+
+# Queries on the request and logging hot paths, with representative parameters.
+# check_query_plans() asserts each one is answered from an index, not a table scan.
+HOT_QUERIES = {
+    'change counters': (
+        'SELECT name, version FROM change_counters WHERE name IN (?, ?)',
+        ('materials', 'combinations'),
+    ),
+    'user change counter': (
+        'SELECT version FROM user_change_counters WHERE username = ?',
+        ('shm',),
+    ),
+    'recipe lookup': (
+        'SELECT resultName, resultEmoji, source FROM recipes WHERE firstWord = ? AND secondWord = ?',
+        ('Fire', 'Water'),
+    ),
+    'batch recipe lookup': (
+        'WITH p (f, s) AS (VALUES (?, ?), (?, ?)) '
+        'SELECT r.firstWord, r.secondWord, r.resultName, r.resultEmoji, r.source '
+        'FROM p CROSS JOIN recipes r ON r.firstWord = p.f AND r.secondWord = p.s',
+        ('Fire', 'Water', 'Air', 'Earth'),
+    ),
+    # Precompute's filter of candidate pairs, run whenever the engine is idle
+    'uncached pair check': (
+        'WITH p (f, s) AS (VALUES (?, ?), (?, ?)) '
+        'SELECT r.firstWord, r.secondWord FROM p CROSS JOIN recipes r ON r.firstWord = p.f AND r.secondWord = p.s',
+        ('Fire', 'Water', 'Air', 'Earth'),
+    ),
+    'material by name': (
+        'SELECT emoji FROM materials WHERE name = ?',
+        ('Fire',),
+    ),
+    'per-user rank': (
+        'SELECT material, minRank FROM user_depths WHERE username = ? AND material IN (?, ?)',
+        ('player1', 'Fire', 'Steam'),
+    ),
+    'user materials': (
+        'SELECT material, emoji FROM user_depths WHERE username = ? ORDER BY material',
+        ('player1',),
+    ),
+    'global graph catch-up': (
+        'SELECT id, firstWord, secondWord, resultName, resultEmoji FROM combinations WHERE id > ? ORDER BY id',
+        (0,),
+    ),
+    'user graph catch-up': (
+        'SELECT id, firstWord, secondWord, resultName, resultEmoji FROM combinations WHERE username = ? AND id > ? ORDER BY id',
+        ('player1', 0),
+    ),
+    'few-shot candidates': (
+        'SELECT firstWord, secondWord, resultName, resultEmoji FROM recipes WHERE firstWord IN (?, ?) OR secondWord IN (?, ?) LIMIT ?',
+        ('Fire', 'Water', 'Fire', 'Water', 400),
+    ),
+    # The /api/lineage recursive walk, per scope
+    'global lineage': (
+        lineage_sql('global'),
+        {'material': 'Steam'},
+    ),
+    'user lineage': (
+        lineage_sql('user'),
+        {'material': 'Steam', 'username': 'player1'},
+    ),
+    # /api/stats leaderboards and time buckets
+    'discoveries leaderboard': (
+        'SELECT username, crafts, discoveries, materials, maxRank FROM user_stats ORDER BY discoveries DESC, username LIMIT ?',
+        (10,),
+    ),
+    'materials leaderboard': (
+        'SELECT username, crafts, discoveries, materials, maxRank FROM user_stats ORDER BY materials DESC, username LIMIT ?',
+        (10,),
+    ),
+    'depth leaderboard': (
+        'SELECT username, crafts, discoveries, materials, maxRank FROM user_stats ORDER BY maxRank DESC, username LIMIT ?',
+        (10,),
+    ),
+    'most crafted results': (
+        'SELECT resultName, resultEmoji, crafts, players FROM result_stats ORDER BY crafts DESC, resultName LIMIT ?',
+        (10,),
+    ),
+    # Precompute's popular materials, read on every candidate refill
+    'most played results': (
+        'SELECT resultName, players FROM result_stats ORDER BY players DESC, resultName LIMIT ?',
+        (50,),
+    ),
+    'hourly stats': (
+        'SELECT hour, crafts, discoveries, newPlayers FROM hourly_stats WHERE hour >= ? ORDER BY hour',
+        ('2026-01-01T00',),
+    ),
+    'embedding matrix catch-up': (
+        'SELECT rowid, name, embedding FROM materials WHERE rowid > ? ORDER BY rowid LIMIT ?',
+        (0, 5000),
+    ),
+}
+
+
+def check_query_plans(conn) -> dict[str, list[str]]:
+    """
+    Run EXPLAIN QUERY PLAN for every hot query.
+    Returns {query name: plan details} for queries that scan a table, sort in a temp
+    b-tree, or build a bloom filter (which reads the whole table first).
+    """
+    failures = {}
+    for name, (sql, params) in HOT_QUERIES.items():
+        details = [row[3] for row in conn.execute(f'EXPLAIN QUERY PLAN {sql}', params)]
+        # Walking a list of constants, or a subquery the plan evaluates on its own (its
+        # own steps are checked too), is fine, and so is walking an index in order under
+        # a LIMIT (top-N leaderboards stop after N rows); scanning a table is not
+        subqueries = {d.split(' ', 1)[1] for d in details if d.startswith(('CO-ROUTINE ', 'MATERIALIZE '))}
+        limited = ' LIMIT ' in sql.upper()
+        bad = [d for d in details
+               if (d.startswith('SCAN') and not d.endswith(('CONSTANT ROW', 'CONSTANT ROWS')) and d[len('SCAN '):] not in subqueries
+                   and not (limited and 'USING' in d and 'INDEX' in d))
+               or 'TEMP B-TREE' in d or d.startswith('BLOOM FILTER')]
+        if bad:
+            failures[name] = details
+    return failures
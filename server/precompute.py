@@ -0,0 +1,145 @@
+import threading
+import time
+from collections import deque
+from typing import Callable, Optional
+
+from logger import get_logger
+
+log = get_logger('precompute')
+
+
+class PrecomputeScheduler:
+    """
+    Generates likely upcoming recipes ahead of time while the LLM is idle.
+
+    Candidates are pairs of recently discovered and popular materials that have
+    no recipe yet, ranked by the product of the two materials' weights:
+    a popular material weighs its share of players who have made it (times
+    `popular_weight`), a recent one its recency (times `recent_weight`).
+    One pair is generated every `interval` seconds at most, only while the
+    generation engine reports no outstanding live work, and at most
+    `budget_per_hour` generations are spent per rolling hour.
+    """
+
+    def __init__(self, load_materials: Callable[[int, int], tuple[list[str], list[tuple[str, int]]]],
+                 filter_uncached: Callable[[list[tuple[str, str]]], list[tuple[str, str]]],
+                 generate: Callable[[str, str], Optional[dict]], is_idle: Callable[[], bool],
+                 budget_per_hour: int = 0, interval: float = 2.0, recent: int = 50, popular: int = 50,
+                 recent_weight: float = 1.0, popular_weight: float = 1.0, refill_size: int = 200):
+        self.load_materials = load_materials
+        self.filter_uncached = filter_uncached
+        self.generate = generate
+        self.is_idle = is_idle
+        self.budget_per_hour = budget_per_hour
+        self.interval = interval
+        self.recent = recent
+        self.popular = popular
+        self.recent_weight = recent_weight
+        self.popular_weight = popular_weight
+        self.refill_size = refill_size
+        self._queue: deque[tuple[str, str]] = deque()
+        self._spent: deque[float] = deque()  # monotonic times of generations in the last hour
+        self._stop = threading.Event()
+        self._thread = None
+        self._lock = threading.Lock()
+        self.generated = 0
+        self.failed = 0
+        self.skipped_busy = 0
+        self.refills = 0
+
+    @property
+    def enabled(self) -> bool:
+        return self.budget_per_hour > 0
+
+    def start(self):
+        with self._lock:
+            if not self.enabled or self._thread is not None:
+                return
+            self._thread = threading.Thread(target=self._run, name='precompute', daemon=True)
+            self._thread.start()
+
+    def stop(self, timeout: float = 5.0):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(timeout)
+
+    def rank_candidates(self) -> list[tuple[str, str]]:
+        """Uncached candidate pairs, most likely first"""
+        recent, popular = self.load_materials(self.recent, self.popular)
+        weights: dict[str, float] = {}
+        for rank, name in enumerate(recent):
+            weights[name] = weights.get(name, 0.0) + self.recent_weight * (1 - rank / len(recent))
+        top_count = max((count for _, count in popular), default=0)
+        for name, count in popular:
+            weights[name] = weights.get(name, 0.0) + self.popular_weight * count / top_count
+
+        names = sorted(weights)
+        scored = [
+            (weights[first] * weights[second], (first, second))
+            for i, first in enumerate(names) for second in names[i:]
+        ]
+        scored.sort(key=lambda item: item[0], reverse=True)
+        # Over-fetch, since some of the best pairs are likely already known
+        best = [pair for _, pair in scored[:self.refill_size * 4]]
+        return self.filter_uncached(best)[:self.refill_size]
+
+    def _budget_left(self) -> int:
+        # Caller holds self._lock
+        cutoff = time.monotonic() - 3600
+        while self._spent and self._spent[0] < cutoff:
+            self._spent.popleft()
+        return self.budget_per_hour - len(self._spent)
+
+    def run_once(self) -> bool:
+        """Generate the next queued pair if the LLM is idle and budget remains; returns True if one was generated"""
+        with self._lock:
+            if self._budget_left() <= 0:
+                return False
+        if not self.is_idle():
+            with self._lock:
+                self.skipped_busy += 1
+            return False
+        if not self._queue:
+            self._queue.extend(self.rank_candidates())
+            with self._lock:
+                self.refills += 1
+            if not self._queue:
+                return False
+
+        first_word, second_word = self._queue.popleft()
+        # A live craft may have produced this recipe since the queue was filled
+        if not self.filter_uncached([(first_word, second_word)]):
+            return False
+        with self._lock:
+            self._spent.append(time.monotonic())
+        try:
+            result = self.generate(first_word, second_word)
+        except Exception as e:
+            log.warning("Precompute failed for %s + %s: %s", first_word, second_word, e)
+            result = None
+        with self._lock:
+            if result:
+                self.generated += 1
+            else:
+                self.failed += 1
+        return bool(result)
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            try:
+                self.run_once()
+            except Exception as e:
+                log.error("Precompute scheduler error: %s", e)
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                'enabled': self.enabled,
+                'budget_per_hour': self.budget_per_hour,
+                'budget_left': self._budget_left() if self.enabled else 0,
+                'queued': len(self._queue),
+                'generated': self.generated,
+                'failed': self.failed,
+                'skipped_busy': self.skipped_busy,
+                'refills': self.refills,
+            }
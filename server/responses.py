@@ -0,0 +1,105 @@
+"""
+Response encoding for the read endpoints: JSON serialization, compression
+and conditional requests.
+
+orjson and brotli are optional. Without orjson responses are serialized by
+Flask's default provider; without brotli, clients that accept it get gzip.
+
+Configured with COMPRESS_MIN_SIZE (bytes, default 1024), GZIP_LEVEL
+(default 6) and BROTLI_QUALITY (default 5).
+"""
+import gzip
+import os
+import zlib
+
+from flask import Response, current_app, request
+from flask.json.provider import DefaultJSONProvider
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+COMPRESS_MIN_SIZE = int(os.environ.get('COMPRESS_MIN_SIZE', 1024))
+GZIP_LEVEL = int(os.environ.get('GZIP_LEVEL', 6))
+BROTLI_QUALITY = int(os.environ.get('BROTLI_QUALITY', 5))
+COMPRESSIBLE_MIMETYPES = {'application/json', 'application/x-ndjson', 'text/plain', 'text/html'}
+
+
+class OrjsonProvider(DefaultJSONProvider):
+    """Flask JSON provider that serializes with orjson, falling back to the default encoder for unknown types"""
+
+    options = (orjson.OPT_NON_STR_KEYS | orjson.OPT_SERIALIZE_NUMPY) if orjson else 0
+
+    def dumps(self, obj, **kwargs) -> str:
+        if kwargs:
+            # Callers asking for json.dumps options (indent, sort_keys, ...) get the standard encoder
+            return super().dumps(obj, **kwargs)
+        return orjson.dumps(obj, default=self.default, option=self.options).decode()
+
+    def response(self, *args, **kwargs) -> Response:
+        obj = self._prepare_response_obj(args, kwargs)
+        return self._app.response_class(
+            orjson.dumps(obj, default=self.default, option=self.options), mimetype=self.mimetype
+        )
+
+
+def install_json_provider(app):
+    """Serialize jsonify() responses with orjson when it is installed"""
+    if orjson is not None:
+        app.json = OrjsonProvider(app)
+
+
+def compress_response(response: Response) -> Response:
+    """
+    after_request hook: brotli- or gzip-encode sizeable text responses for
+    clients that accept it. Streamed responses are left alone.
+    """
+    if (response.direct_passthrough or response.is_streamed
+            or response.status_code < 200 or response.status_code in (204, 304)
+            or 'Content-Encoding' in response.headers
+            or response.mimetype not in COMPRESSIBLE_MIMETYPES):
+        return response
+    response.vary.add('Accept-Encoding')
+    data = response.get_data()
+    if len(data) < COMPRESS_MIN_SIZE:
+        return response
+
+    accepted = request.accept_encodings
+    if brotli is not None and accepted['br']:
+        data, encoding = brotli.compress(data, quality=BROTLI_QUALITY), 'br'
+    elif accepted['gzip']:
+        data, encoding = gzip.compress(data, compresslevel=GZIP_LEVEL, mtime=0), 'gzip'
+    else:
+        return response
+    response.set_data(data)
+    response.headers['Content-Encoding'] = encoding
+    return response
+
+
+def version_etag(*versions) -> str:
+    """
+    ETag for the current request given the change counters its response depends on.
+    The query string is folded in, so ?since=, ?format= and ?username= variants differ.
+    """
+    query = zlib.crc32(request.query_string)
+    return '.'.join(str(version) for version in versions) + f'-{query:08x}'
+
+
+def not_modified(etag: str) -> Response | None:
+    """A 304 response if the client's If-None-Match already holds `etag`, else None"""
+    if not request.if_none_match.contains_weak(etag):
+        return None
+    return with_etag(current_app.response_class(status=304), etag)
+
+
+def with_etag(response: Response, etag: str) -> Response:
+    """Tag a response (weakly, since the bytes vary with Content-Encoding) and ask clients to revalidate"""
+    response.set_etag(etag, weak=True)
+    response.headers['Cache-Control'] = 'no-cache'
+    return response
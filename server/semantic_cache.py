@@ -0,0 +1,222 @@
+import threading
+from typing import Callable, Iterable, Optional
+
+import numpy as np
+
+from embedding_index import EmbeddingMatrix
+from llm_service import consistent_order
+from logger import get_logger
+
+log = get_logger('semantic')
+
+MODES = ('off', 'reuse', 'hint')
+
+
+class SemanticCache:
+    """
+    Near-duplicate recipe lookup for pairs that miss the exact recipe cache.
+
+    Every recipe's pair vector (the normalized sum of its two input
+    embeddings) is kept in the recipe_pair_embeddings vec0 index, keyed by
+    recipes.id. A lookup takes the `neighbours` nearest pair vectors, then
+    requires each input to match its counterpart on its own: the lower of the
+    two per-side cosine similarities (in whichever pairing of the inputs is
+    better) must reach `threshold`. So "Pond + Fire" can match "Lake + Fire",
+    but not "Lake + Ice" however close the pair vectors are.
+
+    `mode` is what the caller does with a match: 'reuse' serves its result
+    without calling the LLM, 'hint' passes it to the LLM as a strong
+    suggestion, 'off' disables lookups. Recipes stored by reuse are not
+    indexed themselves, so matches can't drift through chains of reuses.
+    """
+
+    def __init__(self, get_db: Callable, get_matrix: Callable[[tuple], EmbeddingMatrix],
+                 embed_many: Callable[[list[str]], list], mode: str = 'off', threshold: float = 0.92,
+                 neighbours: int = 8, catch_up_rows: int = 500):
+        if mode not in MODES:
+            raise ValueError(f'Semantic cache mode must be one of {", ".join(MODES)}, not {mode!r}')
+        self.get_db = get_db
+        self.get_matrix = get_matrix
+        self.embed_many = embed_many
+        self.mode = mode
+        self.threshold = threshold
+        self.neighbours = neighbours
+        self.catch_up_rows = catch_up_rows
+        self._indexed_id = None  # highest recipes.id read into the index
+        self._index_lock = threading.Lock()
+        self._lock = threading.Lock()
+        self.lookups = 0
+        self.matches = 0
+        self.reused = 0
+        self.hinted = 0
+        self.hints_followed = 0
+        self.indexed = 0
+        self.errors = 0
+
+    @property
+    def enabled(self) -> bool:
+        return self.mode != 'off'
+
+    def index_pending(self, limit: Optional[int] = None, batch_size: int = 2000, wait: bool = True) -> int:
+        """
+        Index recipes added since the last call (at most `limit` of them); returns how many were read.
+        With wait=False, returns 0 straight away if another thread is already indexing.
+        """
+        from sqlite_vec import serialize_float32
+        if not self._index_lock.acquire(blocking=wait):
+            return 0
+        try:
+            if self._indexed_id is None:
+                with self.get_db() as conn:
+                    self._indexed_id = conn.execute('SELECT MAX(rowid) FROM recipe_pair_embeddings').fetchone()[0] or 0
+            total = 0
+            while limit is None or total < limit:
+                size = batch_size if limit is None else min(batch_size, limit - total)
+                with self.get_db() as conn:
+                    rows = conn.execute(
+                        'SELECT id, firstWord, secondWord, source FROM recipes WHERE id > ? ORDER BY id LIMIT ?',
+                        (self._indexed_id, size)
+                    ).fetchall()
+                if not rows:
+                    break
+                rows_to_index = [row for row in rows if row['source'] != 'semantic']
+                # Encode before taking the write lock
+                vectors = self._pair_vectors([(row['firstWord'], row['secondWord']) for row in rows_to_index])
+                ids = [row['id'] for row in rows_to_index]
+                if ids:
+                    with self.get_db() as conn:
+                        # vec0 has no upsert; another process may have indexed some of these already
+                        conn.execute(
+                            f'DELETE FROM recipe_pair_embeddings WHERE rowid IN ({",".join("?" * len(ids))})', ids
+                        )
+                        conn.executemany(
+                            'INSERT INTO recipe_pair_embeddings (rowid, embedding) VALUES (?, ?)',
+                            [(recipe_id, serialize_float32(vector)) for recipe_id, vector in zip(ids, vectors)]
+                        )
+                self._indexed_id = rows[-1]['id']
+                total += len(rows)
+                with self._lock:
+                    self.indexed += len(rows_to_index)
+            return total
+        finally:
+            self._index_lock.release()
+
+    def _pair_vectors(self, pairs: list[tuple[str, str]]) -> list[np.ndarray]:
+        if not pairs:
+            return []
+        names = [name for pair in pairs for name in pair]
+        vectors = self.get_matrix(()).unit_vectors(names, self.embed_many)
+        pair_vectors = np.stack(vectors[0::2]) + np.stack(vectors[1::2])
+        norms = np.linalg.norm(pair_vectors, axis=1, keepdims=True)
+        norms[norms == 0] = 1.0
+        return list(pair_vectors / norms)
+
+    def best_match(self, first_word: str, second_word: str) -> Optional[dict]:
+        """
+        The indexed recipe (other than this exact pair) whose inputs best match
+        the pair's, whatever its similarity: {'first', 'second', 'result', 'emoji', 'similarity'}
+        """
+        from sqlite_vec import serialize_float32
+        words = consistent_order(first_word, second_word)
+        first_vector, second_vector = self.get_matrix(()).unit_vectors(list(words), self.embed_many)
+        query = first_vector + second_vector
+        query /= np.linalg.norm(query) or 1.0
+        with self.get_db() as conn:
+            rows = conn.execute(
+                '''
+                WITH knn AS (
+                    SELECT rowid, distance FROM recipe_pair_embeddings
+                    WHERE embedding MATCH ? AND k = ?
+                )
+                SELECT r.firstWord, r.secondWord, r.resultName, r.resultEmoji
+                FROM knn JOIN recipes r ON r.id = knn.rowid
+                ORDER BY knn.distance
+                ''',
+                (serialize_float32(query), self.neighbours + 1)
+            ).fetchall()
+        candidates = [row for row in rows if (row['firstWord'], row['secondWord']) != words]
+        if not candidates:
+            return None
+
+        names = [name for row in candidates for name in (row['firstWord'], row['secondWord'])]
+        vectors = self.get_matrix(()).unit_vectors(names, self.embed_many)
+        best = None
+        for row, candidate_first, candidate_second in zip(candidates, vectors[0::2], vectors[1::2]):
+            straight = min(float(first_vector @ candidate_first), float(second_vector @ candidate_second))
+            crossed = min(float(first_vector @ candidate_second), float(second_vector @ candidate_first))
+            similarity = max(straight, crossed)
+            if best is None or similarity > best['similarity']:
+                best = {'first': row['firstWord'], 'second': row['secondWord'], 'result': row['resultName'],
+                        'emoji': row['resultEmoji'], 'similarity': similarity}
+        return best
+
+    def lookup(self, first_word: str, second_word: str) -> Optional[dict]:
+        """best_match() if it reaches the threshold, else None. Failures are logged and treated as a miss."""
+        with self._lock:
+            self.lookups += 1
+        try:
+            # Requests don't wait behind the warmup backfill; it moves the cursor for them
+            self.index_pending(limit=self.catch_up_rows, wait=False)
+            match = self.best_match(first_word, second_word)
+        except Exception as e:
+            log.warning("Semantic lookup failed for %s + %s: %s", first_word, second_word, e)
+            with self._lock:
+                self.errors += 1
+            return None
+        if match is None or match['similarity'] < self.threshold:
+            return None
+        with self._lock:
+            self.matches += 1
+        log.debug("Semantic match for %s + %s: %s + %s -> %s (%.3f)", first_word, second_word,
+                  match['first'], match['second'], match['result'], match['similarity'])
+        return match
+
+    def record_reuse(self):
+        with self._lock:
+            self.reused += 1
+
+    def record_hint(self, hint_result: str, result: Optional[str]):
+        """Count a hinted generation, and whether the LLM answered with the hinted result"""
+        with self._lock:
+            self.hinted += 1
+            if result == hint_result:
+                self.hints_followed += 1
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                'mode': self.mode,
+                'threshold': self.threshold,
+                'lookups': self.lookups,
+                'matches': self.matches,
+                'match_rate': self.matches / self.lookups if self.lookups else 0.0,
+                'reused': self.reused,
+                'llm_calls_saved': self.reused,
+                'hinted': self.hinted,
+                'hints_followed': self.hints_followed,
+                'indexed': self.indexed,
+                'errors': self.errors,
+            }
+
+
+def tune(cache: SemanticCache, samples: list[tuple[str, str, str]], thresholds: Iterable[float]) -> list[dict]:
+    """
+    Replay (first, second, known result) samples as if each were an exact-cache
+    miss. For each threshold, report how many would have matched (coverage) and
+    how many of those matches have the same result the LLM actually gave (precision).
+    """
+    scored = []
+    for first_word, second_word, result in samples:
+        match = cache.best_match(first_word, second_word)
+        if match is not None:
+            scored.append((match['similarity'], match['result'] == result))
+    rows = []
+    for threshold in thresholds:
+        matched = [same for similarity, same in scored if similarity >= threshold]
+        rows.append({
+            'threshold': threshold,
+            'matched': len(matched),
+            'coverage': len(matched) / len(samples) if samples else 0.0,
+            'precision': sum(matched) / len(matched) if matched else 0.0,
+        })
+    return rows
@@ -0,0 +1,95 @@
+import threading
+import time
+from typing import Callable
+
+from logger import get_logger
+
+log = get_logger('warmup')
+
+
+class Warmup:
+    """
+    Startup tasks (loading models, importing SDKs, filling caches) run in
+    order on a background thread, so the process can answer requests while
+    it warms up.
+
+    The process is *live* as soon as it serves requests and *ready* once
+    every task has succeeded. A failed task leaves it not ready; it is
+    reported in stats() with its error rather than retried.
+    """
+
+    def __init__(self):
+        self._tasks: list[tuple[str, Callable[[], object]]] = []
+        self._status: dict[str, dict] = {}
+        self._lock = threading.Lock()
+        self._thread = None
+        self._done = threading.Event()
+        self.started_at = None
+        self.finished_at = None
+
+    def add(self, name: str, task: Callable[[], object]):
+        with self._lock:
+            self._tasks.append((name, task))
+            self._status[name] = {'state': 'pending'}
+
+    def start(self):
+        """Run the tasks on a background thread (once)"""
+        with self._lock:
+            if self._thread is not None:
+                return
+            self.started_at = time.monotonic()
+            self._thread = threading.Thread(target=self._run, name='warmup', daemon=True)
+            self._thread.start()
+
+    def run(self):
+        """Run the tasks on the calling thread (once), e.g. before forking workers"""
+        with self._lock:
+            if self._thread is not None:
+                return
+            self.started_at = time.monotonic()
+            self._thread = threading.current_thread()
+        self._run()
+
+    def _run(self):
+        for name, task in list(self._tasks):
+            with self._lock:
+                self._status[name] = {'state': 'running'}
+            start = time.perf_counter()
+            try:
+                task()
+            except Exception as e:
+                status = {'state': 'failed', 'error': str(e)}
+                log.error("Warmup task %s failed: %s", name, e)
+            else:
+                status = {'state': 'ready'}
+            status['seconds'] = time.perf_counter() - start
+            with self._lock:
+                self._status[name] = status
+            log.info("Warmup task %s %s in %.2fs", name, status['state'], status['seconds'])
+        self.finished_at = time.monotonic()
+        self._done.set()
+
+    @property
+    def ready(self) -> bool:
+        with self._lock:
+            return self._done.is_set() and all(s['state'] == 'ready' for s in self._status.values())
+
+    def wait(self, timeout: float | None = None) -> bool:
+        """Block until warmup finishes; returns whether the process is ready"""
+        self._done.wait(timeout)
+        return self.ready
+
+    def stats(self) -> dict:
+        with self._lock:
+            tasks = {name: dict(status) for name, status in self._status.items()}
+            started = self.started_at is not None
+        elapsed = None
+        if started:
+            elapsed = (self.finished_at or time.monotonic()) - self.started_at
+        return {
+            'ready': self.ready,
+            'started': started,
+            'finished': self._done.is_set(),
+            'elapsed_seconds': elapsed,
+            'tasks': tasks,
+        }
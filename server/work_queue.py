@@ -0,0 +1,156 @@
+import queue
+import threading
+import time
+from typing import Any, Callable, Optional
+
+from logger import get_logger
+
+log = get_logger('queue')
+
+_STOP = object()
+
+
+class WriteBehindQueue:
+    """
+    Bounded queue drained by a small pool of worker threads in batches.
+
+    Workers hand `handler` a list of up to `batch_size` items, flushing early
+    once `flush_interval` seconds have passed since the first item of the batch
+    arrived. `submit` applies backpressure for up to `put_timeout` seconds when
+    the queue is full and then drops the item, counting it in `dropped`.
+    If a batch fails, its items are retried one at a time so a single bad item
+    doesn't take the rest of the batch down with it.
+    """
+
+    def __init__(self, handler: Callable[[list], Any], maxsize: int = 1000, workers: int = 2,
+                 batch_size: int = 50, flush_interval: float = 0.05, put_timeout: float = 0.1,
+                 name: str = 'write-behind'):
+        self.handler = handler
+        self.maxsize = maxsize
+        self.workers = workers
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.put_timeout = put_timeout
+        self.name = name
+
+        self._queue = queue.Queue(maxsize=maxsize)
+        self._threads: list[threading.Thread] = []
+        self._lock = threading.Lock()
+        self._stopping = False
+        self.enqueued = 0
+        self.dropped = 0
+        self.processed = 0
+        self.failed = 0
+        self.batches = 0
+        self.flush_seconds_total = 0.0
+        self.flush_seconds_max = 0.0
+        self.last_flush_seconds = 0.0
+
+    def start(self):
+        with self._lock:
+            if self._threads or self._stopping:
+                return
+            for i in range(self.workers):
+                thread = threading.Thread(target=self._run, name=f'{self.name}-{i}', daemon=True)
+                thread.start()
+                self._threads.append(thread)
+
+    def submit(self, item) -> bool:
+        """Queue an item for the workers. Returns False if it was dropped."""
+        if self._stopping:
+            with self._lock:
+                self.dropped += 1
+            return False
+        if not self._threads:
+            self.start()
+        try:
+            if self.put_timeout > 0:
+                self._queue.put(item, timeout=self.put_timeout)
+            else:
+                self._queue.put_nowait(item)
+        except queue.Full:
+            with self._lock:
+                self.dropped += 1
+            return False
+        with self._lock:
+            self.enqueued += 1
+        return True
+
+    def _next_batch(self) -> tuple[list, bool]:
+        item = self._queue.get()
+        if item is _STOP:
+            return [], True
+        batch = [item]
+        deadline = time.monotonic() + self.flush_interval
+        while len(batch) < self.batch_size:
+            remaining = deadline - time.monotonic()
+            try:
+                item = self._queue.get(timeout=remaining) if remaining > 0 else self._queue.get_nowait()
+            except queue.Empty:
+                break
+            if item is _STOP:
+                return batch, True
+            batch.append(item)
+        return batch, False
+
+    def _run(self):
+        while True:
+            batch, stop = self._next_batch()
+            if batch:
+                self._flush(batch)
+            if stop:
+                return
+
+    def _flush(self, batch: list):
+        start = time.perf_counter()
+        failed = 0
+        try:
+            self.handler(batch)
+        except Exception as e:
+            log.warning("Error flushing %s batch of %d, retrying items one by one: %s", self.name, len(batch), e)
+            for item in batch:
+                try:
+                    self.handler([item])
+                except Exception as item_error:
+                    failed += 1
+                    log.error("Error in %s item: %s", self.name, item_error)
+        elapsed = time.perf_counter() - start
+        with self._lock:
+            self.batches += 1
+            self.processed += len(batch) - failed
+            self.failed += failed
+            self.last_flush_seconds = elapsed
+            self.flush_seconds_total += elapsed
+            self.flush_seconds_max = max(self.flush_seconds_max, elapsed)
+
+    def shutdown(self, timeout: Optional[float] = 10.0):
+        """Stop accepting items and wait for the workers to drain what is queued."""
+        with self._lock:
+            if self._stopping:
+                return
+            self._stopping = True
+            threads = list(self._threads)
+        for _ in threads:
+            self._queue.put(_STOP)
+        deadline = None if timeout is None else time.monotonic() + timeout
+        for thread in threads:
+            thread.join(None if deadline is None else max(0.0, deadline - time.monotonic()))
+        if any(thread.is_alive() for thread in threads):
+            log.warning("%s: shutdown timed out with %d items still queued", self.name, self._queue.qsize())
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                'depth': self._queue.qsize(),
+                'maxsize': self.maxsize,
+                'workers': len(self._threads),
+                'enqueued': self.enqueued,
+                'processed': self.processed,
+                'dropped': self.dropped,
+                'failed': self.failed,
+                'batches': self.batches,
+                'avg_batch_size': (self.processed + self.failed) / self.batches if self.batches else 0.0,
+                'last_flush_seconds': self.last_flush_seconds,
+                'avg_flush_seconds': self.flush_seconds_total / self.batches if self.batches else 0.0,
+                'max_flush_seconds': self.flush_seconds_max,
+            }